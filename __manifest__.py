@@ -13,7 +13,9 @@
     'depends': ['mail', 'web'],
     'data': [
         'security/ir.model.access.csv',
+        'security/whatsapp_security.xml',
         'views/whatsapp_views.xml',
+        'data/whatsapp_data.xml',
     ],
     'qweb': [
         'static/src/xml/whatsapp_chat.xml',
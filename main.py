@@ -2,108 +2,114 @@
 # File: whatsapp_integration/controllers/main.py
 
 from odoo import http, _
+from odoo.exceptions import UserError
 from odoo.http import request
+from odoo.tools import lru
+from odoo.tools.image import image_process
+from werkzeug.wsgi import wrap_file
+from odoo.addons.bus.controllers.main import BusController
 import logging
 import json
 import base64
+import hashlib
+import hmac
+import io
+import re
 import tempfile
 import os
 import time
 from datetime import datetime
 
+from ..models.whatsapp_metrics import collect, instrumented, registry as metrics, render
+
 _logger = logging.getLogger(__name__)
 
-try:
-    # This would be a placeholder - in a real implementation,
-    # you would handle interaction with whatsapp-web.js through a server-side Node.js service
-    # For demonstration purposes, we'll simulate the API
-    class WhatsAppWebJSMock:
-        def __init__(self):
-            self.clients = {}
-            
-        def create_client(self, session_id):
-            """Create a new WhatsApp client"""
-            self.clients[session_id] = {
-                'state': 'connecting',
-                'qr_code': None,
-                'connected_at': None
-            }
-            return session_id
-            
-        def get_qr_code(self, session_id):
-            """Generate and get QR code for session"""
-            # In a real implementation, this would get the QR code from whatsapp-web.js
-            # For demonstration, we'll simulate it
-            if session_id in self.clients:
-                # Create a placeholder QR code (this would be a real QR code in production)
-                return "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
-            return None
-            
-        def check_status(self, session_id):
-            """Check connection status"""
-            if session_id not in self.clients:
-                return {'state': 'disconnected'}
-            return self.clients[session_id]
-
-    # Create a mock instance
-    whatsapp_client = WhatsAppWebJSMock()
-    
-except ImportError as e:
-    _logger.warning("WhatsApp Web.js integration is not available: %s", e)
-    whatsapp_client = None
+# Decoded QR code PNGs by content hash
+_qr_image_cache = lru.LRU(64)
+
+# Uploads are streamed to disk in chunks of this size
+MEDIA_CHUNK_SIZE = 64 * 1024
+MEDIA_THUMBNAIL_SIZE = (256, 256)
+MEDIA_THUMBNAIL_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp')
+# Served inline; anything else (HTML, SVG, ...) is only offered as a download
+MEDIA_INLINE_TYPES = re.compile(r'^(image/(png|jpeg|gif|webp)|audio/.*|video/.*)$')
+
+
+class WhatsAppBusController(BusController):
+
+    def _poll(self, dbname, channels, last, options):
+        """Subscribe users to the channels of the WhatsApp sessions they own"""
+        if request.session.uid:
+            channels = list(channels)
+            sessions = request.env['whatsapp.session'].search([('user_id', '=', request.env.uid)])
+            channels.extend(session._bus_channel() for session in sessions)
+        return super(WhatsAppBusController, self)._poll(dbname, channels, last, options)
+
 
 class WhatsAppController(http.Controller):
     
     @http.route('/whatsapp/qr_code/<int:session_id>', type='http', auth='user')
-    def get_qr_code(self, session_id, **kwargs):
-        """Get QR code for WhatsApp session"""
-        session = request.env['whatsapp.session'].sudo().browse(session_id)
-        if not session.exists():
+    @instrumented('route', '/whatsapp/qr_code')
+    def get_qr_code(self, session_id, v=None, **kwargs):
+        """Get QR code for WhatsApp session
+
+        Images are versioned by content hash: the hash is the ETag, decoded
+        PNGs are kept in a small in-process cache and the session is only
+        written when the QR code actually rotates.
+        """
+        # Record rules limit the lookup to the user's own sessions
+        session = request.env['whatsapp.session'].search([('id', '=', session_id)]).sudo()
+        if not session:
             return request.not_found()
-            
-        if not whatsapp_client:
+
+        # The bridge pushes every rotation; only ask it when nothing was pushed yet
+        if not session.qr_code_hash:
+            session._pull_qr_code()
+
+        version = session.qr_code_hash
+        if not version:
             return request.not_found()
-            
-        # Get QR code from WhatsApp Web.js client
-        qr_code_data = whatsapp_client.get_qr_code(session.session_id or str(session_id))
-        if qr_code_data:
-            # Update session with QR code
-            session.write({
-                'qr_code': qr_code_data,
-                'qr_code_data': f"data:image/png;base64,{qr_code_data}",
-                'session_id': session.session_id or str(session_id)
-            })
-            
-            # Return QR code image
-            return request.make_response(
-                base64.b64decode(qr_code_data),
-                [('Content-Type', 'image/png')]
-            )
-        
-        return request.not_found()
+
+        etag = f'"{version}"'
+        headers = [
+            ('ETag', etag),
+            # A URL carrying the current version never changes; anything else revalidates
+            ('Cache-Control', 'private, max-age=3600, immutable' if v == version else 'private, no-cache'),
+        ]
+        if request.httprequest.if_none_match.contains(version):
+            return request.make_response(b'', headers, status=304)
+
+        image = _qr_image_cache.get(version)
+        if image is None:
+            image = _qr_image_cache[version] = base64.b64decode(session.qr_code)
+
+        return request.make_response(image, headers + [('Content-Type', 'image/png')])
         
     @http.route('/whatsapp/status/<int:session_id>', type='http', auth='user')
+    @instrumented('route', '/whatsapp/status')
     def check_status(self, session_id, **kwargs):
         """Check WhatsApp connection status"""
-        session = request.env['whatsapp.session'].sudo().browse(session_id)
-        if not session.exists():
+        session = request.env['whatsapp.session'].search([('id', '=', session_id)]).sudo()
+        if not session:
             return json.dumps({'error': 'Session not found'})
             
-        if not whatsapp_client:
-            return json.dumps({'error': 'WhatsApp client not available'})
-            
-        # Check status from WhatsApp Web.js client
-        status = whatsapp_client.check_status(session.session_id or str(session_id))
-        
-        # Update session status
-        if status and 'state' in status:
-            session.write({'state': status['state']})
-            if status['state'] == 'connected' and status.get('connected_at'):
-                session.write({'last_connected': datetime.fromtimestamp(status['connected_at'])})
+        # Check status from the WhatsApp bridge
+        status = session._pull_status()
+        if 'error' in status:
+            return json.dumps(status)
+
+        # Update session status, writing only on a real transition
+        if status.get('state') in ('disconnected', 'connecting', 'connected'):
+            connected_at = status.get('connected_at')
+            session._set_connection_state(
+                status['state'],
+                connected_at=connected_at and datetime.utcfromtimestamp(connected_at),
+            )
                 
         return json.dumps(status)
         
     @http.route('/whatsapp/send', type='json', auth='user')
+    @instrumented('route', '/whatsapp/send')
     def send_message(self, **kwargs):
         """Send WhatsApp message"""
         session_id = kwargs.get('session_id')
@@ -113,94 +119,284 @@ class WhatsAppController(http.Controller):
         if not all([session_id, chat_id, message]):
             return {'error': 'Missing parameters'}
             
-        session = request.env['whatsapp.session'].sudo().browse(int(session_id))
-        if not session.exists():
+        session = request.env['whatsapp.session'].search([('id', '=', int(session_id))])
+        if not session:
             return {'error': 'Session not found'}
             
         if session.state != 'connected':
             return {'error': 'WhatsApp not connected'}
-            
-        # Create message in database
-        message_id = request.env['whatsapp.message'].sudo().create({
-            'session_id': session.id,
-            'chat_id': chat_id,
-            'content': message,
-            'direction': 'outgoing',
-            'state': 'pending'
-        })
-        
-        # In a real implementation, this would send the message through whatsapp-web.js
-        # For demonstration, we'll simulate a successful send
-        message_id.write({'state': 'sent'})
-        
+
+        # Queued in the outbox; the dispatcher sends it to the bridge
+        result = session.send_message(chat_id, message)
+
         return {
             'success': True,
-            'message_id': message_id.id
+            'message_id': result['message']['id']
         }
         
+    @http.route('/whatsapp/search', type='json', auth='user')
+    @instrumented('route', '/whatsapp/search')
+    def search_messages(self, session_id, query, **kwargs):
+        """Ranked full-text or substring search over a session's messages"""
+        session = request.env['whatsapp.session'].browse(int(session_id))
+        if not session.exists():
+            return {'error': 'Session not found'}
+
+        options = {key: kwargs[key] for key in ('chat_id', 'date_from', 'date_to', 'mode', 'cursor') if kwargs.get(key)}
+        limit = min(int(kwargs.get('limit') or 20), 100)
+        return session.search_messages(query, limit=limit, **options)
+
+    @http.route('/whatsapp/broadcast', type='json', auth='user')
+    @instrumented('route', '/whatsapp/broadcast')
+    def broadcast(self, session_id, template, **kwargs):
+        """Start a broadcast to a recipient list or to the records of a model"""
+        session = request.env['whatsapp.session'].browse(int(session_id))
+        if not session.exists():
+            return {'error': 'Session not found'}
+
+        options = {key: kwargs[key] for key in ('recipients', 'model', 'domain', 'phone_field', 'name') if kwargs.get(key)}
+        broadcast_id = request.env['whatsapp.broadcast'].send_broadcast(session.id, template, **options)
+        return {'success': True, 'broadcast_id': broadcast_id}
+
+    @http.route('/whatsapp/broadcast/<int:broadcast_id>/progress', type='json', auth='user')
+    @instrumented('route', '/whatsapp/broadcast/progress')
+    def broadcast_progress(self, broadcast_id, **kwargs):
+        broadcast = request.env['whatsapp.broadcast'].browse(broadcast_id)
+        if not broadcast.exists():
+            return {'error': 'Broadcast not found'}
+        return broadcast.get_progress()
+
     @http.route('/whatsapp/hook', type='json', auth='public', csrf=False)
+    @instrumented('route', '/whatsapp/hook')
     def whatsapp_webhook(self, **kwargs):
-        """Webhook for WhatsApp events (incoming messages, status updates)"""
-        # This would be used by a Node.js service to send events to Odoo
-        event_type = kwargs.get('type')
-        session_id = kwargs.get('session_id')
-        
-        if not event_type or not session_id:
+        """Webhook for batches of WhatsApp events (incoming messages, status updates)
+
+        The bridge posts ``{"session_id": ..., "events": [...]}`` signed with
+        the session's webhook secret in the ``X-WhatsApp-Signature`` header
+        (``sha256=<hex HMAC of the raw body>``). A bare event is accepted as
+        a batch of one.
+        """
+        session_key = kwargs.get('session_id')
+        events = kwargs.get('events')
+        if events is None and kwargs.get('type'):
+            events = [kwargs]
+
+        if not session_key or not isinstance(events, list):
             return {'error': 'Missing parameters'}
-            
-        session = request.env['whatsapp.session'].sudo().search([('session_id', '=', session_id)], limit=1)
+        metrics.observe('whatsapp_webhook_batch_size', len(events))
+
+        session = request.env['whatsapp.session'].sudo().search([('session_id', '=', session_key)], limit=1)
+        if not session or not self._check_signature(session):
+            return {'error': 'Invalid signature'}
+
+        # Only store the raw events here; the inbox cron applies them in bulk
+        return {'results': request.env['whatsapp.inbox'].sudo()._enqueue_events(session, events)}
+
+    def _check_signature(self, session):
+        """Validate the HMAC the bridge computed over the raw request body"""
+        if not session.webhook_secret:
+            return False
+        signature = request.httprequest.headers.get('X-WhatsApp-Signature', '')
+        expected = 'sha256=' + hmac.new(
+            session.webhook_secret.encode(),
+            request.httprequest.get_data(),
+            hashlib.sha256,
+        ).hexdigest()
+        return hmac.compare_digest(signature, expected)
+
+    @http.route('/whatsapp/media/upload/<string:checksum>', type='http', auth='public',
+                methods=['GET', 'POST'], csrf=False)
+    @instrumented('route', '/whatsapp/media/upload')
+    def media_upload(self, checksum, mimetype=None, filename=None, **kwargs):
+        """Streaming media upload from the bridge
+
+        Files are addressed by their SHA-1 ``checksum``. The bridge signs
+        ``<session key>:<checksum>`` with the session's webhook secret and
+        sends the session key in ``X-WhatsApp-Session``. ``GET`` tells whether
+        the session already stores that content, ``POST`` streams the raw
+        file in the body. The body is written to disk chunk by chunk and
+        checked against the checksum, so memory use does not depend on the
+        file size.
+        """
+        checksum = checksum.lower()
+        if not re.fullmatch(r'[0-9a-f]{40}', checksum):
+            return self._json_response({'error': 'Invalid checksum'}, 400)
+        session = self._media_session(checksum)
         if not session:
-            return {'error': 'Session not found'}
-            
-        if event_type == 'message':
-            # Handle incoming message
-            message_data = kwargs.get('message', {})
-            if message_data and 'chat_id' in message_data and 'content' in message_data:
-                message = request.env['whatsapp.message'].sudo().create({
-                    'session_id': session.id,
-                    'chat_id': message_data['chat_id'],
-                    'message_id': message_data.get('id'),
-                    'content': message_data['content'],
-                    'direction': 'incoming',
-                    'state': 'delivered'
-         })
-                
-                # Notify Odoo clients about new message
-                request.env['bus.bus'].sendone(
-                    'whatsapp_channel',
-                    {
-                        'type': 'new_message',
-                        'message': {
-                            'id': message.id,
-                            'chat_id': message_data['chat_id'],
-                            'content': message_data['content'],
-                            'date': message.date.strftime('%Y-%m-%d %H:%M:%S')
-                        }
-                    }
-                )
-                
-                return {'success': True}
-                
-        elif event_type == 'status_update':
-            # Handle message status updates (sent, delivered, read)
-            status_data = kwargs.get('status', {})
-            if status_data and 'message_id' in status_data and 'status' in status_data:
-                message = request.env['whatsapp.message'].sudo().search([
-                    ('message_id', '=', status_data['message_id']),
-                    ('session_id', '=', session.id)
-                ], limit=1)
-                
-                if message:
-                    message.write({'state': status_data['status']})
-                    return {'success': True}
-                    
-        elif event_type == 'connection_update':
-            # Handle connection status updates
-            status = kwargs.get('status')
-            if status:
-                session.write({'state': status})
-                if status == 'connected':
-                    session.write({'last_connected': fields.Datetime.now()})
-                return {'success': True}
-                
-        return {'error': 'Unknown event type or invalid data'}       
\ No newline at end of file
+            return self._json_response({'error': 'Invalid signature'}, 403)
+
+        existing = session._find_media([(session, checksum)]).get((session.id, checksum))
+        if existing or request.httprequest.method == 'GET':
+            if not existing:
+                return self._json_response({'error': 'Not found'}, 404)
+            return self._json_response({'attachment_id': existing, 'duplicate': True})
+
+        max_size = int(request.env['ir.config_parameter'].sudo().get_param(
+            'whatsapp.media_max_size', 100 * 1024 * 1024))
+        digest = hashlib.sha1()
+        size = 0
+        spool = session._media_spool()
+        try:
+            with spool:
+                stream = request.httprequest.stream
+                for chunk in iter(lambda: stream.read(MEDIA_CHUNK_SIZE), b''):
+                    size += len(chunk)
+                    if size > max_size:
+                        return self._json_response({'error': 'File too large'}, 413)
+                    digest.update(chunk)
+                    spool.write(chunk)
+            if digest.hexdigest() != checksum:
+                return self._json_response({'error': 'Checksum mismatch'}, 400)
+            attachment = session._store_media(spool.name, checksum, mimetype, filename)
+        finally:
+            if os.path.exists(spool.name):
+                os.unlink(spool.name)
+        return self._json_response({'attachment_id': attachment.id, 'duplicate': False})
+
+    def _media_session(self, checksum):
+        """Session whose webhook secret signed this media request, if any"""
+        session_key = request.httprequest.headers.get('X-WhatsApp-Session')
+        if not session_key:
+            return None
+        session = request.env['whatsapp.session'].sudo().search([('session_id', '=', session_key)], limit=1)
+        if not session.webhook_secret:
+            return None
+        expected = 'sha256=' + hmac.new(
+            session.webhook_secret.encode(),
+            f'{session_key}:{checksum}'.encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        signature = request.httprequest.headers.get('X-WhatsApp-Signature', '')
+        return session if hmac.compare_digest(signature, expected) else None
+
+    def _json_response(self, payload, status=200):
+        return request.make_response(json.dumps(payload), [('Content-Type', 'application/json')], status=status)
+
+    @http.route('/whatsapp/media/<int:message_id>', type='http', auth='user')
+    @instrumented('route', '/whatsapp/media')
+    def media(self, message_id, download=False, **kwargs):
+        """Serve the media of a message, with range requests
+
+        Media is content-addressed, so responses are cached for good and
+        revalidated by their checksum.
+        """
+        attachment = self._message_attachment(message_id)
+        if not attachment:
+            return request.not_found()
+        return self._stream_attachment(attachment, download=download)
+
+    @http.route('/whatsapp/media/<int:message_id>/thumbnail', type='http', auth='user')
+    @instrumented('route', '/whatsapp/media/thumbnail')
+    def media_thumbnail(self, message_id, **kwargs):
+        """Serve a small preview of an image, generated on first request"""
+        attachment = self._message_attachment(message_id)
+        if not attachment or attachment.mimetype not in MEDIA_THUMBNAIL_TYPES:
+            return request.not_found()
+
+        Attachment = request.env['ir.attachment'].sudo()
+        thumbnail = Attachment.search([
+            ('res_model', '=', 'ir.attachment'),
+            ('res_id', '=', attachment.id),
+            ('name', '=', 'whatsapp_thumbnail'),
+        ], limit=1)
+        if not thumbnail:
+            try:
+                datas = image_process(attachment.datas, size=MEDIA_THUMBNAIL_SIZE, verify_resolution=True)
+            except (UserError, ValueError, OSError) as e:
+                _logger.info("Could not make a thumbnail of attachment %s: %s", attachment.id, e)
+                return request.not_found()
+            thumbnail = Attachment.create({
+                'name': 'whatsapp_thumbnail',
+                'datas': datas,
+                'mimetype': attachment.mimetype,
+                'res_model': 'ir.attachment',
+                'res_id': attachment.id,
+            })
+        return self._stream_attachment(thumbnail)
+
+    def _message_attachment(self, message_id):
+        """Media of a message the current user can read, archived or not"""
+        # Searches apply the record rules: other users' messages are not found
+        message = request.env['whatsapp.message'].search([('id', '=', message_id)])
+        if not message:
+            message = request.env['whatsapp.message.archive'].search([('message_ref', '=', message_id)], limit=1)
+        return message.attachment_id.sudo()
+
+    def _stream_attachment(self, attachment, download=False):
+        if attachment.store_fname:
+            path = attachment._full_path(attachment.store_fname)
+            size = os.path.getsize(path)
+            data = open(path, 'rb')
+        else:
+            raw = attachment.raw or b''
+            size = len(raw)
+            data = io.BytesIO(raw)
+
+        mimetype = attachment.mimetype or 'application/octet-stream'
+        inline = not download and MEDIA_INLINE_TYPES.match(mimetype)
+        response = http.Response(
+            wrap_file(request.httprequest.environ, data),
+            mimetype=mimetype if inline else 'application/octet-stream',
+            direct_passthrough=True,
+        )
+        response.headers['Content-Disposition'] = http.content_disposition(
+            attachment.name) if not inline else 'inline'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        response.set_etag(attachment.checksum)
+        return response.make_conditional(request.httprequest, accept_ranges=True, complete_length=size)
+
+    @http.route('/whatsapp/metrics', type='http', auth='public', csrf=False)
+    def metrics(self, **kwargs):
+        """Prometheus text exposition of the integration's metrics
+
+        Scrapers authenticate with ``Authorization: Bearer <token>``, the
+        token being the ``whatsapp.metrics_token`` system parameter; logged-in
+        administrators can open it directly.
+        """
+        token = request.env['ir.config_parameter'].sudo().get_param('whatsapp.metrics_token')
+        authorization = request.httprequest.headers.get('Authorization', '')
+        if not (
+            (token and hmac.compare_digest(authorization, f'Bearer {token}'))
+            or request.env.user.has_group('base.group_system')
+        ):
+            return request.make_response('Unauthorized', [('Content-Type', 'text/plain')], status=401)
+
+        return request.make_response(
+            render(collect(), self._metrics_gauges()),
+            [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')],
+        )
+
+    def _metrics_gauges(self):
+        """Queue depths and session states, read from the database at scrape time"""
+        cr = request.env.cr
+        # Broadcast messages scheduled for later are not late yet
+        cr.execute("""
+            SELECT count(*),
+                   GREATEST(extract(epoch FROM now() at time zone 'UTC'
+                                               - min(coalesce(next_attempt_date, create_date))), 0)
+              FROM whatsapp_message
+             WHERE direction = 'outgoing' AND state = 'pending'
+        """)
+        outbox_depth, outbox_age = cr.fetchone()
+        cr.execute("SELECT count(*) FROM whatsapp_inbox WHERE state = 'pending'")
+        inbox_depth = cr.fetchone()[0]
+        cr.execute("SELECT state, count(*) FROM whatsapp_session GROUP BY state")
+        sessions = cr.fetchall()
+        cr.execute("""
+            SELECT n.name, count(s.id)
+              FROM whatsapp_bridge_node n
+         LEFT JOIN whatsapp_session s ON s.bridge_node_id = n.id
+          GROUP BY n.id, n.name
+        """)
+        nodes = cr.fetchall()
+        return [
+            ('whatsapp_outbox_depth', 'Outgoing messages waiting for the dispatcher', [({}, outbox_depth)]),
+            ('whatsapp_outbox_oldest_seconds', 'Age of the oldest message waiting in the outbox',
+             [({}, float(outbox_age or 0))]),
+            ('whatsapp_inbox_depth', 'Webhook events waiting to be applied', [({}, inbox_depth)]),
+            ('whatsapp_sessions', 'WhatsApp sessions by connection state',
+             [({'state': state or 'unknown'}, count) for state, count in sessions]),
+            ('whatsapp_bridge_node_sessions', 'WhatsApp sessions placed on each bridge node',
+             [({'node': name}, count) for name, count in nodes]),
+        ]
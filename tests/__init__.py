@@ -0,0 +1,21 @@
+from . import test_analytics
+from . import test_archive
+from . import test_bridge_client
+from . import test_bridge_node
+from . import test_broadcast
+from . import test_chat_history
+from . import test_chat_summary
+from . import test_contact
+from . import test_history_sync
+from . import test_inbox
+from . import test_media
+from . import test_message_indexes
+from . import test_metrics
+from . import test_notifications
+from . import test_outbox
+from . import test_qr_code
+from . import test_read_receipts
+from . import test_search
+from . import test_supervisor
+from . import test_sync_chats
+from . import test_webhook
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+from odoo.tools import mute_logger
+
+from ..models.whatsapp_analytics import _HISTORY_ROLLUP
+from ..models.whatsapp_bridge_client import BridgeClient, BridgeError
+
+COUNTS = ["hour", "chat_id", "incoming_count", "outgoing_count",
+          "response_count", "response_time_total", "response_time_max"]
+
+
+class TestAnalytics(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Analytics Test", "session_id": "analytics-test", "state": "connected"}
+        )
+        self.start = datetime(2024, 1, 1, 9, 0)
+
+    def _message(self, minutes, direction="incoming", state="delivered", **vals):
+        return self.env["whatsapp.message"].create(dict(
+            vals,
+            session_id=self.session.id,
+            chat_id="a@c.us",
+            content="m%s" % minutes,
+            date=self.start + timedelta(minutes=minutes),
+            direction=direction,
+            state=state,
+        ))
+
+    def _reply(self, minutes, **vals):
+        return self._message(minutes, direction="outgoing", state="pending", **vals)
+
+    def _dispatch(self, fail=()):
+        def send(client, session_key, chat_id, message):
+            if message in fail:
+                raise BridgeError("bridge said no")
+            return "wa-%s" % message
+
+        with patch.object(BridgeClient, "send", autospec=True, side_effect=send), \
+                mute_logger("odoo.addons.whatsapp_integration.models.whatsapp_message"):
+            self.env["whatsapp.message"]._cron_dispatch_outbox(max_attempts=1)
+
+    def _rollup(self):
+        rows = self.env["whatsapp.analytics"].search_read(
+            [("session_id", "=", self.session.id)], COUNTS, order="hour, chat_id"
+        )
+        return [{name: row[name] for name in COUNTS} for row in rows]
+
+    def _awaiting_since(self):
+        return self.env["whatsapp.chat"].search(
+            [("session_id", "=", self.session.id), ("chat_id", "=", "a@c.us")]
+        ).awaiting_since
+
+    def _rebuild(self):
+        # rebuild() recomputes in transactions of its own, which can't see
+        # the test's: run its query in the test transaction
+        self.env["base"].flush()
+        self.env.cr.execute(
+            "DELETE FROM whatsapp_analytics WHERE session_id = %s", (self.session.id,)
+        )
+        self.env.cr.execute(_HISTORY_ROLLUP, {
+            "session": self.session.id, "user": self.session.user_id.id or None, "parts": 1, "part": 0,
+        })
+        self.env["whatsapp.analytics"].invalidate_cache()
+        self.env["whatsapp.chat"].invalidate_cache(["awaiting_since"])
+
+    def test_reply_counts_once_sent(self):
+        self._message(0)
+        self._message(2)
+        reply = self._reply(5)
+        rollup = self._rollup()
+        self.assertEqual((rollup[0]["incoming_count"], rollup[0]["outgoing_count"]), (2, 0))
+        self.assertEqual(self._awaiting_since(), self.start, "A queued reply is no response yet")
+
+        self._dispatch()
+        self.assertEqual(reply.state, "sent")
+        rollup = self._rollup()
+        self.assertEqual(len(rollup), 1)
+        self.assertEqual(
+            (rollup[0]["outgoing_count"], rollup[0]["response_count"], rollup[0]["response_time_total"]),
+            (1, 1, 300.0),
+        )
+        self.assertFalse(self._awaiting_since())
+
+    def test_failed_send_is_not_a_response(self):
+        self._message(0)
+        failed = self._reply(5)
+        self._dispatch(fail=("m5",))
+        self.assertEqual(failed.state, "failed")
+        rollup = self._rollup()
+        self.assertEqual((rollup[0]["outgoing_count"], rollup[0]["response_count"]), (0, 0))
+        self.assertEqual(self._awaiting_since(), self.start)
+
+    def test_broadcast_is_not_a_response(self):
+        self._message(0)
+        self._reply(5, broadcast=True)
+        self._dispatch()
+        rollup = self._rollup()
+        self.assertEqual((rollup[0]["outgoing_count"], rollup[0]["response_count"]), (1, 0))
+        self.assertEqual(self._awaiting_since(), self.start)
+
+        self._reply(10)
+        self._dispatch()
+        rollup = self._rollup()
+        self.assertEqual((rollup[0]["response_count"], rollup[0]["response_time_max"]), (1, 600.0))
+
+    def test_rebuild_matches_incremental(self):
+        self._message(0)
+        self._reply(5, broadcast=True)
+        self._reply(10)
+        self._reply(15)
+        self._dispatch(fail=("m15",))
+        self._message(62)
+        self._message(70)
+        self._reply(75)
+        incremental, awaiting = self._rollup(), self._awaiting_since()
+        self.assertEqual([row["response_count"] for row in incremental], [1, 0])
+        self.assertEqual(awaiting, self.start + timedelta(minutes=62))
+
+        self._rebuild()
+        self.assertEqual(self._rollup(), incremental)
+        self.assertEqual(self._awaiting_since(), awaiting)
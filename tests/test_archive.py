@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+
+class TestArchive(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Archive Test", "session_id": "archive-test", "state": "connected", "retention_days": 30}
+        )
+        self.Message = self.env["whatsapp.message"]
+        self.Archive = self.env["whatsapp.message.archive"]
+        old = fields.Datetime.now() - timedelta(days=60)
+        self.read = self._message("old read", old, state="read")
+        self.sent = self._message("old reply", old + timedelta(minutes=1), direction="outgoing", state="sent")
+        self.unread = self._message("old unread", old + timedelta(minutes=2), state="delivered")
+        self.pending = self._message("old pending", old + timedelta(minutes=3), direction="outgoing", state="pending")
+        self.recent = self._message("recent", fields.Datetime.now() - timedelta(days=1), state="read")
+
+    def _message(self, content, date, direction="incoming", state="read"):
+        return self.Message.create({
+            "session_id": self.session.id,
+            "chat_id": "a@c.us",
+            "content": content,
+            "date": date,
+            "direction": direction,
+            "state": state,
+        })
+
+    def _archived(self):
+        return self.Archive.search([("session_id", "=", self.session.id)])
+
+    def test_archive_keeps_unread_and_pending(self):
+        read_id, sent_id, sent_date = self.read.id, self.sent.id, self.sent.date
+        self.Archive._cron_archive_messages()
+
+        archived = self._archived()
+        self.assertEqual(sorted(archived.mapped("message_ref")), [read_id, sent_id])
+        self.assertEqual(sorted(archived.mapped("content")), ["old read", "old reply"])
+        hot = self.Message.search([("session_id", "=", self.session.id)])
+        self.assertEqual(hot, self.unread | self.pending | self.recent)
+        self.assertEqual(self.session.archived_until, sent_date)
+
+    def test_small_chunks(self):
+        cutoff = fields.Datetime.now() - timedelta(days=30)
+        self.assertEqual(self.Archive._archive_chunk(self.session, cutoff, 1), 1)
+        self.assertEqual(self.Archive._archive_chunk(self.session, cutoff, 1), 1)
+        self.assertEqual(self.Archive._archive_chunk(self.session, cutoff, 1), 0)
+        self.assertEqual(len(self._archived()), 2)
+
+    def test_history_reads_through_archive(self):
+        expected = ["recent", "old pending", "old unread", "old reply", "old read"]
+        self.Archive._cron_archive_messages()
+        page = self.session.get_chat_history("a@c.us", limit=10)
+        self.assertEqual([message["content"] for message in page["messages"]], expected)
+
+        # Paging keeps working across the hot and archived ranges
+        contents, cursor = [], None
+        while True:
+            page = self.session.get_chat_history("a@c.us", cursor=cursor, limit=2)
+            contents += [message["content"] for message in page["messages"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(contents, expected)
+
+    def test_unread_count_is_kept(self):
+        chat = self.env["whatsapp.chat"].search([("session_id", "=", self.session.id), ("chat_id", "=", "a@c.us")])
+        unread = chat.unread_count
+        self.Archive._cron_archive_messages()
+        chat.invalidate_cache()
+        self.assertEqual(chat.unread_count, unread)
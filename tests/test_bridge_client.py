@@ -0,0 +1,83 @@
+from unittest.mock import Mock, patch
+
+import requests
+
+from odoo.tests.common import BaseCase
+
+from ..models.whatsapp_bridge_client import BridgeClient, BridgeError, BridgeUnavailable, CircuitBreaker
+
+
+def _response(status=200, payload=None):
+    response = Mock(status_code=status, reason="Reason", content=b"")
+    response.json.return_value = payload if payload is not None else {}
+    return response
+
+
+class TestCircuitBreaker(BaseCase):
+
+    def test_opens_after_threshold(self):
+        circuit = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        for _attempt in range(2):
+            circuit.record_failure()
+        self.assertTrue(circuit.allow())
+        circuit.record_failure()
+        self.assertTrue(circuit.is_open)
+        self.assertFalse(circuit.allow())
+
+    def test_half_open_probe(self):
+        circuit = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        with patch("time.monotonic", return_value=100.0):
+            circuit.record_failure()
+        with patch("time.monotonic", return_value=131.0):
+            self.assertTrue(circuit.allow(), "One probe goes through after the timeout")
+            self.assertFalse(circuit.allow(), "Other calls wait for the probe")
+        circuit.record_success()
+        self.assertFalse(circuit.is_open)
+        self.assertTrue(circuit.allow())
+
+
+class TestBridgeClient(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = BridgeClient("http://bridge.test/", retries=2)
+        patcher = patch.object(BridgeClient, "_sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _serve(self, *responses):
+        request = patch.object(self.client._http, "request", side_effect=list(responses))
+        mock = request.start()
+        self.addCleanup(request.stop)
+        return mock
+
+    def test_idempotent_call_is_retried(self):
+        request = self._serve(requests.ConnectionError("reset"), _response(503), _response(payload={"state": "ok"}))
+        self.assertEqual(self.client.status("s1"), {"state": "ok"})
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(request.call_args[0][1], "http://bridge.test/status/s1")
+
+    def test_send_is_not_retried(self):
+        request = self._serve(_response(503), _response(payload={"message_id": "wa-1"}))
+        with self.assertRaises(BridgeError) as caught:
+            self.client.send("s1", "a@c.us", "Hello")
+        self.assertEqual(caught.exception.status, 503)
+        self.assertEqual(request.call_count, 1)
+
+    def test_client_error_is_not_retried(self):
+        request = self._serve(_response(404, {"error": "Session not found"}))
+        with self.assertRaises(BridgeError) as caught:
+            self.client.status("s1")
+        self.assertIn("Session not found", str(caught.exception))
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(self.client.circuit.failures, 0)
+
+    def test_open_circuit_fails_fast(self):
+        self.client.circuit = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        request = self._serve(*[requests.Timeout("slow")] * 3)
+        with self.assertRaises(BridgeError):
+            self.client.status("s1")
+        self.assertEqual(request.call_count, 2)
+        with self.assertRaises(BridgeUnavailable):
+            self.client.status("s1")
+        self.assertEqual(request.call_count, 2)
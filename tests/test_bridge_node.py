@@ -0,0 +1,67 @@
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+from ..models.whatsapp_bridge_client import BridgeClient
+
+KEYS = ["session_%s" % index for index in range(2000)]
+
+
+class TestBridgeNode(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Node = self.env["whatsapp.bridge.node"]
+        self.Node.search([]).write({"state": "down"})
+        self.a = self.Node.create({"name": "A", "url": "http://bridge-a.test:3000"})
+        self.b = self.Node.create({"name": "B", "url": "http://bridge-b.test:3000"})
+
+    def _placement(self):
+        return {key: self.Node._owner(key) for key in KEYS}
+
+    def _share(self, placement, node):
+        return sum(1 for owner in placement.values() if owner == node) / len(placement)
+
+    def test_owner_is_stable(self):
+        placement = self._placement()
+        self.assertEqual(placement, self._placement())
+        self.assertEqual(set(placement.values()), {self.a, self.b})
+
+    def test_weights(self):
+        self.b.weight = 3
+        self.assertAlmostEqual(self._share(self._placement(), self.b), 0.75, delta=0.07)
+
+    def test_new_node_only_takes_its_share(self):
+        before = self._placement()
+        c = self.Node.create({"name": "C", "url": "http://bridge-c.test:3000"})
+        after = self._placement()
+        moved = [key for key in KEYS if after[key] != before[key]]
+        self.assertEqual({after[key] for key in moved}, {c})
+        self.assertAlmostEqual(len(moved) / len(KEYS), 1 / 3, delta=0.07)
+
+    def test_drain(self):
+        before = self._placement()
+        self.a.action_drain()
+        after = self._placement()
+        self.assertEqual(set(after.values()), {self.b})
+        for key, owner in before.items():
+            if owner == self.b:
+                self.assertEqual(after[key], self.b)
+
+    def test_no_active_node(self):
+        (self.a | self.b).write({"state": "down"})
+        self.assertFalse(self.Node._owner("session_1"))
+
+    def test_rebalance_moves_sessions(self):
+        sessions = self.env["whatsapp.session"].create([
+            {"name": key, "session_id": key, "state": "connected", "bridge_node_id": self.a.id}
+            for key in KEYS[:10]
+        ])
+        self.a.action_drain()
+        with patch.object(BridgeClient, "stop", autospec=True) as stop, \
+                patch.object(BridgeClient, "start", autospec=True) as start:
+            self.Node._cron_rebalance(limit=100)
+        self.assertEqual(sessions.mapped("bridge_node_id"), self.b)
+        self.assertEqual(set(sessions.mapped("state")), {"connecting"})
+        self.assertEqual(stop.call_count, 10)
+        self.assertEqual({call[0][0].base_url for call in start.call_args_list}, {self.b.url})
@@ -0,0 +1,56 @@
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+
+class TestBroadcast(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Broadcast Test", "session_id": "broadcast-test", "state": "connected"}
+        )
+        self.Broadcast = self.env["whatsapp.broadcast"]
+
+    def _broadcast(self, template, names):
+        broadcast_id = self.Broadcast.send_broadcast(
+            self.session.id, template,
+            recipients=[{"chat_id": "%s@c.us" % name.lower(), "name": name} for name in names],
+        )
+        return self.Broadcast.browse(broadcast_id)
+
+    def _states(self, broadcast):
+        return {recipient.name: recipient.state for recipient in broadcast.recipient_ids}
+
+    def test_messages_are_queued_in_the_broadcast_lane(self):
+        broadcast = self._broadcast("Hello ${object.name}", ["Ann", "Bob"])
+        broadcast._process_batch(100)
+        self.assertEqual(self._states(broadcast), {"Ann": "queued", "Bob": "queued"})
+        messages = broadcast.recipient_ids.mapped("message_id")
+        self.assertEqual(sorted(messages.mapped("content")), ["Hello Ann", "Hello Bob"])
+        self.assertEqual(set(messages.mapped("broadcast")), {True})
+
+    def test_template_error_fails_the_recipient_only(self):
+        broadcast = self._broadcast("${object.name[4]}", ["Annabelle", "Bo"])
+        broadcast._process_batch(100)
+        self.assertEqual(self._states(broadcast), {"Annabelle": "queued", "Bo": "failed"})
+        self.assertTrue(broadcast.recipient_ids.filtered(lambda recipient: recipient.name == "Bo").error)
+
+    def test_programming_error_is_raised(self):
+        broadcast = self._broadcast("Hello", ["Ann"])
+        Render = type(self.env["mail.render.mixin"])
+        with patch.object(Render, "_render_template", side_effect=TypeError("bug")), \
+                self.assertRaises(TypeError):
+            broadcast._process_batch(100)
+
+    def test_cancel(self):
+        broadcast = self._broadcast("Hello", ["Ann", "Bob", "Cy"])
+        broadcast._process_batch(2)
+        queued = broadcast.recipient_ids.mapped("message_id")
+        broadcast.action_cancel()
+        self.assertEqual(broadcast.state, "cancelled")
+        self.assertEqual(sorted(self._states(broadcast).values()), ["cancelled", "queued", "queued"])
+        self.assertEqual(set(queued.mapped("state")), {"failed"})
+
+    def test_cancel_nothing(self):
+        self.Broadcast.action_cancel()
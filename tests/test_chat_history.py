@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from odoo.exceptions import UserError
+from odoo.tests.common import TransactionCase
+
+
+class TestChatHistory(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "History Test", "session_id": "history-test", "state": "connected"}
+        )
+        start = datetime(2024, 1, 1, 9, 0)
+        # Three messages share a date: the cursor must still order them by id
+        dates = [start, start + timedelta(minutes=1)] + [start + timedelta(minutes=2)] * 3 \
+            + [start + timedelta(minutes=3), start + timedelta(minutes=4)]
+        self.messages = self.env["whatsapp.message"].create([
+            {
+                "session_id": self.session.id,
+                "chat_id": "a@c.us",
+                "content": "m%s" % (index + 1),
+                "date": date,
+                "direction": "incoming",
+                "state": "read" if index < 5 else "delivered",
+            }
+            for index, date in enumerate(dates)
+        ])
+
+    def _contents(self, page):
+        return [message["content"] for message in page["messages"]]
+
+    def test_walk_back(self):
+        pages, cursor = [], None
+        while True:
+            page = self.session.get_chat_history("a@c.us", cursor=cursor, limit=3)
+            pages.append(self._contents(page))
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(pages, [["m7", "m6", "m5"], ["m4", "m3", "m2"], ["m1"]])
+
+    def test_walk_forward(self):
+        first = self.session.get_chat_history("a@c.us", limit=3)
+        second = self.session.get_chat_history("a@c.us", cursor=first["next_cursor"], limit=3)
+        self.assertTrue(second["prev_cursor"])
+        newer = self.session.get_chat_history("a@c.us", cursor=second["prev_cursor"], limit=3, direction="newer")
+        self.assertEqual(self._contents(newer), ["m7", "m6", "m5"])
+        self.assertFalse(newer["prev_cursor"])
+
+    def test_unread_cursor(self):
+        cursor = self.session.get_unread_cursor("a@c.us")
+        page = self.session.get_chat_history("a@c.us", cursor=cursor, limit=10, direction="newer")
+        self.assertEqual(self._contents(page), ["m7", "m6"])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(UserError):
+            self.session.get_chat_history("a@c.us", cursor="garbage")
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+from odoo.tests.common import TransactionCase
+
+
+class TestChatSummary(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Summary Test", "session_id": "summary-test", "state": "connected"}
+        )
+        self.start = datetime(2024, 1, 1, 9, 0)
+
+    def _message(self, content, minutes, direction="incoming", state="delivered", **vals):
+        return self.env["whatsapp.message"].create(dict(
+            vals,
+            session_id=self.session.id,
+            chat_id="a@c.us",
+            content=content,
+            date=self.start + timedelta(minutes=minutes),
+            direction=direction,
+            state=state,
+        ))
+
+    def _chat(self):
+        return self.env["whatsapp.chat"].search(
+            [("session_id", "=", self.session.id), ("chat_id", "=", "a@c.us")]
+        )
+
+    def test_new_messages(self):
+        self._message("first", 1)
+        self._message("second", 2)
+        self._message("reply", 3, direction="outgoing", state="sent")
+        chat = self._chat()
+        self.assertEqual(chat.last_message, "reply")
+        self.assertEqual(chat.last_message_date, self.start + timedelta(minutes=3))
+        self.assertEqual(chat.unread_count, 2)
+
+    def test_late_message_keeps_latest(self):
+        self._message("latest", 5)
+        self._message("synced late", 1)
+        chat = self._chat()
+        self.assertEqual(chat.last_message, "latest")
+        self.assertEqual(chat.unread_count, 2)
+
+    def test_media_preview(self):
+        self._message(False, 1, message_type="image")
+        self.assertEqual(self._chat().last_message, "[image]")
+
+    def test_read_and_unlink(self):
+        first = self._message("first", 1)
+        second = self._message("second", 2)
+        self._message("third", 3)
+        first.write({"state": "read"})
+        self.assertEqual(self._chat().unread_count, 2)
+        second.unlink()
+        self.assertEqual(self._chat().unread_count, 1)
+
+    def test_rebuild_matches_incremental(self):
+        self._message("first", 1)
+        self._message("read", 2, state="read")
+        self._message("reply", 3, direction="outgoing", state="sent")
+        incremental = self._chat().read(["last_message", "last_message_date", "unread_count"])[0]
+        self.env["whatsapp.chat"]._rebuild()
+        rebuilt = self._chat().read(["last_message", "last_message_date", "unread_count"])[0]
+        self.assertEqual(rebuilt, incremental)
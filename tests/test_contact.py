@@ -0,0 +1,50 @@
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+from ..models import whatsapp_contact
+
+
+class TestContact(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Contact Test", "session_id": "contact-test", "state": "connected"}
+        )
+        self.Contact = self.env["whatsapp.contact"]
+
+    def _resolve(self, *chat_ids):
+        return self.Contact._resolve_names(self.session.id, list(chat_ids))
+
+    def _write_elsewhere(self, chat_id, name):
+        # What another worker's upsert leaves in the table
+        self.env.cr.execute(
+            """
+            INSERT INTO whatsapp_contact (session_id, chat_id, name, create_date, write_date)
+            VALUES (%s, %s, %s, now() at time zone 'UTC', now() at time zone 'UTC')
+            ON CONFLICT (session_id, chat_id) DO UPDATE SET name = EXCLUDED.name, write_date = EXCLUDED.write_date
+            """,
+            (self.session.id, chat_id, name),
+        )
+
+    def test_resolve_and_cache(self):
+        self.Contact._upsert_names({(self.session.id, "a@c.us"): "Ann"})
+        with patch.object(whatsapp_contact, "CACHE_CHECK_INTERVAL", 3600):
+            self.assertEqual(self._resolve("a@c.us", "b@c.us"), {"a@c.us": "Ann", "b@c.us": None})
+            with self.assertQueryCount(0):
+                self.assertEqual(self._resolve("a@c.us", "b@c.us"), {"a@c.us": "Ann", "b@c.us": None})
+
+    def test_own_upsert_invalidates(self):
+        self.Contact._upsert_names({(self.session.id, "a@c.us"): "Ann"})
+        self._resolve("a@c.us")
+        self.Contact._upsert_names({(self.session.id, "a@c.us"): "Annie"})
+        self.assertEqual(self._resolve("a@c.us"), {"a@c.us": "Annie"})
+
+    def test_other_process_changes_are_picked_up(self):
+        self.Contact._upsert_names({(self.session.id, "a@c.us"): "Ann"})
+        with patch.object(whatsapp_contact, "CACHE_CHECK_INTERVAL", 0):
+            self.assertEqual(self._resolve("a@c.us", "b@c.us"), {"a@c.us": "Ann", "b@c.us": None})
+            self._write_elsewhere("a@c.us", "Annie")
+            self._write_elsewhere("b@c.us", "Bob")
+            self.assertEqual(self._resolve("a@c.us", "b@c.us"), {"a@c.us": "Annie", "b@c.us": "Bob"})
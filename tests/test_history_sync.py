@@ -0,0 +1,117 @@
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase, TransactionCase
+
+from ..models.whatsapp_bridge_client import BridgeError
+from ..models.whatsapp_session import _fetch_missed
+
+START = 1700000000
+
+
+def _history(chat_id, count):
+    return [
+        {"id": "%s-%s" % (chat_id, index), "timestamp": START + index, "content": "m%s" % index}
+        for index in range(count)
+    ]
+
+
+class FakeClient:
+    """Bridge /chats and /messages over in-memory histories"""
+
+    def __init__(self, histories, failing=(), truncated=()):
+        self.histories = histories
+        self.failing = failing
+        self.truncated = truncated
+        self.calls = []
+
+    def chats(self, session_key):
+        return [
+            {"id": chat_id, "name": chat_id, "timestamp": messages[-1]["timestamp"] if messages else START}
+            for chat_id, messages in self.histories.items()
+        ]
+
+    def messages(self, session_key, chat_id, after=0, limit=50, after_id=None):
+        self.calls.append((chat_id, after, after_id))
+        if chat_id in self.failing:
+            raise BridgeError("chat is gone", 500)
+        messages = [message for message in self.histories[chat_id] if message["timestamp"] >= after]
+        if after_id:
+            ids = [message["id"] for message in messages]
+            messages = messages[ids.index(after_id) + 1:]
+        return {
+            "messages": messages[:limit],
+            "has_more": len(messages) > limit,
+            "truncated": chat_id in self.truncated,
+        }
+
+
+class TestFetchMissed(BaseCase):
+
+    def test_pages_forward_from_last_id(self):
+        client = FakeClient({"a@c.us": _history("a", 5)})
+        chat_id, messages, high_water, truncated = _fetch_missed(client, "s", "a@c.us", START, 2, 10)
+        self.assertEqual([message["id"] for message in messages], ["a-%s" % index for index in range(5)])
+        self.assertEqual(high_water, START + 4)
+        self.assertFalse(truncated)
+        self.assertEqual([call[2] for call in client.calls], [None, "a-1", "a-3"])
+
+    def test_out_of_pages_resumes_from_last_received(self):
+        client = FakeClient({"a@c.us": _history("a", 5)})
+        _chat_id, messages, high_water, _truncated = _fetch_missed(client, "s", "a@c.us", START, 2, 1)
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(high_water, START + 1)
+
+    def test_truncated_keeps_the_mark(self):
+        client = FakeClient({"a@c.us": _history("a", 3)}, truncated=("a@c.us",))
+        _chat_id, messages, high_water, truncated = _fetch_missed(client, "s", "a@c.us", START - 100, 10, 10)
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(high_water, START - 100)
+        self.assertTrue(truncated)
+
+
+class TestSyncHistory(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Sync Test", "session_id": "sync-test", "state": "connected"}
+        )
+
+    def _sync(self, client):
+        with patch.object(type(self.session), "_bridge", return_value=client):
+            return self.session._sync_history(page_size=2)
+
+    def _chat(self, chat_id):
+        return self.env["whatsapp.chat"].search([("session_id", "=", self.session.id), ("chat_id", "=", chat_id)])
+
+    def test_failing_chat_does_not_stop_the_others(self):
+        client = FakeClient({"a@c.us": _history("a", 3), "b@c.us": _history("b", 2)}, failing=("a@c.us",))
+        self.assertEqual(self._sync(client), 2)
+        self.assertEqual(self._chat("b@c.us").sync_timestamp, START + 1)
+        self.assertFalse(self._chat("a@c.us").sync_timestamp)
+
+        client.failing = ()
+        self.assertEqual(self._sync(client), 3)
+        self.assertEqual(self._chat("a@c.us").sync_timestamp, START + 2)
+
+    def test_synced_chats_are_skipped(self):
+        client = FakeClient({"a@c.us": _history("a", 3)})
+        self._sync(client)
+        client.calls = []
+        self.assertEqual(self._sync(client), 0)
+        self.assertFalse(client.calls)
+
+    def test_mark_without_messages(self):
+        # Nothing stored for the chat, so no summary row exists yet
+        client = FakeClient({"a@c.us": _history("a", 3)})
+        self.session._set_sync_timestamp("a@c.us", START + 7)
+        self.assertEqual(self._chat("a@c.us").sync_timestamp, START + 7)
+        self.session._set_sync_timestamp("a@c.us", START)
+        self.assertEqual(self._chat("a@c.us").sync_timestamp, START + 7, "The mark never goes back")
+        self.assertEqual(self._sync(client), 0)
+
+    def test_truncated_chat_is_stored_but_not_marked(self):
+        client = FakeClient({"a@c.us": _history("a", 3)}, truncated=("a@c.us",))
+        self.assertEqual(self._sync(client), 3)
+        self.assertFalse(self._chat("a@c.us").sync_timestamp)
+        self.assertEqual(self._sync(client), 0, "Refetched messages are not stored twice")
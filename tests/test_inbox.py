@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+from odoo.tools import mute_logger
+
+
+def _message(message_id, content="Hello", chat_id="a@c.us", **data):
+    return {"type": "message", "message": dict(data, id=message_id, chat_id=chat_id, content=content)}
+
+
+class TestInbox(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Inbox Test", "session_id": "inbox-test", "state": "connected"}
+        )
+        self.Inbox = self.env["whatsapp.inbox"]
+        self.Message = self.env["whatsapp.message"]
+
+    def _deliver(self, events):
+        results = self.Inbox._enqueue_events(self.session, events)
+        self.Inbox._cron_process_inbox()
+        return results
+
+    def _messages(self, message_id):
+        return self.Message.search([("session_id", "=", self.session.id), ("message_id", "=", message_id)])
+
+    def test_batch_is_applied(self):
+        results = self._deliver([_message("m1"), _message("m2", chat_id="b@c.us"), {"content": "no type"}])
+        self.assertTrue(results[0]["queued"])
+        self.assertEqual(results[2], {"error": "Missing parameters"})
+        entries = self.Inbox.search([("session_id", "=", self.session.id)])
+        self.assertEqual(set(entries.mapped("state")), {"done"})
+        self.assertEqual(len(self._messages("m1") | self._messages("m2")), 2)
+
+    def test_redelivery_is_stored_once(self):
+        self._deliver([_message("m1"), _message("m1")])
+        self._deliver([_message("m1")])
+        self.assertEqual(len(self._messages("m1")), 1)
+
+    def test_invalid_event_is_reported(self):
+        self._deliver([_message("m1"), {"type": "message", "message": {"id": "m2"}}])
+        entries = self.Inbox.search([("session_id", "=", self.session.id)], order="id")
+        self.assertEqual(entries.mapped("state"), ["done", "error"])
+        self.assertEqual(entries[1].error, "Invalid message data")
+
+    def test_failing_entry_does_not_hold_back_the_batch(self):
+        Session = type(self.env["whatsapp.session"])
+        apply_events = Session._apply_webhook_events
+
+        def apply(session, session_events):
+            if any(event.get("message", {}).get("content") == "boom" for _session, event in session_events):
+                raise ValueError("boom")
+            return apply_events(session, session_events)
+
+        with patch.object(Session, "_apply_webhook_events", apply), \
+                mute_logger("odoo.addons.whatsapp_integration.models.whatsapp_inbox"):
+            self._deliver([_message("m1"), _message("m2", "boom"), _message("m3")])
+        entries = self.Inbox.search([("session_id", "=", self.session.id)], order="id")
+        self.assertEqual(entries.mapped("state"), ["done", "error", "done"])
+        self.assertEqual(len(self._messages("m1") | self._messages("m3")), 2)
+
+    def test_message_date_from_bridge(self):
+        sent_at = datetime(2024, 3, 1, 12, 30)
+        self._deliver([_message("m1", timestamp=int((sent_at - datetime(1970, 1, 1)).total_seconds()))])
+        self.assertEqual(self._messages("m1").date, sent_at)
+
+    def test_archived_message_is_not_redelivered(self):
+        self._deliver([_message("m1")])
+        message = self._messages("m1")
+        message.write({"state": "read", "date": fields.Datetime.now() - timedelta(days=30)})
+        self.env["whatsapp.message.archive"]._archive_chunk(
+            self.session, fields.Datetime.now() - timedelta(days=1), 100
+        )
+        self.assertFalse(self._messages("m1"))
+
+        results = self.env["whatsapp.session"]._apply_webhook_events([(self.session, _message("m1"))])
+        self.assertTrue(results[0]["duplicate"])
+        self.assertEqual(results[0]["id"], message.id)
+        self.assertFalse(self._messages("m1"))
@@ -0,0 +1,92 @@
+import hashlib
+import hmac
+
+from odoo.tests import tagged
+from odoo.tests.common import HttpCase, new_test_user
+
+CONTENT = b"\x00\x01media payload\xff" * 1000
+
+
+@tagged("post_install", "-at_install")
+class TestMedia(HttpCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Media Test", "session_id": "media-test", "state": "connected"}
+        )
+        self.checksum = hashlib.sha1(CONTENT).hexdigest()
+
+    def _upload_url(self, checksum):
+        return "/whatsapp/media/upload/%s?mimetype=application/pdf&filename=doc.pdf" % checksum
+
+    def _headers(self, checksum, secret=None):
+        signature = hmac.new(
+            (secret or self.session.webhook_secret).encode(), ("media-test:%s" % checksum).encode(), hashlib.sha256
+        ).hexdigest()
+        return {
+            "X-WhatsApp-Session": "media-test",
+            "X-WhatsApp-Signature": "sha256=" + signature,
+            "Content-Type": "application/octet-stream",
+        }
+
+    def _upload(self, content=CONTENT, checksum=None):
+        checksum = checksum or self.checksum
+        return self.url_open(self._upload_url(checksum), data=content, headers=self._headers(checksum))
+
+    def _message(self):
+        response = self._upload()
+        return self.env["whatsapp.message"].create({
+            "session_id": self.session.id,
+            "chat_id": "a@c.us",
+            "direction": "incoming",
+            "state": "read",
+            "message_type": "document",
+            "attachment_id": response.json()["attachment_id"],
+        })
+
+    def test_upload_is_checked_and_deduplicated(self):
+        probe = self.url_open(self._upload_url(self.checksum), headers=self._headers(self.checksum))
+        self.assertEqual(probe.status_code, 404)
+
+        response = self._upload()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()["duplicate"])
+        attachment = self.env["ir.attachment"].browse(response.json()["attachment_id"])
+        self.assertEqual(attachment.checksum, self.checksum)
+        self.assertEqual(attachment.raw, CONTENT)
+        self.assertEqual((attachment.res_model, attachment.res_id), ("whatsapp.session", self.session.id))
+
+        again = self._upload()
+        self.assertEqual(again.json(), {"attachment_id": attachment.id, "duplicate": True})
+
+    def test_upload_rejects_bad_content(self):
+        self.assertEqual(self._upload(CONTENT + b"tampered").status_code, 400)
+        self.assertEqual(self._upload(checksum="not-a-checksum").status_code, 400)
+        forged = self.url_open(
+            self._upload_url(self.checksum), data=CONTENT, headers=self._headers(self.checksum, secret="guess")
+        )
+        self.assertEqual(forged.status_code, 403)
+
+    def test_range_request(self):
+        message = self._message()
+        self.authenticate("admin", "admin")
+        full = self.url_open("/whatsapp/media/%s" % message.id)
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(full.content, CONTENT)
+        self.assertEqual(full.headers["Accept-Ranges"], "bytes")
+
+        part = self.url_open("/whatsapp/media/%s" % message.id, headers={"Range": "bytes=10-19"})
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(part.content, CONTENT[10:20])
+        self.assertEqual(part.headers["Content-Range"], "bytes 10-19/%s" % len(CONTENT))
+
+        cached = self.url_open("/whatsapp/media/%s" % message.id, headers={"If-None-Match": full.headers["ETag"]})
+        self.assertEqual(cached.status_code, 304)
+
+    def test_other_users_media_is_not_served(self):
+        message = self._message()
+        new_test_user(self.env, login="whatsapp_stranger", password="whatsapp_stranger", groups="base.group_user")
+        self.authenticate("whatsapp_stranger", "whatsapp_stranger")
+        self.assertEqual(self.url_open("/whatsapp/media/%s" % message.id).status_code, 404)
+        self.assertEqual(self.url_open("/whatsapp/qr_code/%s" % self.session.id).status_code, 404)
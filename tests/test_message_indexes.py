@@ -0,0 +1,87 @@
+import psycopg2
+
+from odoo.tests.common import TransactionCase
+from odoo.tools import mute_logger
+
+
+class TestMessageIndexes(TransactionCase):
+    """The hot lookups on whatsapp.message must be able to use the indexes
+    declared for them. Sequential scans are disabled so the plans do not
+    depend on the size of the test tables.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create({"name": "Index Test", "session_id": "index-test"})
+        # Mostly read and sent rows, a few unread and pending ones
+        self.env.cr.execute(
+            """
+            INSERT INTO whatsapp_message (session_id, chat_id, message_id, date, direction, state, broadcast)
+            SELECT %s, 'chat' || (n %% 10) || '@c.us', 'msg' || n,
+                   now() at time zone 'UTC' - n * interval '1 minute',
+                   CASE WHEN n %% 2 = 0 THEN 'incoming' ELSE 'outgoing' END,
+                   CASE WHEN n %% 100 = 0 THEN 'delivered'
+                        WHEN n %% 100 = 1 THEN 'pending'
+                        WHEN n %% 2 = 0 THEN 'read' ELSE 'sent' END,
+                   false
+              FROM generate_series(1, 2000) AS n
+            """,
+            (self.session.id,),
+        )
+        self.env.cr.execute("ANALYZE whatsapp_message")
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, index, query, params):
+        self.env.cr.execute("EXPLAIN " + query, params)
+        plan = "\n".join(row[0] for row in self.env.cr.fetchall())
+        self.assertIn(index, plan, "Expected %s in the plan:\n%s" % (index, plan))
+
+    def test_chat_history(self):
+        self.assertUsesIndex(
+            "whatsapp_message_session_chat_date_index",
+            """
+            SELECT id FROM whatsapp_message
+             WHERE session_id = %s AND chat_id = %s AND date < now() at time zone 'UTC'
+          ORDER BY date DESC, id DESC
+             LIMIT 50
+            """,
+            (self.session.id, "chat1@c.us"),
+        )
+
+    def test_unread_messages(self):
+        self.assertUsesIndex(
+            "whatsapp_message_unread_index",
+            """
+            SELECT id FROM whatsapp_message
+             WHERE session_id = %s AND chat_id = %s
+               AND direction = 'incoming' AND (state != 'read' OR state IS NULL)
+            """,
+            (self.session.id, "chat0@c.us"),
+        )
+
+    def test_status_update(self):
+        self.assertUsesIndex(
+            "whatsapp_message_session_message_uniq",
+            "SELECT id FROM whatsapp_message WHERE session_id IN %s AND message_id IN %s",
+            ((self.session.id,), ("msg10", "msg11")),
+        )
+
+    def test_outbox_lane(self):
+        self.assertUsesIndex(
+            "whatsapp_message_outbox_lane_index",
+            """
+            SELECT id FROM whatsapp_message
+             WHERE session_id = %s AND chat_id = %s AND broadcast = false
+               AND direction = 'outgoing' AND state = 'pending'
+          ORDER BY id
+             LIMIT 1
+            """,
+            (self.session.id, "chat1@c.us"),
+        )
+
+    def test_message_id_unique(self):
+        with mute_logger("odoo.sql_db"), self.assertRaises(psycopg2.IntegrityError):
+            with self.env.cr.savepoint():
+                self.env["whatsapp.message"].create(
+                    {"session_id": self.session.id, "chat_id": "chat1@c.us", "message_id": "msg1"}
+                )
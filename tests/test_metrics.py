@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase
+from odoo.tools import config
+
+from ..models import whatsapp_metrics
+from ..models.whatsapp_metrics import Registry
+
+KEY = ("whatsapp_bus_notifications_total", (("type", "test"),))
+
+
+class TestMetrics(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        patcher = patch.dict(config.options, {"whatsapp_metrics_dir": self.directory})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _write(self, filename, count):
+        with open(os.path.join(self.directory, filename), "w") as f:
+            json.dump([[KEY[0], [list(label) for label in KEY[1]], [count]]], f)
+
+    def _dead_pid(self):
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        return process.pid
+
+    def test_recording_does_not_write(self):
+        registry = Registry()
+        registry.inc(KEY[0], type="test")
+        self.assertFalse(os.listdir(self.directory))
+        registry.flush()
+        filenames = os.listdir(self.directory)
+        self.assertEqual(len(filenames), 1)
+        self.assertTrue(filenames[0].startswith("%s-" % os.getpid()))
+
+    def test_dead_workers_are_folded(self):
+        dead = ["%s-0a1b2c.json" % self._dead_pid(), "%s.json" % self._dead_pid()]
+        self._write(dead[0], 5)
+        self._write(dead[1], 2)
+        self._write("%s-0d1e2f.json" % os.getpid(), 1)
+
+        self.assertEqual(whatsapp_metrics.collect().get(KEY), [8])
+        filenames = os.listdir(self.directory)
+        self.assertIn("dead.json", filenames)
+        self.assertIn("%s-0d1e2f.json" % os.getpid(), filenames)
+        self.assertFalse(set(dead) & set(filenames))
+        self.assertEqual(whatsapp_metrics.collect().get(KEY), [8], "Folding keeps the totals")
@@ -0,0 +1,71 @@
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+
+
+def _message(message_id, chat_id, content="Hello"):
+    return {"type": "message", "message": {"id": message_id, "chat_id": chat_id, "content": content}}
+
+
+class TestNotifications(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        Session = self.env["whatsapp.session"]
+        self.first = Session.create({"name": "Notify 1", "session_id": "notify-1", "state": "connected"})
+        self.second = Session.create({"name": "Notify 2", "session_id": "notify-2", "state": "connected"})
+
+    def _flush_notifications(self):
+        """Notifications the queued updates of this transaction end up as"""
+        with patch.object(type(self.env["bus.bus"]), "sendmany", autospec=True) as sendmany:
+            self.env["whatsapp.session"]._send_chat_notifications()
+        self.env.cr.precommit.data.pop("whatsapp.chat_update", None)
+        if not sendmany.called:
+            return {}
+        return {channel: payload for channel, payload in sendmany.call_args[0][1]}
+
+    def test_one_notification_per_session(self):
+        Session = self.env["whatsapp.session"]
+        Session._apply_webhook_events([
+            (self.first, _message("m1", "a@c.us")),
+            (self.first, _message("m2", "a@c.us", "Again")),
+            (self.first, _message("m3", "b@c.us")),
+            (self.second, _message("m4", "a@c.us")),
+        ])
+        Session._apply_webhook_events([(self.first, _message("m5", "b@c.us", "Later"))])
+
+        notifications = self._flush_notifications()
+        self.assertEqual(set(notifications), {self.first._bus_channel(), self.second._bus_channel()})
+        first = notifications[self.first._bus_channel()]
+        self.assertEqual(first["type"], "chat_update")
+        chats = {chat["id"]: chat for chat in first["chats"]}
+        self.assertEqual(set(chats), {"a@c.us", "b@c.us"})
+        self.assertEqual((chats["a@c.us"]["last_message"], chats["a@c.us"]["unread"]), ("Again", 2))
+        self.assertEqual(chats["b@c.us"]["last_message"], "Later")
+        self.assertEqual(
+            [message["content"] for message in first["messages"]], ["Hello", "Again", "Hello", "Later"]
+        )
+        self.assertEqual(len(notifications[self.second._bus_channel()]["messages"]), 1)
+
+    def test_rolled_back_messages_are_left_out(self):
+        Session = self.env["whatsapp.session"]
+        Session._apply_webhook_events([(self.first, _message("m1", "a@c.us"))])
+        try:
+            with self.env.cr.savepoint():
+                Session._apply_webhook_events([(self.second, _message("m2", "a@c.us"))])
+                raise ValueError("rolled back")
+        except ValueError:
+            pass
+        self.env.invalidate_all()
+
+        notifications = self._flush_notifications()
+        first = notifications[self.first._bus_channel()]
+        self.assertEqual([message["content"] for message in first["messages"]], ["Hello"])
+        second = notifications.get(self.second._bus_channel())
+        self.assertFalse(second and second["messages"])
+
+    def test_queued_until_commit(self):
+        self.env["whatsapp.session"]._apply_webhook_events([(self.first, _message("m1", "a@c.us"))])
+        self.assertIn("whatsapp.chat_update", self.env.cr.precommit.data)
+        self.assertEqual(set(self.env.cr.precommit.data["whatsapp.chat_update"]), {self.first.id})
+        self.env.cr.precommit.data.pop("whatsapp.chat_update")
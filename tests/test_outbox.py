@@ -0,0 +1,80 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+from ..models.whatsapp_bridge_client import BridgeClient, BridgeError
+
+
+class TestOutbox(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Outbox Test", "session_id": "outbox-test", "state": "connected"}
+        )
+        self.sent = []
+
+    def _queue(self, content, chat_id="chat@c.us", **vals):
+        return self.env["whatsapp.message"].create(dict(
+            vals,
+            session_id=self.session.id,
+            chat_id=chat_id,
+            content=content,
+            direction="outgoing",
+            state="pending",
+        ))
+
+    def _dispatch(self, fail=()):
+        def send(client, session_key, chat_id, message):
+            if message in fail:
+                raise BridgeError("bridge said no")
+            self.sent.append(message)
+            return "wa-%s" % message
+
+        with patch.object(BridgeClient, "send", autospec=True, side_effect=send):
+            self.env["whatsapp.message"]._cron_dispatch_outbox()
+
+    def test_chat_order(self):
+        messages = self._queue("one") | self._queue("two") | self._queue("three")
+        self._dispatch()
+        self.assertEqual(self.sent, ["one", "two", "three"])
+        self.assertEqual(set(messages.mapped("state")), {"sent"})
+        self.assertEqual(messages.mapped("message_id"), ["wa-one", "wa-two", "wa-three"])
+
+    def test_failure_backs_off_and_holds_the_chat(self):
+        first, second = self._queue("one"), self._queue("two")
+        self._dispatch(fail=("one",))
+        self.assertEqual(self.sent, [])
+        self.assertEqual(first.state, "pending")
+        self.assertEqual(first.attempt_count, 1)
+        self.assertGreater(first.next_attempt_date, fields.Datetime.now())
+        # Later messages never overtake a failed one
+        self.assertEqual((second.state, second.attempt_count), ("pending", 0))
+
+        self._dispatch()
+        self.assertEqual(self.sent, [], "Nothing is due before the backoff expires")
+
+        first.next_attempt_date = fields.Datetime.now() - timedelta(seconds=1)
+        self._dispatch()
+        self.assertEqual(self.sent, ["one", "two"])
+
+    def test_stop_at_first_message_not_due(self):
+        now = fields.Datetime.now()
+        self._queue("one", broadcast=True, next_attempt_date=now - timedelta(minutes=1))
+        self._queue("two", broadcast=True, next_attempt_date=now - timedelta(seconds=30))
+        self._queue("three", broadcast=True, next_attempt_date=now + timedelta(hours=1))
+        self._queue("four", broadcast=True)
+        self._dispatch()
+        self.assertEqual(self.sent, ["one", "two"])
+
+    def test_broadcast_lane_does_not_hold_replies(self):
+        scheduled = self._queue(
+            "campaign", broadcast=True, next_attempt_date=fields.Datetime.now() + timedelta(hours=1)
+        )
+        reply = self._queue("reply")
+        self._dispatch()
+        self.assertEqual(self.sent, ["reply"])
+        self.assertEqual(reply.state, "sent")
+        self.assertEqual(scheduled.state, "pending")
@@ -0,0 +1,69 @@
+import base64
+
+from odoo.tests import tagged
+from odoo.tests.common import HttpCase, TransactionCase
+
+PNG_1 = base64.b64encode(b"\x89PNG\r\n\x1a\nfirst").decode()
+PNG_2 = base64.b64encode(b"\x89PNG\r\n\x1a\nsecond").decode()
+
+
+class TestQrCode(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "QR Test", "session_id": "qr-test", "state": "connecting"}
+        )
+
+    def test_rotation_is_versioned(self):
+        self.assertTrue(self.session._set_qr_code(PNG_1))
+        first = self.session.qr_code_hash
+        self.assertTrue(first)
+        self.assertEqual(self.session.qr_code_data, "data:image/png;base64,%s" % PNG_1)
+
+        self.assertFalse(self.session._set_qr_code(PNG_1), "Same code is not written again")
+        self.assertEqual(self.session.qr_code_hash, first)
+
+        self.assertTrue(self.session._set_qr_code(PNG_2))
+        self.assertNotEqual(self.session.qr_code_hash, first)
+
+    def test_url_carries_version(self):
+        self.session._set_qr_code(PNG_1)
+        result = self.session.get_qr_code()
+        self.assertEqual(result["qr_code_hash"], self.session.qr_code_hash)
+        self.assertTrue(result["qr_code_url"].endswith("?v=%s" % self.session.qr_code_hash))
+
+
+@tagged("post_install", "-at_install")
+class TestQrCodeRoute(HttpCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "QR Route Test", "session_id": "qr-route-test", "state": "connecting"}
+        )
+        self.session._set_qr_code(PNG_1)
+        self.url = "/whatsapp/qr_code/%s" % self.session.id
+        self.authenticate("admin", "admin")
+
+    def test_etag_and_not_modified(self):
+        response = self.url_open(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, base64.b64decode(PNG_1))
+        self.assertEqual(response.headers["ETag"], '"%s"' % self.session.qr_code_hash)
+        self.assertIn("no-cache", response.headers["Cache-Control"])
+
+        response = self.url_open(self.url, headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+
+    def test_versioned_url_is_immutable(self):
+        response = self.url_open("%s?v=%s" % (self.url, self.session.qr_code_hash))
+        self.assertIn("immutable", response.headers["Cache-Control"])
+
+    def test_rotation_changes_etag(self):
+        etag = self.url_open(self.url).headers["ETag"]
+        self.session._set_qr_code(PNG_2)
+        response = self.url_open(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, base64.b64decode(PNG_2))
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+from odoo.tools import mute_logger
+
+from ..models.whatsapp_bridge_client import BridgeClient, BridgeError
+
+
+class TestReadReceipts(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Read Test", "session_id": "read-test", "state": "connected"}
+        )
+        start = datetime(2024, 1, 1, 9, 0)
+        self.messages = self.env["whatsapp.message"].create([
+            {
+                "session_id": self.session.id,
+                "chat_id": chat_id,
+                "content": "m%s" % index,
+                "date": start + timedelta(minutes=index),
+                "direction": "incoming",
+                "state": "delivered",
+            }
+            for index, chat_id in enumerate(["a@c.us", "a@c.us", "a@c.us", "b@c.us", "c@c.us"])
+        ])
+
+    def _chats(self):
+        chats = self.env["whatsapp.chat"].search([("session_id", "=", self.session.id)])
+        chats.invalidate_cache()
+        return {chat.chat_id: (chat.unread_count, chat.read_pending) for chat in chats}
+
+    def test_mark_chats_read(self):
+        counts = self.session.mark_chats_read(["a@c.us", "b@c.us", "x@c.us"])
+        self.assertEqual(counts, {"a@c.us": 3, "b@c.us": 1})
+        self.assertEqual(self._chats(), {"a@c.us": (0, True), "b@c.us": (0, True), "c@c.us": (1, False)})
+        self.assertEqual(self.session.mark_chats_read(["a@c.us"]), {}, "Nothing left to mark")
+
+    def test_mark_up_to(self):
+        counts = self.session.mark_chats_read(["a@c.us"], up_to={"a@c.us": self.messages[1].id})
+        self.assertEqual(counts, {"a@c.us": 2})
+        self.assertEqual(self.messages[:3].mapped("state"), ["read", "read", "delivered"])
+        self.assertEqual(self._chats()["a@c.us"], (1, True))
+
+    def test_cron_sends_one_call_per_session(self):
+        self.session.mark_chats_read(["a@c.us", "b@c.us"])
+        with patch.object(BridgeClient, "read", autospec=True, return_value={"failed": []}) as read:
+            self.env["whatsapp.session"]._cron_send_read_receipts()
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(read.call_args[0][1:], ("read-test", ["a@c.us", "b@c.us"]))
+        self.assertEqual(self._chats()["a@c.us"], (0, False))
+
+        with patch.object(BridgeClient, "read", autospec=True) as read:
+            self.env["whatsapp.session"]._cron_send_read_receipts()
+        self.assertFalse(read.called, "Nothing is left to send")
+
+    def test_failed_call_is_retried(self):
+        self.session.mark_chats_read(["a@c.us"])
+        with patch.object(BridgeClient, "read", autospec=True, side_effect=BridgeError("down", 503)), \
+                mute_logger("odoo.addons.whatsapp_integration.models.whatsapp_session"):
+            self.env["whatsapp.session"]._cron_send_read_receipts()
+        self.assertEqual(self._chats()["a@c.us"], (0, True))
+
+        with patch.object(BridgeClient, "read", autospec=True, return_value={}) as read:
+            self.env["whatsapp.session"]._cron_send_read_receipts()
+        self.assertEqual(read.call_args[0][2], ["a@c.us"])
+        self.assertEqual(self._chats()["a@c.us"], (0, False))
+
+    def test_disconnected_session_waits(self):
+        self.session.mark_chats_read(["a@c.us"])
+        self.session.state = "disconnected"
+        with patch.object(BridgeClient, "read", autospec=True) as read:
+            self.env["whatsapp.session"]._cron_send_read_receipts()
+        self.assertFalse(read.called)
+        self.assertEqual(self._chats()["a@c.us"], (0, True))
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from odoo.exceptions import UserError
+from odoo.tests.common import TransactionCase
+
+
+class TestSearch(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Search Test", "session_id": "search-test", "state": "connected"}
+        )
+        start = datetime(2024, 1, 1, 9, 0)
+        contents = [
+            ("a@c.us", "Invoice 1042 is overdue"),
+            ("a@c.us", "Please send the invoice again"),
+            ("b@c.us", "Lunch at noon?"),
+            ("b@c.us", "The <b>invoice</b> & receipt"),
+            ("b@c.us", "100% done_now"),
+        ]
+        self.messages = self.env["whatsapp.message"].create([
+            {
+                "session_id": self.session.id,
+                "chat_id": chat_id,
+                "content": content,
+                "date": start + timedelta(minutes=index),
+                "direction": "incoming",
+                "state": "read",
+            }
+            for index, (chat_id, content) in enumerate(contents)
+        ])
+
+    def _pick(self, *indexes):
+        return self.env["whatsapp.message"].concat(*(self.messages[index] for index in indexes))
+
+    def _ids(self, result):
+        return [row["id"] for row in result["results"]]
+
+    def test_fulltext(self):
+        result = self.session.search_messages("invoice")
+        self.assertEqual(set(self._ids(result)), set(self._pick(0, 1, 3).ids))
+        snippets = {row["id"]: row["snippet"] for row in result["results"]}
+        self.assertIn("<mark>Invoice</mark>", snippets[self.messages[0].id])
+        self.assertNotIn("<b>", snippets[self.messages[3].id], "Content is escaped")
+        self.assertIn("&lt;b&gt;", snippets[self.messages[3].id])
+
+    def test_filters(self):
+        result = self.session.search_messages("invoice", chat_id="a@c.us")
+        self.assertEqual(set(self._ids(result)), set(self.messages[:2].ids))
+        result = self.session.search_messages(
+            "invoice", date_from=datetime(2024, 1, 1, 9, 1), date_to=datetime(2024, 1, 1, 9, 3)
+        )
+        self.assertEqual(self._ids(result), self.messages[1].ids)
+
+    def test_substring_is_newest_first(self):
+        result = self.session.search_messages("voic", mode="substring")
+        self.assertEqual(self._ids(result), self._pick(3, 1, 0).ids)
+        self.assertEqual(result["results"][0]["snippet"], "The &lt;b&gt;in<mark>voic</mark>e&lt;/b&gt; &amp; receipt")
+
+    def test_substring_wildcards_are_literal(self):
+        self.assertEqual(self._ids(self.session.search_messages("0%", mode="substring")), self.messages[4].ids)
+        self.assertEqual(self._ids(self.session.search_messages("e_n", mode="substring")), self.messages[4].ids)
+        self.assertFalse(self.session.search_messages("1_4", mode="substring")["results"])
+
+    def test_cursor(self):
+        for mode in ("fulltext", "substring"):
+            seen, cursor = [], None
+            while True:
+                page = self.session.search_messages("invoice", mode=mode, limit=2, cursor=cursor)
+                self.assertLessEqual(len(page["results"]), 2)
+                seen += self._ids(page)
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+            self.assertEqual(sorted(seen), sorted(self._pick(0, 1, 3).ids), mode)
+
+    def test_bad_input(self):
+        self.assertEqual(self.session.search_messages("  "), {"results": [], "next_cursor": False})
+        with self.assertRaises(UserError):
+            self.session.search_messages("invoice", mode="regex")
+        with self.assertRaises(UserError):
+            self.session.search_messages("invoice", cursor="garbage")
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+from odoo.tools import mute_logger
+
+from ..models.whatsapp_bridge_client import BridgeClient, BridgeError
+from ..models.whatsapp_session import RESTART_BACKOFF
+
+MUTED = "odoo.addons.whatsapp_integration.models.whatsapp_session"
+
+
+class TestSupervisor(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        # Every session on the default bridge
+        self.env["whatsapp.bridge.node"].search([]).write({"state": "down"})
+        self.Session = self.env["whatsapp.session"]
+        self.paired = self.Session.create({
+            "name": "Paired", "session_id": "supervisor-paired", "state": "connected",
+            "last_connected": datetime(2024, 1, 1, 9, 0),
+        })
+        self.new = self.Session.create(
+            {"name": "New", "session_id": "supervisor-new", "state": "connecting"}
+        )
+        self.sessions = self.paired | self.new
+        self.calls, self.started = [], []
+
+    def _supervise(self, statuses, start_error=None):
+        def get_statuses(client, session_keys):
+            self.calls.append(sorted(session_keys))
+            if isinstance(statuses, Exception):
+                raise statuses
+            return statuses
+
+        def start(client, session_key, webhook_secret):
+            self.started.append(session_key)
+            if start_error:
+                raise start_error
+            return {}
+
+        with patch.object(BridgeClient, "statuses", autospec=True, side_effect=get_statuses), \
+                patch.object(BridgeClient, "start", autospec=True, side_effect=start), \
+                mute_logger(MUTED):
+            self.sessions._supervise()
+
+    def _periods(self, session):
+        return [
+            (period.state, bool(period.date_end))
+            for period in self.env["whatsapp.session.uptime"].search([("session_id", "=", session.id)])
+        ]
+
+    def test_one_call_for_all_sessions(self):
+        connected_at = datetime(2024, 1, 2, 8, 30)
+        status = {"state": "connected", "connected_at": connected_at.replace(tzinfo=timezone.utc).timestamp()}
+        self._supervise({"supervisor-paired": status, "supervisor-new": status})
+        self.assertEqual(self.calls, [["supervisor-new", "supervisor-paired"]])
+        self.assertEqual(self.sessions.mapped("state"), ["connected", "connected"])
+        self.assertEqual(self.new.last_connected, connected_at)
+        # Only the session that changed state has a new period
+        self.assertEqual(self._periods(self.paired), [])
+        self.assertEqual(self._periods(self.new), [("connected", False)])
+
+    def test_unreachable_bridge_changes_nothing(self):
+        self._supervise(BridgeError("bridge is down"))
+        self.assertEqual(self.sessions.mapped("state"), ["connected", "connecting"])
+        self.assertEqual(self.started, [])
+
+    def test_restart_backoff(self):
+        before = fields.Datetime.now()
+        self._supervise({})
+        # Only sessions that were paired before are restarted
+        self.assertEqual(self.started, ["supervisor-paired"])
+        self.assertEqual((self.paired.state, self.paired.restart_count), ("connecting", 1))
+        self.assertGreaterEqual(self.paired.next_restart_date, before + timedelta(seconds=RESTART_BACKOFF))
+        self.assertEqual(self.new.state, "disconnected")
+        self.assertEqual(self._periods(self.paired), [("connecting", False)])
+
+        self._supervise({})
+        self.assertEqual(self.started, ["supervisor-paired"], "No restart before the backoff expires")
+        self.assertEqual(self.paired.state, "disconnected")
+
+        self.paired.next_restart_date = fields.Datetime.now() - timedelta(seconds=1)
+        before = fields.Datetime.now()
+        self._supervise({}, start_error=BridgeError("no capacity"))
+        self.assertEqual((self.paired.state, self.paired.restart_count), ("disconnected", 2))
+        self.assertGreaterEqual(self.paired.next_restart_date, before + timedelta(seconds=2 * RESTART_BACKOFF))
+
+        self._supervise({"supervisor-paired": {"state": "connected"}})
+        self.assertEqual((self.paired.restart_count, self.paired.next_restart_date), (0, False))
+        self.assertEqual(
+            self._periods(self.paired),
+            [("connected", False), ("disconnected", True), ("connecting", True)],
+        )
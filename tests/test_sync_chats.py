@@ -0,0 +1,70 @@
+from odoo.tests.common import TransactionCase
+
+
+class TestSyncChats(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Sync Test", "session_id": "sync-test", "state": "connected"}
+        )
+
+    def _receive(self, chat_id, content="Hello"):
+        self.env["whatsapp.message"].create({
+            "session_id": self.session.id,
+            "chat_id": chat_id,
+            "content": content,
+            "direction": "incoming",
+            "state": "delivered",
+        })
+
+    def _chat(self, chat_id):
+        return self.env["whatsapp.chat"].search(
+            [("session_id", "=", self.session.id), ("chat_id", "=", chat_id)]
+        )
+
+    def test_full_sync(self):
+        self._receive("a@c.us")
+        self._receive("b@c.us")
+        result = self.session.sync_chats()
+        self.assertTrue(result["reset"])
+        self.assertFalse(result["has_more"])
+        self.assertEqual({chat["id"] for chat in result["chats"]}, {"a@c.us", "b@c.us"})
+        self.assertEqual(result["removed"], [])
+
+    def test_deleted_chat_is_reported(self):
+        self._receive("a@c.us")
+        self._receive("b@c.us")
+        token = self.session.sync_chats()["token"]
+
+        self._chat("a@c.us").unlink()
+        result = self.session.sync_chats(token)
+        self.assertFalse(result["reset"])
+        self.assertEqual(result["removed"], ["a@c.us"])
+        self.assertNotIn("a@c.us", [chat["id"] for chat in result["chats"]])
+
+    def test_recreated_chat_supersedes_tombstone(self):
+        self._receive("a@c.us")
+        token = self.session.sync_chats()["token"]
+        self._chat("a@c.us").unlink()
+
+        self._receive("a@c.us", "Back again")
+        result = self.session.sync_chats(token)
+        self.assertEqual(result["removed"], [])
+        self.assertEqual([chat["last_message"] for chat in result["chats"]], ["Back again"])
+
+    def test_pages(self):
+        for index in range(5):
+            self._receive("chat%s@c.us" % index)
+        seen, token, has_more = [], None, True
+        while has_more:
+            result = self.session.sync_chats(token, limit=2)
+            seen += [chat["id"] for chat in result["chats"]]
+            token, has_more = result["token"], result["has_more"]
+        self.assertEqual(sorted(seen), ["chat%s@c.us" % index for index in range(5)])
+
+    def test_foreign_token_resets(self):
+        other = self.env["whatsapp.session"].create({"name": "Other", "session_id": "sync-other"})
+        token = other.sync_chats()["token"]
+        self.assertTrue(self.session.sync_chats(token)["reset"])
+        self.assertTrue(self.session.sync_chats("not a token")["reset"])
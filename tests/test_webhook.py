@@ -0,0 +1,53 @@
+import hashlib
+import hmac
+import json
+
+from odoo.tests.common import HttpCase, tagged
+
+
+@tagged("post_install", "-at_install")
+class TestWebhook(HttpCase):
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.env["whatsapp.session"].create(
+            {"name": "Webhook Test", "session_id": "webhook-test", "state": "connected"}
+        )
+        self.secret = self.session.sudo().webhook_secret
+        self.Inbox = self.env["whatsapp.inbox"].sudo()
+
+    def _post(self, signature=None, secret=None):
+        body = json.dumps({
+            "jsonrpc": "2.0",
+            "params": {
+                "session_id": self.session.session_id,
+                "events": [{"type": "message", "message": {"id": "in1", "chat_id": "a@c.us", "content": "Hi"}}],
+            },
+        }).encode()
+        if signature is None:
+            signature = "sha256=" + hmac.new((secret or self.secret).encode(), body, hashlib.sha256).hexdigest()
+        headers = {"Content-Type": "application/json"}
+        if signature:
+            headers["X-WhatsApp-Signature"] = signature
+        response = self.url_open("/whatsapp/hook", data=body, headers=headers)
+        return response.json()["result"]
+
+    def _queued(self):
+        return self.Inbox.search_count([("session_id", "=", self.session.id)])
+
+    def test_signed_batch_is_queued(self):
+        result = self._post()
+        self.assertTrue(result["results"][0]["success"])
+        self.assertEqual(self._queued(), 1)
+
+    def test_missing_signature(self):
+        self.assertEqual(self._post(signature=""), {"error": "Invalid signature"})
+        self.assertEqual(self._queued(), 0)
+
+    def test_wrong_secret(self):
+        self.assertEqual(self._post(secret="not-the-secret"), {"error": "Invalid signature"})
+        self.assertEqual(self._queued(), 0)
+
+    def test_tampered_signature(self):
+        self.assertEqual(self._post(signature="sha256=" + "0" * 64), {"error": "Invalid signature"})
+        self.assertEqual(self._queued(), 0)
@@ -0,0 +1,308 @@
+from odoo import api, fields, models, tools, _
+from odoo.exceptions import AccessError, UserError
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
+import logging
+
+from .whatsapp_metrics import instrumented
+
+_logger = logging.getLogger(__name__)
+
+# get_analytics groupings -> rollup column
+ANALYTICS_GROUPS = {
+    "user": "user_id",
+    "session": "session_id",
+    "chat": "chat_id",
+    "hour": "hour",
+    "day": "date_trunc('day', hour)",
+}
+
+# Outgoing messages count once they reached the bridge
+SENT_STATES = ("sent", "delivered", "read")
+
+# Messages of one chunk of the history, hot and archived, numbered by the
+# replies sent so far in their chat: a reply numbered N is a first response
+# when incoming messages are numbered N - 1. Outgoing messages that were not
+# sent are left out, and broadcasts are not replies.
+_HISTORY_ROLLUP = """
+    WITH history AS (
+        SELECT session_id, chat_id, date, id, direction, coalesce(broadcast, false) AS broadcast
+          FROM whatsapp_message
+         WHERE session_id = %(session)s AND chat_id IS NOT NULL AND date IS NOT NULL
+           AND (direction = 'incoming' OR state IN ('sent', 'delivered', 'read'))
+           AND (hashtext(chat_id) & 2147483647) %% %(parts)s = %(part)s
+     UNION ALL
+        SELECT session_id, chat_id, date, message_ref, direction, coalesce(broadcast, false)
+          FROM whatsapp_message_archive
+         WHERE session_id = %(session)s AND chat_id IS NOT NULL AND date IS NOT NULL
+           AND (direction = 'incoming' OR state IN ('sent', 'delivered', 'read'))
+           AND (hashtext(chat_id) & 2147483647) %% %(parts)s = %(part)s
+    ), numbered AS (
+        SELECT *, count(*) FILTER (WHERE direction = 'outgoing' AND NOT broadcast)
+                      OVER (PARTITION BY chat_id ORDER BY date, id) AS turn
+          FROM history
+    ), waits AS (
+        SELECT chat_id, turn, min(date) AS since
+          FROM numbered
+         WHERE direction = 'incoming'
+      GROUP BY chat_id, turn
+    ), counted AS (
+        SELECT numbered.chat_id, date_trunc('hour', numbered.date) AS hour, numbered.direction,
+               extract(epoch FROM numbered.date - waits.since) AS latency
+          FROM numbered
+     LEFT JOIN waits ON numbered.direction = 'outgoing' AND NOT numbered.broadcast
+                    AND waits.chat_id = numbered.chat_id AND waits.turn = numbered.turn - 1
+    ), rollup AS (
+        INSERT INTO whatsapp_analytics (hour, session_id, chat_id, user_id,
+                    incoming_count, outgoing_count, response_count,
+                    response_time_total, response_time_max)
+        SELECT hour, %(session)s, chat_id, %(user)s,
+               count(*) FILTER (WHERE direction = 'incoming'),
+               count(*) FILTER (WHERE direction = 'outgoing'),
+               count(latency), coalesce(sum(latency), 0), coalesce(max(latency), 0)
+          FROM counted
+      GROUP BY chat_id, hour
+    )
+    UPDATE whatsapp_chat AS chat
+       SET awaiting_since = waits.since
+      FROM (SELECT DISTINCT ON (chat_id) chat_id, turn FROM numbered
+          ORDER BY chat_id, date DESC, id DESC) AS last
+ LEFT JOIN waits ON waits.chat_id = last.chat_id AND waits.turn = last.turn
+     WHERE chat.session_id = %(session)s AND chat.chat_id = last.chat_id
+"""
+
+
+class WhatsAppAnalytics(models.Model):
+    """Hourly message volumes and first-response times per session and chat.
+
+    Rows are upserted as incoming messages are created and as outgoing
+    messages are sent, so dashboards only read the rollup. A chat awaits a
+    response from its first unanswered incoming message
+    (``whatsapp.chat.awaiting_since``); the next outgoing message sent to the
+    chat, broadcasts aside, is the first response and its latency is
+    counted in that message's hour.
+
+    History synced out of order is only counted approximately: recompute
+    the rollup from all hot and archived messages with::
+
+        >>> env["whatsapp.analytics"].rebuild(workers=4)
+    """
+
+    _name = "whatsapp.analytics"
+    _description = "WhatsApp Analytics"
+    _order = "hour desc, id desc"
+    _log_access = False
+
+    hour = fields.Datetime(string="Hour", required=True, readonly=True)
+    session_id = fields.Many2one(
+        "whatsapp.session", string="Session", required=True, readonly=True, ondelete="cascade"
+    )
+    chat_id = fields.Char(string="Chat ID", required=True, readonly=True)
+    user_id = fields.Many2one("res.users", string="Agent", readonly=True)
+    incoming_count = fields.Integer(string="Incoming Messages", readonly=True)
+    outgoing_count = fields.Integer(string="Outgoing Messages", readonly=True)
+    response_count = fields.Integer(string="Responses", readonly=True)
+    response_time_total = fields.Float(string="Total Response Time (s)", readonly=True)
+    response_time_max = fields.Float(string="Slowest Response (s)", readonly=True, group_operator="max")
+
+    _sql_constraints = [
+        ("hour_session_chat_uniq", "unique(hour, session_id, chat_id)",
+         "Analytics are rolled up once per hour, session and chat."),
+    ]
+
+    def init(self):
+        tools.create_index(
+            self._cr, "whatsapp_analytics_session_hour_index",
+            self._table, ["session_id", "hour"],
+        )
+        tools.create_index(
+            self._cr, "whatsapp_analytics_user_hour_index",
+            self._table, ["user_id", "hour"],
+        )
+
+    @api.model
+    def _record_messages(self, messages):
+        """Fold newly created incoming and newly sent outgoing messages into
+        the rollup and move the awaiting-response marks of their chats.
+        Outgoing messages still to send are skipped: the outbox records them
+        once sent. Their chat summaries must exist already, which locks them
+        for this transaction.
+        """
+        messages = messages.filtered(
+            lambda message: message.chat_id and message.date
+            and (message.direction == "incoming" or message.state in SENT_STATES)
+        ).sorted(lambda message: (message.date, message.id))
+        if not messages:
+            return
+
+        keys = {(message.session_id.id, message.chat_id) for message in messages}
+        self.env["whatsapp.chat"].flush(["awaiting_since"])
+        rows = execute_values(
+            self.env.cr._obj,
+            """
+            SELECT chat.session_id, chat.chat_id, chat.awaiting_since
+              FROM whatsapp_chat chat
+              JOIN (VALUES %s) AS v(session_id, chat_id)
+                ON chat.session_id = v.session_id AND chat.chat_id = v.chat_id
+            """,
+            list(keys),
+            fetch=True,
+        )
+        awaiting = {(row[0], row[1]): row[2] for row in rows}
+
+        buckets = {}
+        for message in messages:
+            key = (message.session_id.id, message.chat_id)
+            hour = message.date.replace(minute=0, second=0, microsecond=0)
+            bucket = buckets.setdefault(
+                (hour,) + key, {"user": message.session_id.user_id.id, "in": 0, "out": 0, "latencies": []}
+            )
+            if message.direction == "incoming":
+                bucket["in"] += 1
+                if not awaiting.get(key):
+                    awaiting[key] = message.date
+            elif message.direction == "outgoing":
+                bucket["out"] += 1
+                if awaiting.get(key) and not message.broadcast:
+                    bucket["latencies"].append(max((message.date - awaiting[key]).total_seconds(), 0))
+                    awaiting[key] = None
+
+        self.flush()
+        execute_values(
+            self.env.cr._obj,
+            """
+            INSERT INTO whatsapp_analytics AS rollup (hour, session_id, chat_id, user_id,
+                        incoming_count, outgoing_count, response_count,
+                        response_time_total, response_time_max)
+            VALUES %s
+            ON CONFLICT (hour, session_id, chat_id) DO UPDATE SET
+                incoming_count = rollup.incoming_count + EXCLUDED.incoming_count,
+                outgoing_count = rollup.outgoing_count + EXCLUDED.outgoing_count,
+                response_count = rollup.response_count + EXCLUDED.response_count,
+                response_time_total = rollup.response_time_total + EXCLUDED.response_time_total,
+                response_time_max = GREATEST(rollup.response_time_max, EXCLUDED.response_time_max)
+            """,
+            [
+                (
+                    hour, session_id, chat_id, bucket["user"] or None,
+                    bucket["in"], bucket["out"], len(bucket["latencies"]),
+                    sum(bucket["latencies"]), max(bucket["latencies"], default=0),
+                )
+                for (hour, session_id, chat_id), bucket in buckets.items()
+            ],
+            template="(%s::timestamp, %s, %s, %s, %s, %s, %s, %s, %s)",
+        )
+        execute_values(
+            self.env.cr._obj,
+            """
+            UPDATE whatsapp_chat AS chat
+               SET awaiting_since = v.since
+              FROM (VALUES %s) AS v(session_id, chat_id, since)
+             WHERE chat.session_id = v.session_id AND chat.chat_id = v.chat_id
+               AND chat.awaiting_since IS DISTINCT FROM v.since
+            """,
+            [(session_id, chat_id, awaiting.get((session_id, chat_id))) for session_id, chat_id in keys],
+            template="(%s, %s, %s::timestamp)",
+        )
+        self.invalidate_cache()
+        self.env["whatsapp.chat"].invalidate_cache(["awaiting_since"])
+
+    # Dashboard
+
+    @instrumented("rpc")
+    @api.model
+    def get_analytics(self, date_from, date_to, groupby="user", session_ids=None):
+        """Message volumes and response times between ``date_from`` and
+        ``date_to``, grouped by ``"user"``, ``"session"``, ``"chat"``,
+        ``"hour"`` or ``"day"``, read from the rollup only.
+
+        Only sessions the user can read are reported.
+        """
+        if groupby not in ANALYTICS_GROUPS:
+            raise UserError(_("Unknown analytics grouping: %s") % groupby)
+        domain = [] if session_ids is None else [("id", "in", session_ids)]
+        sessions = self.env["whatsapp.session"].search(domain)
+        if not sessions:
+            return []
+
+        column = ANALYTICS_GROUPS[groupby]
+        self.flush()
+        self.env.cr.execute(
+            f"""
+            SELECT {column}, sum(incoming_count), sum(outgoing_count), sum(response_count),
+                   sum(response_time_total), max(response_time_max)
+              FROM whatsapp_analytics
+             WHERE session_id IN %s AND hour >= %s AND hour < %s
+          GROUP BY 1
+          ORDER BY 1
+            """,
+            (tuple(sessions.ids), fields.Datetime.to_datetime(date_from), fields.Datetime.to_datetime(date_to)),
+        )
+        rows = self.env.cr.fetchall()
+
+        labels = {}
+        if groupby == "user":
+            labels = dict(self.env["res.users"].browse([row[0] for row in rows if row[0]]).sudo().name_get())
+        elif groupby == "session":
+            labels = dict(sessions.name_get())
+        elif groupby == "chat":
+            names = {}
+            for session in sessions:
+                names.update(self.env["whatsapp.contact"]._resolve_names(session.id, [row[0] for row in rows]))
+            labels = {chat_id: name for chat_id, name in names.items() if name}
+
+        return [
+            {
+                "key": fields.Datetime.to_string(key) if groupby in ("hour", "day") else key,
+                "label": labels.get(key) or (fields.Datetime.to_string(key) if groupby in ("hour", "day") else key),
+                "incoming": incoming,
+                "outgoing": outgoing,
+                "responses": responses,
+                "avg_response_time": responses and total / responses or 0.0,
+                "max_response_time": slowest or 0.0,
+            }
+            for key, incoming, outgoing, responses, total, slowest in rows
+        ]
+
+    # Rebuild
+
+    @api.model
+    def rebuild(self, workers=4, parts=8):
+        """Recompute the whole rollup, and the awaiting-response marks, from
+        the hot and archived history.
+
+        Every session is split into ``parts`` chunks by a hash of the chat
+        id; chunks are recomputed concurrently by ``workers`` threads, each
+        in its own transaction, so the rollup of a chunk is replaced
+        atomically.
+        """
+        if not self.env.is_system():
+            raise AccessError(_("Only administrators can rebuild the WhatsApp analytics."))
+        self.env["base"].flush()
+        chunks = [
+            (session.id, session.user_id.id or None, part)
+            for session in self.env["whatsapp.session"].with_context(active_test=False).sudo().search([])
+            for part in range(parts)
+        ]
+
+        def rebuild_chunk(chunk):
+            session_id, user_id, part = chunk
+            with api.Environment.manage(), self.pool.cursor() as cr:
+                cr.execute(
+                    """
+                    DELETE FROM whatsapp_analytics
+                     WHERE session_id = %s AND (hashtext(chat_id) & 2147483647) %% %s = %s
+                    """,
+                    (session_id, parts, part),
+                )
+                cr.execute(
+                    _HISTORY_ROLLUP,
+                    {"session": session_id, "user": user_id, "parts": parts, "part": part},
+                )
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            list(executor.map(rebuild_chunk, chunks))
+        self.invalidate_cache()
+        self.env["whatsapp.chat"].invalidate_cache(["awaiting_since"])
+        _logger.info("WhatsApp analytics rebuilt in %s chunks", len(chunks))
+        return len(chunks)
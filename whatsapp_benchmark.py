@@ -0,0 +1,294 @@
+"""Load and latency benchmarks for the WhatsApp integration.
+
+Seeds a benchmark session per dataset size, then measures the hot paths
+in-process (throughput, p50/p99 latency and SQL queries per operation) and,
+when an Odoo URL is given, over HTTP. Bridge calls go to an in-process
+:class:`FakeBridge`. Results are saved as JSON so two runs can be compared.
+
+Use a throwaway database with the module installed. Seeded datasets are
+committed and reused by later runs; measured operations are rolled back.
+
+From an Odoo shell::
+
+    >>> from odoo.addons.whatsapp_integration.whatsapp_benchmark import run
+    >>> run(env, sizes=[10000, 1000000])
+
+Standalone::
+
+    python whatsapp_benchmark.py -c odoo.conf -d bench --sizes 10000 1000000 10000000 \\
+        --url http://localhost:8069 --login admin --password admin \\
+        -o bench_results.json --compare previous.json
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import random
+import statistics
+import time
+from datetime import datetime
+
+import requests
+
+from odoo import fields
+
+try:
+    from .whatsapp_fake_bridge import FakeBridge
+except ImportError:
+    from whatsapp_fake_bridge import FakeBridge
+
+_logger = logging.getLogger(__name__)
+
+SEED_CHUNK = 1000000
+SEED_CHATS = 1000
+WEBHOOK_BATCH = 100
+
+
+def seed(env, size, chats=SEED_CHATS):
+    """Benchmark session holding ``size`` messages spread over ``chats``
+    chats, created with set-based inserts on first use.
+    """
+    Session = env["whatsapp.session"]
+    name = f"Benchmark {size}"
+    session = Session.search([("name", "=", name)], limit=1)
+    if session:
+        return session
+
+    session = Session.create({
+        "name": name,
+        "user_id": env.ref("base.user_admin").id,
+        "session_id": f"bench_{size}_{int(time.time())}",
+        "state": "connected",
+    })
+    _logger.info("Seeding %s WhatsApp messages", size)
+    for start in range(1, size + 1, SEED_CHUNK):
+        stop = min(start + SEED_CHUNK - 1, size)
+        env.cr.execute("""
+            INSERT INTO whatsapp_message (session_id, chat_id, message_id, content, date,
+                        direction, state, attempt_count,
+                        create_uid, create_date, write_uid, write_date)
+            SELECT %(session)s,
+                   lpad((i %% %(chats)s)::text, 12, '0') || '@c.us',
+                   'seed' || i,
+                   'Seed message ' || i || ' ' || md5(i::text),
+                   now() at time zone 'UTC' - (%(size)s - i) * interval '1 second',
+                   CASE WHEN i %% 3 = 0 THEN 'outgoing' ELSE 'incoming' END,
+                   CASE WHEN i %% 3 = 0 OR i <= %(size)s - %(unread)s THEN 'read' ELSE 'delivered' END,
+                   0, %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM generate_series(%(start)s, %(stop)s) i
+        """, {
+            "session": session.id, "chats": chats, "size": size, "unread": min(size // 10, 5000),
+            "start": start, "stop": stop, "uid": env.uid,
+        })
+        env.cr.commit()
+    env["whatsapp.chat"]._rebuild()
+    env.cr.execute("ANALYZE whatsapp_message")
+    env.cr.execute("ANALYZE whatsapp_chat")
+    env.cr.commit()
+    return session
+
+
+def measure(env, fn, iterations):
+    """Run ``fn(i)`` ``iterations`` times, each rolled back, and summarize"""
+    cr = env.cr
+    latencies, queries = [], []
+    for i in range(iterations):
+        cr.execute("SAVEPOINT whatsapp_bench")
+        count = cr.sql_log_count
+        start = time.perf_counter()
+        fn(i)
+        env["base"].flush()
+        latencies.append(time.perf_counter() - start)
+        queries.append(cr.sql_log_count - count)
+        cr.execute("ROLLBACK TO SAVEPOINT whatsapp_bench")
+        env.invalidate_all()
+    return summarize(latencies, queries)
+
+
+def summarize(latencies, queries=None):
+    ordered = sorted(latencies)
+    result = {
+        "iterations": len(ordered),
+        "throughput_ops": round(len(ordered) / sum(ordered), 2) if sum(ordered) else None,
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+    }
+    if queries:
+        result["queries_per_op"] = round(statistics.mean(queries), 2)
+    return result
+
+
+def bench_in_process(env, session, bridge, iterations):
+    session = session.with_user(session.user_id)
+    chat_ids = session.env["whatsapp.chat"].search([("session_id", "=", session.id)]).mapped("chat_id")
+    env.cr.execute("SELECT min(id), max(id) FROM whatsapp_message WHERE session_id = %s", (session.id,))
+    min_id, max_id = env.cr.fetchone()
+
+    def deep_cursor():
+        """A chat and a history cursor at a random depth of it"""
+        env.cr.execute(
+            "SELECT chat_id, date, id FROM whatsapp_message WHERE id >= %s ORDER BY id LIMIT 1",
+            (random.randint(min_id, max_id),),
+        )
+        chat_id, date, id_ = env.cr.fetchone()
+        # Same encoding as the cursors get_chat_history hands out
+        position = [fields.Datetime.to_string(date), id_]
+        return chat_id, base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def webhook_batch(i):
+        events = [
+            {
+                "type": "message",
+                "message": {
+                    "id": f"bench{i}_{n}_{time.time_ns()}",
+                    "chat_id": random.choice(chat_ids),
+                    "contact_name": "Bench",
+                    "content": "Benchmark message",
+                },
+            }
+            for n in range(WEBHOOK_BATCH)
+        ]
+        session.sudo()._apply_webhook_events([(session.sudo(), event) for event in events])
+
+    def outbox_dispatch(i):
+        for _n in range(WEBHOOK_BATCH):
+            session.send_message(random.choice(chat_ids), "Benchmark outbox message")
+        session.env["whatsapp.message"].sudo()._cron_dispatch_outbox(chat_limit=WEBHOOK_BATCH)
+
+    # Point the session at the stand-in bridge for the run only
+    params = env["ir.config_parameter"].sudo()
+    bridge_url = params.get_param("whatsapp.bridge_url")
+    params.set_param("whatsapp.bridge_url", bridge.url)
+    try:
+        bridge.add_session(session.session_id, session.sudo().webhook_secret)
+
+        results = {
+            "get_chat_messages": measure(env, lambda i: session.get_chat_messages(random.choice(chat_ids)), iterations),
+            "get_chat_history_first_page": measure(
+                env, lambda i: session.get_chat_history(random.choice(chat_ids)), iterations),
+            "get_chat_history_deep_page": measure(
+                env, lambda i: session.get_chat_history(*deep_cursor()), iterations),
+            "get_channel": measure(env, lambda i: session.get_channel(), iterations),
+            "get_chats": measure(env, lambda i: session.get_chats(), iterations),
+            "mark_messages_read": measure(env, lambda i: session.mark_messages_read(random.choice(chat_ids)), iterations),
+            "send_message": measure(env, lambda i: session.send_message(random.choice(chat_ids), "Benchmark"), iterations),
+            f"webhook_apply_x{WEBHOOK_BATCH}": measure(env, webhook_batch, max(1, iterations // 10)),
+            f"outbox_dispatch_x{WEBHOOK_BATCH}": measure(env, outbox_dispatch, max(1, iterations // 10)),
+        }
+    finally:
+        params.set_param("whatsapp.bridge_url", bridge_url)
+    return results
+
+
+def bench_http(env, session, url, login, password, iterations):
+    """Latency of the HTTP routes against a running server"""
+    secret = session.sudo().webhook_secret
+    chat_ids = env["whatsapp.chat"].search([("session_id", "=", session.id)], limit=100).mapped("chat_id")
+    http = requests.Session()
+    http.post(f"{url}/web/session/authenticate", json={
+        "jsonrpc": "2.0", "params": {"db": env.cr.dbname, "login": login, "password": password},
+    }).raise_for_status()
+
+    def timed(call):
+        latencies = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            response = call(i)
+            response.raise_for_status()
+            if "error" in response.json():
+                raise RuntimeError(response.json()["error"])
+            latencies.append(time.perf_counter() - start)
+        return summarize(latencies)
+
+    def hook(i):
+        events = [
+            {"type": "message", "message": {
+                "id": f"benchhttp{i}_{n}_{time.time_ns()}", "chat_id": random.choice(chat_ids),
+                "content": "Benchmark message"}}
+            for n in range(WEBHOOK_BATCH)
+        ]
+        body = json.dumps({"jsonrpc": "2.0", "params": {"session_id": session.session_id, "events": events}})
+        signature = "sha256=" + hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+        return requests.post(f"{url}/whatsapp/hook", data=body, headers={
+            "Content-Type": "application/json", "X-WhatsApp-Signature": signature})
+
+    def send(i):
+        return http.post(f"{url}/whatsapp/send", json={"jsonrpc": "2.0", "params": {
+            "session_id": session.id, "chat_id": random.choice(chat_ids), "message": "Benchmark"}})
+
+    return {
+        f"http_whatsapp_hook_x{WEBHOOK_BATCH}": timed(hook),
+        "http_whatsapp_send": timed(send),
+    }
+
+
+def run(env, sizes=(10000,), iterations=200, output="bench_results.json",
+        url=None, login="admin", password="admin"):
+    # Seed everything first: seeding commits, benchmarks must not
+    sessions = {size: seed(env, size) for size in sizes}
+    bridge = FakeBridge().start()
+    results = {}
+    try:
+        for size, session in sessions.items():
+            _logger.info("Benchmarking dataset of %s messages", size)
+            results[str(size)] = bench_in_process(env, session, bridge, iterations)
+            if url:
+                results[str(size)].update(bench_http(env, session, url, login, password, iterations))
+    finally:
+        bridge.stop()
+
+    module = env["ir.module.module"].search([("name", "=", "whatsapp_integration")], limit=1)
+    report = {
+        "module_version": module.latest_version,
+        "created": datetime.utcnow().isoformat(),
+        "database": env.cr.dbname,
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    print_report(report)
+    return report
+
+
+def print_report(report, baseline=None):
+    for size, operations in report["results"].items():
+        print(f"\n== {size} messages ==")
+        print(f"{'operation':<34}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}{'p99 vs base':>13}")
+        for name, stats in sorted(operations.items()):
+            base = (baseline or {}).get("results", {}).get(size, {}).get(name)
+            change = f"{stats['p99_ms'] / base['p99_ms'] - 1:+.0%}" if base and base["p99_ms"] else ""
+            print(f"{name:<34}{stats['throughput_ops'] or 0:>10}{stats['p50_ms']:>10}"
+                  f"{stats['p99_ms']:>10}{stats.get('queries_per_op', ''):>9}{change:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-c", "--config")
+    parser.add_argument("-d", "--database", required=True)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--url", help="also benchmark the HTTP routes of this running Odoo")
+    parser.add_argument("--login", default="admin")
+    parser.add_argument("--password", default="admin")
+    args = parser.parse_args()
+
+    import odoo
+    odoo.tools.config.parse_config((["-c", args.config] if args.config else []) + ["-d", args.database])
+    with odoo.registry(args.database).cursor() as cr:
+        env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+        report = run(env, args.sizes, args.iterations, args.output, args.url, args.login, args.password)
+        cr.rollback()
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_report(report, baseline=json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,10 @@
 const { Client, LocalAuth } = require('whatsapp-web.js');
 const qrcode = require('qrcode');
 const axios = require('axios');
+const crypto = require('crypto');
 const fs = require('fs');
 const path = require('path');
+const { Readable } = require('stream');
 const express = require('express');
 const bodyParser = require('body-parser');
 const app = express();
@@ -14,58 +16,186 @@ app.use(bodyParser.urlencoded({ extended: true }));
 
 // Settings
 const ODOO_URL = process.env.ODOO_URL || 'http://localhost:8069';
-const ODOO_DB = process.env.ODOO_DB || 'odoo';
-const ODOO_USERNAME = process.env.ODOO_USERNAME || 'admin';
-const ODOO_PASSWORD = process.env.ODOO_PASSWORD || 'admin';
+const WEBHOOK_BATCH_SIZE = parseInt(process.env.WEBHOOK_BATCH_SIZE) || 200;
+const WEBHOOK_FLUSH_INTERVAL = parseInt(process.env.WEBHOOK_FLUSH_INTERVAL) || 250;
+const WEBHOOK_QUEUE_LIMIT = parseInt(process.env.WEBHOOK_QUEUE_LIMIT) || 10000;
+const WEBHOOK_RETRY_MAX_DELAY = parseInt(process.env.WEBHOOK_RETRY_MAX_DELAY) || 60000;
+const MAX_HISTORY_WINDOW = parseInt(process.env.MAX_HISTORY_WINDOW) || 5000;
 const PORT = process.env.PORT || 3000;
+const MEDIA_CHUNK_SIZE = parseInt(process.env.MEDIA_CHUNK_SIZE) || 64 * 1024;
+// Point every node at the same shared volume to let sessions move between
+// nodes without pairing again
+const SESSION_DATA_PATH = process.env.SESSION_DATA_PATH || path.join(__dirname, 'sessions');
 
 // Store active WhatsApp clients
 const clients = {};
 
-// Authenticate with Odoo
-async function authenticateOdoo() {
-    try {
-        const response = await axios.post(`${ODOO_URL}/web/session/authenticate`, {
-            jsonrpc: '2.0',
-            params: {
-                db: ODOO_DB,
-                login: ODOO_USERNAME,
-                password: ODOO_PASSWORD
-            }
+// Pending webhook events per session, flushed to Odoo in batches
+const outboundQueues = {};
+
+// History windows being paged through by Odoo, per session and chat
+const historyWindows = {};
+const HISTORY_WINDOW_TTL = 60 * 1000;
+
+// Sign a webhook body with the session's shared secret
+function signPayload(secret, body) {
+    return 'sha256=' + crypto.createHmac('sha256', secret).update(body).digest('hex');
+}
+
+// Post the queued events of a session to Odoo, one batch at a time. A
+// flush already running for the session is shared rather than raced, and a
+// rejected batch is retried as is, with backoff, before any later event.
+function flushEvents(sessionId) {
+    const queue = outboundQueues[sessionId];
+    if (!queue) {
+        return Promise.resolve();
+    }
+    if (!queue.flushing) {
+        queue.flushing = postBatch(sessionId, queue).finally(() => {
+            queue.flushing = null;
         });
-        
-        if (response.data && response.data.result) {
-            return response.data.result.session_id;
-        }
-        
-        throw new Error('Authentication failed');
-    } catch (error) {
-        console.error('Odoo authentication error:', error);
-        throw error;
     }
+    return queue.flushing;
 }
 
-// Send event to Odoo webhook
-async function sendToOdoo(event) {
+async function postBatch(sessionId, queue) {
+    clearTimeout(queue.timer);
+    queue.timer = null;
+    
+    const events = queue.batch || queue.events.splice(0, WEBHOOK_BATCH_SIZE);
+    if (!events.length) {
+        return;
+    }
+    queue.batch = events;
+    
+    const body = JSON.stringify({
+        jsonrpc: '2.0',
+        params: { session_id: sessionId, events: events }
+    });
+    
+    let error = null;
     try {
-        const sessionId = await authenticateOdoo();
-        
-        const response = await axios.post(`${ODOO_URL}/whatsapp/hook`, event, {
+        const response = await axios.post(`${ODOO_URL}/whatsapp/hook`, body, {
             headers: {
                 'Content-Type': 'application/json',
-                'Cookie': `session_id=${sessionId}`
+                'X-WhatsApp-Signature': signPayload(queue.secret, body)
             }
         });
-        
-        return response.data;
-    } catch (error) {
-        console.error('Error sending to Odoo:', error);
-        throw error;
+        const data = response.data || {};
+        if (data.error) {
+            error = (data.error.data && data.error.data.message) || data.error.message || 'JSON-RPC error';
+        } else if (!data.result || data.result.error) {
+            error = (data.result && data.result.error) || 'Empty response';
+        }
+    } catch (e) {
+        error = e.message;
+    }
+    
+    if (error) {
+        queue.retryDelay = Math.min((queue.retryDelay || WEBHOOK_FLUSH_INTERVAL) * 2, WEBHOOK_RETRY_MAX_DELAY);
+        console.error(`Webhook batch for session ${sessionId} failed, retrying in ${queue.retryDelay} ms:`, error);
+        queue.timer = setTimeout(() => flushEvents(sessionId), queue.retryDelay);
+        return;
+    }
+    
+    queue.batch = null;
+    queue.retryDelay = 0;
+    if (queue.dropped) {
+        console.warn(`Webhook queue of session ${sessionId} overflowed, ${queue.dropped} events were dropped`);
+        queue.dropped = 0;
+    }
+    if (queue.events.length) {
+        // Once this flush has settled, so the next one can start
+        setImmediate(() => scheduleFlush(sessionId));
     }
 }
 
+function scheduleFlush(sessionId) {
+    const queue = outboundQueues[sessionId];
+    if (!queue || queue.flushing || queue.batch) {
+        // The running flush, or the retry of a failed batch, reschedules
+        return;
+    }
+    if (queue.events.length >= WEBHOOK_BATCH_SIZE) {
+        setImmediate(() => flushEvents(sessionId));
+    } else if (!queue.timer) {
+        queue.timer = setTimeout(() => flushEvents(sessionId), WEBHOOK_FLUSH_INTERVAL);
+    }
+}
+
+// Upload the media of a message to Odoo, streamed in chunks and only when
+// Odoo doesn't store that content for the session yet
+async function uploadMedia(sessionId, message) {
+    const media = await message.downloadMedia();
+    if (!media) {
+        return null;
+    }
+    // whatsapp-web.js hands the media over as one base64 string: hash and
+    // upload it decoded a chunk at a time instead of holding a decoded copy
+    const hash = crypto.createHash('sha1');
+    for (const chunk of decodeChunks(media.data, MEDIA_CHUNK_SIZE)) {
+        hash.update(chunk);
+    }
+    const checksum = hash.digest('hex');
+    const url = `${ODOO_URL}/whatsapp/media/upload/${checksum}`;
+    const headers = {
+        'X-WhatsApp-Session': sessionId,
+        'X-WhatsApp-Signature': signPayload(outboundQueues[sessionId].secret, `${sessionId}:${checksum}`)
+    };
+    
+    const probe = await axios.get(url, { headers, validateStatus: (status) => status === 200 || status === 404 });
+    if (probe.status === 404) {
+        await axios.post(url, Readable.from(decodeChunks(media.data, MEDIA_CHUNK_SIZE)), {
+            headers: {
+                ...headers,
+                'Content-Type': 'application/octet-stream',
+                'Content-Length': decodedLength(media.data)
+            },
+            params: { mimetype: media.mimetype, filename: media.filename || undefined },
+            maxBodyLength: Infinity
+        });
+    }
+    
+    return { checksum: checksum, mimetype: media.mimetype, filename: media.filename || null };
+}
+
+// Decoded chunks of about `size` bytes, cut on 4-character base64 groups
+function* decodeChunks(base64, size) {
+    const step = Math.ceil(size / 3) * 4;
+    for (let offset = 0; offset < base64.length; offset += step) {
+        yield Buffer.from(base64.slice(offset, offset + step), 'base64');
+    }
+}
+
+function decodedLength(base64) {
+    const padding = base64.endsWith('==') ? 2 : base64.endsWith('=') ? 1 : 0;
+    return Math.floor(base64.length * 3 / 4) - padding;
+}
+
+// Queue an event for Odoo; it is delivered with the next batch
+function sendToOdoo(event) {
+    const sessionId = event.session_id;
+    const queue = outboundQueues[sessionId];
+    if (!queue) {
+        console.error(`No webhook secret known for session ${sessionId}, dropping event`);
+        return;
+    }
+    if (queue.events.length >= WEBHOOK_QUEUE_LIMIT) {
+        // Odoo has been unreachable for a while: keep the newest events
+        if (!queue.dropped) {
+            console.warn(`Webhook queue of session ${sessionId} is full, dropping its oldest events`);
+        }
+        queue.dropped = (queue.dropped || 0) + queue.events.splice(0, queue.events.length - WEBHOOK_QUEUE_LIMIT + 1).length;
+    }
+    queue.events.push(event);
+    scheduleFlush(sessionId);
+}
+
 // Initialize WhatsApp client
-function initWhatsAppClient(sessionId) {
+function initWhatsAppClient(sessionId, webhookSecret) {
+    outboundQueues[sessionId] = outboundQueues[sessionId] || { events: [], timer: null };
+    outboundQueues[sessionId].secret = webhookSecret;
+    
     if (clients[sessionId]) {
         return clients[sessionId];
     }
@@ -74,7 +204,7 @@ function initWhatsAppClient(sessionId) {
     const client = new Client({
         authStrategy: new LocalAuth({
             clientId: sessionId,
-            dataPath: path.join(__dirname, 'sessions')
+            dataPath: SESSION_DATA_PATH
         }),
         puppeteer: {
             headless: true,
@@ -95,7 +225,7 @@ function initWhatsAppClient(sessionId) {
             clients[sessionId].qrCode = qrImage.replace(/^data:image\/png;base64,/, '');
             
             // Update session status
-            await sendToOdoo({
+            sendToOdoo({
                 type: 'connection_update',
                 session_id: sessionId,
                 status: 'connecting',
@@ -112,7 +242,7 @@ function initWhatsAppClient(sessionId) {
         clients[sessionId].connectedAt = Date.now() / 1000;
         
         // Update session status
-        await sendToOdoo({
+        sendToOdoo({
             type: 'connection_update',
             session_id: sessionId,
             status: 'connected',
@@ -135,8 +265,18 @@ function initWhatsAppClient(sessionId) {
                 contactName = contact.name || contact.pushname || contact.number;
             }
             
+            // Media is uploaded first so the event can refer to it by checksum
+            let media = null;
+            if (message.hasMedia) {
+                try {
+                    media = await uploadMedia(sessionId, message);
+                } catch (error) {
+                    console.error('Error uploading WhatsApp media:', error.message);
+                }
+            }
+            
             // Send message to Odoo
-            await sendToOdoo({
+            sendToOdoo({
                 type: 'message',
                 session_id: sessionId,
                 message: {
@@ -144,6 +284,8 @@ function initWhatsAppClient(sessionId) {
                     chat_id: message.from,
                     contact_name: contactName,
                     content: message.body,
+                    type: message.type,
+                    media: media,
                     timestamp: message.timestamp
                 }
             });
@@ -166,7 +308,7 @@ function initWhatsAppClient(sessionId) {
         }
         
         // Send status update to Odoo
-        await sendToOdoo({
+        sendToOdoo({
             type: 'status_update',
             session_id: sessionId,
             status: {
@@ -181,7 +323,7 @@ function initWhatsAppClient(sessionId) {
         clients[sessionId].state = 'disconnected';
         
         // Update session status
-        await sendToOdoo({
+        sendToOdoo({
             type: 'connection_update',
             session_id: sessionId,
             status: 'disconnected'
@@ -193,10 +335,11 @@ function initWhatsAppClient(sessionId) {
         delete clients[sessionId];
     });
     
-    // Initialize client data
+    // Initialize client data. Until 'ready' the client is starting up or
+    // waiting for its QR code to be scanned.
     clients[sessionId] = {
         client: client,
-        state: 'disconnected',
+        state: 'connecting',
         qrCode: null,
         connectedAt: null
     };
@@ -209,14 +352,14 @@ function initWhatsAppClient(sessionId) {
 
 // API endpoints
 app.post('/start', async (req, res) => {
-    const { session_id } = req.body;
+    const { session_id, webhook_secret } = req.body;
     
-    if (!session_id) {
-        return res.status(400).json({ error: 'Missing session ID' });
+    if (!session_id || !webhook_secret) {
+        return res.status(400).json({ error: 'Missing session ID or webhook secret' });
     }
     
     try {
-        initWhatsAppClient(session_id);
+        initWhatsAppClient(session_id, webhook_secret);
         res.json({ success: true });
     } catch (error) {
         console.error('Error starting WhatsApp client:', error);
@@ -257,6 +400,20 @@ app.get('/status/:session_id', async (req, res) => {
     });
 });
 
+// Status of many sessions in one call, for Odoo's supervisor: sessions
+// this bridge does not run are reported as null
+app.post('/statuses', async (req, res) => {
+    const sessionIds = req.body.session_ids || [];
+    const statuses = {};
+    
+    for (const sessionId of sessionIds) {
+        const entry = clients[sessionId];
+        statuses[sessionId] = entry ? { state: entry.state, connected_at: entry.connectedAt } : null;
+    }
+    
+    res.json({ statuses: statuses });
+});
+
 app.post('/send', async (req, res) => {
     const { session_id, chat_id, message } = req.body;
     
@@ -293,24 +450,15 @@ app.get('/chats/:session_id', async (req, res) => {
         // Get all chats
         const chats = await clients[session_id].client.getChats();
         
-        // Format and send chats
-        const formattedChats = await Promise.all(chats.map(async (chat) => {
-            let name;
-            
-            if (chat.isGroup) {
-                name = chat.name;
-            } else {
-                const contact = await chat.getContact();
-                name = contact.name || contact.pushname || contact.number;
-            }
-            
-            return {
-                id: chat.id._serialized,
-                name: name,
-                unread: chat.unreadCount,
-                timestamp: chat.timestamp,
-                last_message: chat.lastMessage ? chat.lastMessage.body : ''
-            };
+        // Format and send chats. The chat title already is the contact's
+        // saved name (or number), so no per-chat contact lookup is needed;
+        // Odoo keeps the names in its contact directory.
+        const formattedChats = chats.map((chat) => ({
+            id: chat.id._serialized,
+            name: chat.name,
+            unread: chat.unreadCount,
+            timestamp: chat.timestamp,
+            last_message: chat.lastMessage ? chat.lastMessage.body : ''
         }));
         
         res.json(formattedChats);
@@ -322,45 +470,90 @@ app.get('/chats/:session_id', async (req, res) => {
 
 app.get('/messages/:session_id/:chat_id', async (req, res) => {
     const { session_id, chat_id } = req.params;
-    const { limit, before } = req.query;
+    const pageSize = parseInt(req.query.limit) || 50;
+    const after = parseInt(req.query.after) || 0;
+    const afterId = req.query.after_id || null;
     
     if (!clients[session_id] || clients[session_id].state !== 'connected') {
         return res.status(400).json({ error: 'WhatsApp not connected' });
     }
     
     try {
-        // Get chat
-        const chat = await clients[session_id].client.getChatById(chat_id);
-        
-        // Get messages
-        const messages = await chat.fetchMessages({
-            limit: parseInt(limit) || 50,
-            fromMe: undefined
-        });
+        // Later pages of the same sync are served from the window the first
+        // one fetched, from the id of the last message Odoo got
+        const key = `${session_id}:${chat_id}`;
+        let entry = historyWindows[key];
+        if (!afterId || !entry || entry.after !== after || entry.expires < Date.now()) {
+            entry = historyWindows[key] = await fetchHistoryWindow(session_id, chat_id, after);
+        }
+        entry.expires = Date.now() + HISTORY_WINDOW_TTL;
         
-        // Format and send messages
-        const formattedMessages = messages.map((message) => ({
-            id: message.id.id,
-            chat_id: message.from,
-            content: message.body,
-            timestamp: message.timestamp,
-            direction: message.fromMe ? 'outgoing' : 'incoming',
-            state: message._data.ack === 3 ? 'delivered' : 
-                   message._data.ack === 4 ? 'read' : 'sent'
-        }));
+        const position = afterId ? entry.messages.findIndex((message) => message.id === afterId) : -1;
+        const page = entry.messages.slice(position + 1, position + 1 + pageSize);
+        const hasMore = position + 1 + pageSize < entry.messages.length;
+        if (!hasMore) {
+            delete historyWindows[key];
+        }
         
-        res.json(formattedMessages);
+        res.json({
+            messages: page,
+            has_more: hasMore,
+            // Messages between `after` and the oldest one returned are missing
+            truncated: entry.truncated
+        });
     } catch (error) {
         console.error('Error getting messages:', error);
         res.status(500).json({ error: 'Failed to get messages' });
     }
 });
 
+// Messages of a chat from unix timestamp `after` (inclusive), oldest first.
+// fetchMessages only knows "the last N", so the window grows until it
+// reaches back to `after`, up to MAX_HISTORY_WINDOW messages.
+async function fetchHistoryWindow(sessionId, chatId, after) {
+    for (const [key, entry] of Object.entries(historyWindows)) {
+        if (entry.expires < Date.now()) {
+            delete historyWindows[key];
+        }
+    }
+    
+    const chat = await clients[sessionId].client.getChatById(chatId);
+    let window = 50;
+    let messages;
+    for (;;) {
+        messages = await chat.fetchMessages({ limit: window });
+        if (messages.length < window || !messages.length ||
+                messages[0].timestamp <= after || window >= MAX_HISTORY_WINDOW) {
+            break;
+        }
+        window = Math.min(window * 2, MAX_HISTORY_WINDOW);
+    }
+    
+    return {
+        after: after,
+        expires: Date.now() + HISTORY_WINDOW_TTL,
+        // Only a gap after a known point counts: the first sync of a chat
+        // starts wherever its window does
+        truncated: after > 0 && messages.length >= MAX_HISTORY_WINDOW && messages[0].timestamp > after,
+        messages: messages.filter((message) => message.timestamp >= after).map((message) => ({
+            id: message.id.id,
+            chat_id: chat.id._serialized,
+            content: message.body,
+            timestamp: message.timestamp,
+            direction: message.fromMe ? 'outgoing' : 'incoming',
+            state: message._data.ack === 3 ? 'delivered' :
+                   message._data.ack === 4 ? 'read' : 'sent'
+        }))
+    };
+}
+
 app.post('/read/:session_id', async (req, res) => {
     const { session_id } = req.params;
-    const { chat_id } = req.body;
+    // Odoo coalesces read receipts into one call per session: chat_ids.
+    // A single chat_id is still accepted.
+    const chatIds = req.body.chat_ids || (req.body.chat_id ? [req.body.chat_id] : []);
     
-    if (!chat_id) {
+    if (!chatIds.length) {
         return res.status(400).json({ error: 'Missing chat ID' });
     }
     
@@ -368,17 +561,44 @@ app.post('/read/:session_id', async (req, res) => {
         return res.status(400).json({ error: 'WhatsApp not connected' });
     }
     
+    // One chat at a time: each sendSeen drives the same browser page
+    const failed = [];
+    for (const chatId of chatIds) {
+        try {
+            const chat = await clients[session_id].client.getChatById(chatId);
+            await chat.sendSeen();
+        } catch (error) {
+            console.error('Error marking chat as read:', chatId, error.message);
+            failed.push(chatId);
+        }
+    }
+    
+    if (failed.length === chatIds.length) {
+        return res.status(500).json({ error: 'Failed to mark chat as read' });
+    }
+    res.json({ success: true, failed: failed });
+});
+
+// Shut a client down without logging out, when Odoo moves the session to another node
+app.post('/stop/:session_id', async (req, res) => {
+    const { session_id } = req.params;
+    
+    if (!clients[session_id]) {
+        return res.status(404).json({ error: 'Session not found' });
+    }
+    
     try {
-        // Get chat
-        const chat = await clients[session_id].client.getChatById(chat_id);
-        
-        // Mark chat as read
-        await chat.sendSeen();
+        // Deliver what is still queued before letting go of the session
+        await flushEvents(session_id);
+        await clients[session_id].client.destroy();
+        delete clients[session_id];
+        clearTimeout(outboundQueues[session_id] && outboundQueues[session_id].timer);
+        delete outboundQueues[session_id];
         
         res.json({ success: true });
     } catch (error) {
-        console.error('Error marking chat as read:', error);
-        res.status(500).json({ error: 'Failed to mark chat as read' });
+        console.error('Error stopping WhatsApp client:', error);
+        res.status(500).json({ error: 'Failed to stop WhatsApp client' });
     }
 });
 
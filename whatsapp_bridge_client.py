@@ -0,0 +1,209 @@
+"""HTTP client for the Node.js WhatsApp bridge.
+
+Every Odoo -> bridge call goes through :class:`BridgeClient`. One client is
+kept per bridge URL and per worker process, so calls reuse keep-alive
+connections from a bounded pool. Calls are bounded by connect/read timeouts,
+idempotent calls are retried with jittered backoff, and a circuit breaker
+fails fast while the bridge is down instead of pinning Odoo workers.
+"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .whatsapp_metrics import registry as metrics
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BRIDGE_URL = "http://localhost:3000"
+
+
+class BridgeError(Exception):
+    """A bridge call failed"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class BridgeUnavailable(BridgeError):
+    """The circuit breaker is open: the bridge is considered down"""
+
+
+class CircuitBreaker:
+    """Open after ``failure_threshold`` consecutive failures, then let a
+    single probe call through every ``reset_timeout`` seconds until one
+    succeeds.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return (
+                self.opened_at is not None
+                and time.monotonic() - self.opened_at < self.reset_timeout
+            )
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let this call probe, keep the others out
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    _logger.warning("WhatsApp bridge circuit opened after %s failures", self.failures)
+                self.opened_at = time.monotonic()
+
+
+class BridgeClient:
+    def __init__(self, base_url, connect_timeout=3.05, read_timeout=30.0,
+                 retries=2, backoff=0.2, pool_size=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.circuit = CircuitBreaker()
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+    # Bridge API
+
+    def start(self, session_key, webhook_secret):
+        return self._call("start", "POST", "/start",
+                          json={"session_id": session_key, "webhook_secret": webhook_secret})
+
+    def qr_code(self, session_key):
+        """PNG bytes of the current pairing QR code"""
+        return self._call("qr_code", "GET", f"/qr_code/{session_key}", idempotent=True, raw=True)
+
+    def status(self, session_key):
+        return self._call("status", "GET", f"/status/{session_key}", idempotent=True)
+
+    def statuses(self, session_keys):
+        """``{session_key: {"state": ..., "connected_at": ...} or None}`` for
+        many sessions in one call, None for sessions the bridge does not run
+        """
+        result = self._call("statuses", "POST", "/statuses",
+                            idempotent=True, json={"session_ids": list(session_keys)})
+        return result.get("statuses") or {}
+
+    def chats(self, session_key):
+        return self._call("chats", "GET", f"/chats/{session_key}", idempotent=True)
+
+    def messages(self, session_key, chat_id, after=0, limit=50, after_id=None):
+        """Oldest-first page of messages from unix timestamp ``after``
+        (inclusive), following message ``after_id`` when paging on:
+        ``{"messages": [...], "has_more": bool, "truncated": bool}``
+        """
+        params = {"after": after, "limit": limit}
+        if after_id:
+            params["after_id"] = after_id
+        return self._call("messages", "GET", f"/messages/{session_key}/{chat_id}",
+                          idempotent=True, params=params)
+
+    def send(self, session_key, chat_id, message):
+        result = self._call("send", "POST", "/send",
+                            json={"session_id": session_key, "chat_id": chat_id, "message": message})
+        return result.get("message_id")
+
+    def read(self, session_key, chat_ids):
+        """Mark the given chats seen on the phone, in one call"""
+        return self._call("read", "POST", f"/read/{session_key}",
+                          idempotent=True, json={"chat_ids": list(chat_ids)})
+
+    def stop(self, session_key):
+        """Shut the session's client down, keeping its pairing"""
+        return self._call("stop", "POST", f"/stop/{session_key}")
+
+    def logout(self, session_key):
+        return self._call("logout", "POST", f"/logout/{session_key}")
+
+    # Transport
+
+    def _call(self, name, method, path, idempotent=False, raw=False, **kwargs):
+        attempts = self.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            if not self.circuit.allow():
+                raise BridgeUnavailable("WhatsApp bridge is unavailable")
+            start = time.monotonic()
+            try:
+                response = self._http.request(
+                    method, self.base_url + path, timeout=self.timeout, **kwargs
+                )
+            except requests.RequestException as e:
+                self._record(name, start, error=True)
+                self.circuit.record_failure()
+                if attempt + 1 < attempts:
+                    self._sleep(attempt)
+                    continue
+                raise BridgeError(f"WhatsApp bridge call {name} failed: {e}") from e
+
+            self._record(name, start, error=response.status_code >= 400)
+            if response.status_code >= 500:
+                self.circuit.record_failure()
+                if attempt + 1 < attempts:
+                    self._sleep(attempt)
+                    continue
+            else:
+                self.circuit.record_success()
+            if response.status_code >= 400:
+                raise BridgeError(self._error_message(name, response), response.status_code)
+            return response.content if raw else response.json()
+
+    def _sleep(self, attempt):
+        # Full jitter keeps retrying workers from hitting the bridge in lockstep
+        time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def _record(self, name, start, error=False):
+        elapsed = time.monotonic() - start
+        metrics.observe("whatsapp_bridge_call_seconds", elapsed, call=name)
+        if error:
+            metrics.inc("whatsapp_bridge_call_errors_total", call=name)
+        _logger.debug("WhatsApp bridge %s took %.3fs", name, elapsed)
+
+    @staticmethod
+    def _error_message(name, response):
+        try:
+            detail = response.json().get("error")
+        except ValueError:
+            detail = None
+        return f"WhatsApp bridge call {name} failed ({response.status_code}): {detail or response.reason}"
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url=DEFAULT_BRIDGE_URL, **options):
+    """Return this process's shared client for ``base_url``"""
+    key = (base_url, tuple(sorted(options.items())))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = BridgeClient(base_url, **options)
+        return client
@@ -0,0 +1,176 @@
+from odoo import api, fields, models, tools, _
+from odoo.exceptions import UserError
+import bisect
+import hashlib
+import logging
+import threading
+
+from .whatsapp_bridge_client import DEFAULT_BRIDGE_URL, BridgeError, get_client
+
+_logger = logging.getLogger(__name__)
+
+# Ring points per unit of capacity weight
+VIRTUAL_NODES = 64
+
+
+def _ring_hash(key):
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+
+class WhatsAppBridgeNode(models.Model):
+    """A bridge process WhatsApp sessions can run on.
+
+    Sessions are placed by consistent hashing of their bridge key over the
+    active nodes, each node owning ``weight * VIRTUAL_NODES`` points of the
+    ring. Adding, draining or reweighting a node therefore only moves the
+    sessions of the ring share that changed hands. The placement is stored
+    on the session (``bridge_node_id``) and every bridge call of a session
+    goes to that node until the rebalance cron moves it.
+
+    Without any node, sessions use the single bridge of the
+    ``whatsapp.bridge_url`` parameter.
+    """
+
+    _name = "whatsapp.bridge.node"
+    _description = "WhatsApp Bridge Node"
+    _order = "name, id"
+
+    name = fields.Char(string="Name", required=True)
+    url = fields.Char(string="URL", required=True, help="Base URL of the bridge, e.g. http://bridge-1:3000")
+    weight = fields.Integer(
+        string="Capacity Weight",
+        default=1,
+        required=True,
+        help="Relative share of the sessions this node receives.",
+    )
+    state = fields.Selection(
+        [
+            ("active", "Active"),
+            ("draining", "Draining"),
+            ("down", "Down"),
+        ],
+        string="Status",
+        default="active",
+        required=True,
+        help="Draining nodes keep serving their sessions until they are moved; "
+             "down nodes are not called at all.",
+    )
+    session_ids = fields.One2many("whatsapp.session", "bridge_node_id", string="Sessions")
+    session_count = fields.Integer(string="Sessions", compute="_compute_session_count")
+
+    _sql_constraints = [
+        ("url_uniq", "unique(url)", "A bridge node can only be registered once."),
+        ("weight_positive", "CHECK(weight > 0)", "The capacity weight must be positive."),
+    ]
+
+    def _compute_session_count(self):
+        counts = {
+            group["bridge_node_id"][0]: group["bridge_node_id_count"]
+            for group in self.env["whatsapp.session"].read_group(
+                [("bridge_node_id", "in", self.ids)], ["bridge_node_id"], ["bridge_node_id"]
+            )
+        }
+        for node in self:
+            node.session_count = counts.get(node.id, 0)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        nodes = super().create(vals_list)
+        self._ring_changed()
+        return nodes
+
+    def write(self, vals):
+        result = super().write(vals)
+        if {"state", "weight"} & set(vals):
+            self._ring_changed()
+        return result
+
+    def unlink(self):
+        if self.env["whatsapp.session"].search_count(
+            [("bridge_node_id", "in", self.ids), ("state", "!=", "disconnected")]
+        ):
+            raise UserError(_("Drain bridge nodes before deleting them: they still run connected sessions."))
+        result = super().unlink()
+        self._ring_changed()
+        return result
+
+    def _ring_changed(self):
+        self.clear_caches()
+        self.env.ref("whatsapp_integration.ir_cron_whatsapp_rebalance").sudo()._trigger()
+
+    # Placement
+
+    @api.model
+    @tools.ormcache()
+    def _ring(self):
+        """Sorted ring point hashes and the node id owning each point"""
+        points = sorted(
+            (_ring_hash(f"{node.id}:{point}"), node.id)
+            for node in self.sudo().search([("state", "=", "active")])
+            for point in range(node.weight * VIRTUAL_NODES)
+        )
+        return tuple(point[0] for point in points), tuple(point[1] for point in points)
+
+    @api.model
+    def _owner(self, session_key):
+        """Active node the ring assigns ``session_key`` to, if any"""
+        hashes, node_ids = self._ring()
+        if not hashes:
+            return self.browse()
+        index = bisect.bisect(hashes, _ring_hash(session_key)) % len(hashes)
+        return self.browse(node_ids[index])
+
+    @api.model
+    def _get_client(self, url=None):
+        """Shared, pooled client for the bridge at ``url`` (the configured
+        default bridge when not given)
+        """
+        params = self.env["ir.config_parameter"].sudo()
+        return get_client(
+            url or params.get_param("whatsapp.bridge_url", DEFAULT_BRIDGE_URL),
+            connect_timeout=float(params.get_param("whatsapp.bridge_connect_timeout", 3.05)),
+            read_timeout=float(params.get_param("whatsapp.bridge_read_timeout", 30)),
+        )
+
+    def _client(self):
+        self.ensure_one()
+        return self._get_client(self.url)
+
+    # Rebalancing
+
+    def action_drain(self):
+        self.write({"state": "draining"})
+
+    def action_activate(self):
+        self.write({"state": "active"})
+
+    def action_rebalance(self):
+        self.env.ref("whatsapp_integration.ir_cron_whatsapp_rebalance").sudo()._trigger()
+
+    @api.model
+    def _cron_rebalance(self, limit=20):
+        """Move misplaced sessions to the node the ring assigns them.
+
+        Each move restarts a headless browser, so only ``limit`` sessions
+        are moved per run, one transaction each, before retriggering.
+        """
+        if not self._ring()[0]:
+            return
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        sessions = self.env["whatsapp.session"].search([("session_id", "!=", False)])
+        misplaced = sessions.filtered(
+            lambda session: session.bridge_node_id != self._owner(session.session_id)
+        )
+        moved = 0
+        for session in misplaced[:limit]:
+            try:
+                with self.env.cr.savepoint():
+                    session._move_to_node(self._owner(session.session_id))
+                moved += 1
+            except BridgeError as e:
+                _logger.warning("Could not move WhatsApp session %s: %s", session.id, e)
+            if auto_commit:
+                self.env.cr.commit()
+        # Failed moves wait for the next scheduled run instead of spinning
+        if moved and len(misplaced) > limit:
+            self.env.ref("whatsapp_integration.ir_cron_whatsapp_rebalance")._trigger()
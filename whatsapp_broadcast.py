@@ -0,0 +1,424 @@
+from odoo import api, fields, models, _
+from odoo.addons.base.models.qweb import QWebException
+from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval
+from psycopg2.extras import execute_values
+import logging
+import re
+import threading
+
+from .whatsapp_metrics import instrumented
+
+_logger = logging.getLogger(__name__)
+
+# Recipients loaded per read when a broadcast targets a domain
+RECIPIENT_LOAD_BATCH = 1000
+
+# Models a broadcast may target, extended by the comma-separated
+# whatsapp.broadcast_models system parameter
+BROADCAST_MODELS = ("res.partner",)
+
+# Fields fixed once a broadcast is started, as they were checked then
+LOCKED_FIELDS = {"session_id", "template", "model", "domain", "phone_field"}
+
+# What a broken template raises: mail.render.mixin reports inline template
+# failures as UserError, QWeb ones as QWebException. Anything else is a bug
+# or an access problem and must not be recorded as a recipient failure.
+RENDER_ERRORS = (UserError, QWebException)
+
+
+def _chat_id(number):
+    """WhatsApp chat id of a phone number or chat id, False if unusable"""
+    if not number:
+        return False
+    if "@" in number:
+        return number
+    digits = re.sub(r"\D", "", number)
+    return f"{digits}@c.us" if len(digits) >= 6 else False
+
+
+class WhatsAppBroadcast(models.Model):
+    """One message template sent to many recipients.
+
+    Starting a broadcast stores its recipients in one insert. The broadcast
+    cron then renders the template for batches of recipients, bulk-creates
+    their outgoing messages and hands them to the outbox. Each message is
+    scheduled so the session's broadcast rate limit holds. Progress and
+    failures are read from the recipients joined with their messages.
+    """
+
+    _name = "whatsapp.broadcast"
+    _description = "WhatsApp Broadcast"
+    _order = "id desc"
+
+    name = fields.Char(string="Name", required=True)
+    session_id = fields.Many2one(
+        "whatsapp.session", string="Session", required=True, ondelete="cascade"
+    )
+    template = fields.Text(
+        string="Template",
+        required=True,
+        help="Message sent to every recipient, rendered with Jinja: ${object.name}. "
+             "Without a recipient model, object is the broadcast recipient.",
+    )
+    model = fields.Char(string="Recipient Model", help="e.g. res.partner")
+    domain = fields.Char(string="Recipient Domain", default="[]")
+    phone_field = fields.Char(string="Phone Field", default="mobile")
+    state = fields.Selection(
+        [
+            ("draft", "Draft"),
+            ("running", "Running"),
+            ("done", "Queued"),
+            ("cancelled", "Cancelled"),
+        ],
+        string="Status",
+        default="draft",
+        required=True,
+    )
+    # Whose rights the template is rendered with
+    user_id = fields.Many2one("res.users", string="Started By", readonly=True, copy=False)
+    recipient_ids = fields.One2many(
+        "whatsapp.broadcast.recipient", "broadcast_id", string="Recipients"
+    )
+    recipient_count = fields.Integer(string="Recipients", compute="_compute_progress")
+    sent_count = fields.Integer(string="Sent", compute="_compute_progress")
+    failed_count = fields.Integer(string="Failed", compute="_compute_progress")
+    progress = fields.Float(string="Progress", compute="_compute_progress")
+
+    def _compute_progress(self):
+        for broadcast in self:
+            counts = broadcast._progress_counts() if broadcast.id else {}
+            total = sum(counts.values())
+            done = sum(counts.get(state, 0) for state in ("sent", "delivered", "read"))
+            failed = sum(counts.get(state, 0) for state in ("failed", "skipped"))
+            broadcast.recipient_count = total
+            broadcast.sent_count = done
+            broadcast.failed_count = failed
+            broadcast.progress = total and 100.0 * (done + failed) / total
+
+    # API
+
+    @instrumented("rpc")
+    @api.model
+    def send_broadcast(self, session_id, template, recipients=None, model=None,
+                       domain=None, phone_field="mobile", name=None):
+        """Create and start a broadcast, returning its id.
+
+        Recipients are either ``recipients``, a list of phone numbers, chat
+        ids or ``{"phone"|"chat_id": ..., "name": ...}`` dicts, or the
+        records of ``model`` matching ``domain``, reached through their
+        ``phone_field``.
+        """
+        broadcast = self.create(
+            {
+                "name": name or _("Broadcast"),
+                "session_id": session_id,
+                "template": template,
+                "model": model or False,
+                "domain": repr(domain or []),
+                "phone_field": phone_field,
+            }
+        )
+        broadcast._start(recipients)
+        return broadcast.id
+
+    def get_progress(self, failure_limit=100):
+        """Live progress: recipient counts by state and the first failures"""
+        self.ensure_one()
+        self.env["whatsapp.message"].flush(["state", "error_message"])
+        self.env["whatsapp.broadcast.recipient"].flush()
+        self.env.cr.execute(
+            """
+            SELECT r.id, r.name, r.chat_id, coalesce(m.error_message, r.error) AS error
+              FROM whatsapp_broadcast_recipient r
+         LEFT JOIN whatsapp_message m ON m.id = r.message_id
+             WHERE r.broadcast_id = %s
+               AND (r.state IN ('failed', 'skipped') OR m.state = 'failed')
+          ORDER BY r.id
+             LIMIT %s
+            """,
+            (self.id, failure_limit),
+        )
+        return {
+            "state": self.state,
+            "counts": self._progress_counts(),
+            "failures": self.env.cr.dictfetchall(),
+        }
+
+    def _progress_counts(self):
+        """Recipients by delivery state; recipients whose message was
+        archived count as sent
+        """
+        self.env.cr.execute(
+            """
+            SELECT CASE WHEN r.state = 'queued' THEN coalesce(m.state, 'sent') ELSE r.state END,
+                   count(*)
+              FROM whatsapp_broadcast_recipient r
+         LEFT JOIN whatsapp_message m ON m.id = r.message_id
+             WHERE r.broadcast_id = %s
+          GROUP BY 1
+            """,
+            (self.id,),
+        )
+        return dict(self.env.cr.fetchall())
+
+    def write(self, vals):
+        if LOCKED_FIELDS.intersection(vals) and any(broadcast.state != "draft" for broadcast in self):
+            raise UserError(_("A started broadcast cannot be changed."))
+        return super().write(vals)
+
+    @api.model
+    def _allowed_models(self):
+        extra = self.env["ir.config_parameter"].sudo().get_param("whatsapp.broadcast_models", "")
+        return set(BROADCAST_MODELS) | {model.strip() for model in extra.split(",") if model.strip()}
+
+    # Actions
+
+    def action_start(self):
+        for broadcast in self:
+            broadcast._start()
+
+    def action_cancel(self):
+        """Stop rendering and withdraw the messages still in the outbox"""
+        if not self:
+            return
+        self.env["whatsapp.message"].flush()
+        self.env["whatsapp.broadcast.recipient"].flush()
+        self.env.cr.execute(
+            """
+            UPDATE whatsapp_message m
+               SET state = 'failed', error_message = 'Broadcast cancelled',
+                   write_date = now() at time zone 'UTC'
+              FROM whatsapp_broadcast_recipient r
+             WHERE r.message_id = m.id AND r.broadcast_id IN %s
+               AND m.state = 'pending'
+            """,
+            (tuple(self.ids),),
+        )
+        self.env.cr.execute(
+            """
+            UPDATE whatsapp_broadcast_recipient SET state = 'cancelled'
+             WHERE broadcast_id IN %s AND state = 'pending'
+            """,
+            (tuple(self.ids),),
+        )
+        self.env["whatsapp.message"].invalidate_cache()
+        self.env["whatsapp.broadcast.recipient"].invalidate_cache()
+        self.write({"state": "cancelled"})
+
+    def _start(self, recipients=None):
+        self.ensure_one()
+        if self.state != "draft":
+            raise UserError(_("Only draft broadcasts can be started."))
+        if recipients is None and not self.model:
+            raise UserError(_("Give the broadcast a recipient list or a recipient model."))
+        rows = self._load_recipients() if recipients is None else self._parse_recipients(recipients)
+
+        seen = set()
+        values = []
+        for res_id, name, phone, chat_id in rows:
+            if not chat_id:
+                state, error = "skipped", _("No usable phone number")
+            elif chat_id in seen:
+                state, error = "skipped", _("Duplicate recipient")
+            else:
+                state, error = "pending", None
+            seen.add(chat_id)
+            values.append((self.id, res_id, name, phone, chat_id, state, error, self.env.uid))
+        self.env["whatsapp.broadcast.recipient"].flush()
+        execute_values(
+            self.env.cr._obj,
+            """
+            INSERT INTO whatsapp_broadcast_recipient
+                   (broadcast_id, res_id, name, phone, chat_id, state, error,
+                    create_uid, create_date, write_uid, write_date)
+            SELECT v.broadcast_id, v.res_id, v.name, v.phone, v.chat_id, v.state, v.error,
+                   v.uid, now() at time zone 'UTC', v.uid, now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(broadcast_id, res_id, name, phone, chat_id, state, error, uid)
+            """,
+            values,
+            page_size=RECIPIENT_LOAD_BATCH,
+        )
+        self.env["whatsapp.broadcast.recipient"].invalidate_cache()
+        self.write({"state": "running", "user_id": self.env.uid})
+        self._trigger_processing()
+
+    def _load_recipients(self):
+        """``(res_id, name, phone, chat_id)`` of the records matching the
+        domain, searched with the rights of the user starting the broadcast
+        """
+        if self.model not in self.env:
+            raise UserError(_("Unknown recipient model %s.") % self.model)
+        if self.model not in self._allowed_models():
+            raise UserError(_("Broadcasts cannot target %s.") % self.model)
+        Model = self.env[self.model]
+        if self.phone_field not in Model._fields:
+            raise UserError(_("%s has no field %s.") % (self.model, self.phone_field))
+        records = Model.search(safe_eval(self.domain or "[]"))
+        rows = []
+        for start in range(0, len(records), RECIPIENT_LOAD_BATCH):
+            batch = records[start:start + RECIPIENT_LOAD_BATCH]
+            for record in batch.read(["display_name", self.phone_field]):
+                phone = record[self.phone_field] or False
+                rows.append((record["id"], record["display_name"], phone, _chat_id(phone)))
+            batch.invalidate_cache()
+        return rows
+
+    @api.model
+    def _parse_recipients(self, recipients):
+        rows = []
+        for recipient in recipients:
+            if not isinstance(recipient, dict):
+                recipient = {"phone": recipient}
+            phone = recipient.get("chat_id") or recipient.get("phone") or False
+            rows.append((None, recipient.get("name") or phone, phone, _chat_id(phone)))
+        return rows
+
+    # Processing
+
+    def _trigger_processing(self):
+        self.env.ref("whatsapp_integration.ir_cron_whatsapp_broadcast").sudo()._trigger()
+
+    @instrumented("cron")
+    @api.model
+    def _cron_process_broadcasts(self, batch_size=500, max_batches=20):
+        """Render and queue running broadcasts, one batch per transaction"""
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        batches = 0
+        for broadcast in self.search([("state", "=", "running")], order="id"):
+            while batches < max_batches:
+                queued = broadcast._process_batch(batch_size)
+                if auto_commit:
+                    self.env.cr.commit()
+                batches += 1
+                if not queued:
+                    break
+        if batches >= max_batches:
+            self._trigger_processing()
+
+    def _process_batch(self, batch_size):
+        """Render, create and schedule the messages of the next recipients.
+
+        Returns the number of recipients handled, 0 once the broadcast is
+        fully queued.
+        """
+        self.ensure_one()
+        Recipient = self.env["whatsapp.broadcast.recipient"]
+        recipients = Recipient.search(
+            [("broadcast_id", "=", self.id), ("state", "=", "pending")], order="id", limit=batch_size
+        )
+        if not recipients:
+            self.state = "done"
+            self.session_id._notify_broadcast_progress(self)
+            return 0
+
+        contents, errors = self._render(recipients)
+        ready = recipients.filtered(lambda recipient: recipient.id in contents)
+        slots = self.session_id._reserve_broadcast_slots(len(ready))
+        messages = self.env["whatsapp.message"].create(
+            [
+                {
+                    "session_id": self.session_id.id,
+                    "chat_id": recipient.chat_id,
+                    "content": contents[recipient.id],
+                    "direction": "outgoing",
+                    "state": "pending",
+                    "next_attempt_date": slot,
+                    "broadcast": True,
+                }
+                for recipient, slot in zip(ready, slots)
+            ]
+        )
+
+        Recipient.flush()
+        if messages:
+            execute_values(
+                self.env.cr._obj,
+                """
+                UPDATE whatsapp_broadcast_recipient r
+                   SET state = 'queued', message_id = v.message_id,
+                       write_date = now() at time zone 'UTC'
+                  FROM (VALUES %s) AS v(id, message_id)
+                 WHERE r.id = v.id
+                """,
+                [(recipient.id, message.id) for recipient, message in zip(ready, messages)],
+            )
+        if errors:
+            execute_values(
+                self.env.cr._obj,
+                """
+                UPDATE whatsapp_broadcast_recipient r
+                   SET state = 'failed', error = v.error,
+                       write_date = now() at time zone 'UTC'
+                  FROM (VALUES %s) AS v(id, error)
+                 WHERE r.id = v.id
+                """,
+                list(errors.items()),
+            )
+        Recipient.invalidate_cache()
+        if messages:
+            messages._trigger_outbox(min(slots) or None)
+        self.session_id._notify_broadcast_progress(self)
+        return len(recipients)
+
+    def _render(self, recipients):
+        """``({recipient id: content}, {recipient id: error})`` for a batch,
+        rendering the batch at once and falling back to one recipient at a
+        time when that fails.
+
+        Runs in the broadcast cron, so the template is rendered with the
+        rights of the user who started the broadcast, not the cron's.
+        """
+        if self.model:
+            model, targets = self.model, {recipient.id: recipient.res_id for recipient in recipients}
+        else:
+            model, targets = recipients._name, {recipient.id: recipient.id for recipient in recipients}
+
+        Render = self.env["mail.render.mixin"].with_user(self.user_id or self.create_uid)
+        try:
+            rendered = Render._render_template(self.template, model, list(set(targets.values())))
+            return {rid: rendered[target] for rid, target in targets.items()}, {}
+        except RENDER_ERRORS:
+            _logger.info("Rendering broadcast %s in bulk failed, rendering one by one", self.id)
+        contents, errors = {}, {}
+        for rid, target in targets.items():
+            try:
+                contents[rid] = Render._render_template(self.template, model, [target])[target]
+            except RENDER_ERRORS as e:
+                errors[rid] = str(e)[:255]
+        return contents, errors
+
+
+class WhatsAppBroadcastRecipient(models.Model):
+    _name = "whatsapp.broadcast.recipient"
+    _description = "WhatsApp Broadcast Recipient"
+    _order = "id"
+
+    broadcast_id = fields.Many2one(
+        "whatsapp.broadcast", string="Broadcast", required=True, ondelete="cascade"
+    )
+    res_id = fields.Integer(string="Record ID")
+    name = fields.Char(string="Name")
+    phone = fields.Char(string="Phone")
+    chat_id = fields.Char(string="Chat ID")
+    state = fields.Selection(
+        [
+            ("pending", "Pending"),
+            ("queued", "Queued"),
+            ("skipped", "Skipped"),
+            ("failed", "Failed"),
+            ("cancelled", "Cancelled"),
+        ],
+        string="Status",
+        default="pending",
+        required=True,
+    )
+    message_id = fields.Many2one("whatsapp.message", string="Message", ondelete="set null")
+    message_state = fields.Selection(related="message_id.state", string="Delivery")
+    error = fields.Char(string="Error")
+
+    def init(self):
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_broadcast_recipient_broadcast_state_index
+                ON whatsapp_broadcast_recipient (broadcast_id, state, id)
+        """)
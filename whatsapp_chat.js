@@ -25,6 +25,79 @@ odoo.define('whatsapp_integration.chat', [
         },
     });
 
+    // Chat list of a session, cached in localStorage and kept current with
+    // the deltas of whatsapp.session.sync_chats and the session's
+    // chat_update bus notifications.
+    const ChatListCache = core.Class.extend({
+        init: function (rpc, sessionId) {
+            this._rpc = rpc;
+            this.sessionId = sessionId;
+            this.storageKey = `whatsapp_chats_${odoo.session_info.db}_${sessionId}`;
+            const stored = JSON.parse(window.localStorage.getItem(this.storageKey) || 'null');
+            this.token = stored ? stored.token : null;
+            this.chats = new Map(stored ? stored.chats.map(chat => [chat.id, chat]) : []);
+        },
+
+        /**
+         * Fetch and apply every change since the cached token.
+         *
+         * @returns {Promise<Object[]>} chats, most recent first
+         */
+        sync: async function () {
+            let hasMore = true;
+            while (hasMore) {
+                const delta = await this._rpc({
+                    model: 'whatsapp.session',
+                    method: 'sync_chats',
+                    args: [[this.sessionId], this.token],
+                });
+                if (delta.reset) {
+                    this.chats.clear();
+                }
+                for (const chatId of delta.removed) {
+                    this.chats.delete(chatId);
+                }
+                for (const chat of delta.chats) {
+                    this.chats.set(chat.id, chat);
+                }
+                this.token = delta.token;
+                hasMore = delta.has_more;
+            }
+            this._save();
+            return this.list();
+        },
+
+        /**
+         * Patch the cache from a chat_update notification. Names are not
+         * part of it: known chats keep theirs, new ones show their id until
+         * the next sync.
+         */
+        applyNotification: function (message) {
+            for (const chat of message.chats) {
+                const known = this.chats.get(chat.id);
+                this.chats.set(chat.id, Object.assign({ name: chat.id }, known, chat));
+            }
+            this._save();
+        },
+
+        list: function () {
+            return Array.from(this.chats.values()).sort(
+                (a, b) => (b.timestamp || '').localeCompare(a.timestamp || '')
+            );
+        },
+
+        _save: function () {
+            try {
+                window.localStorage.setItem(this.storageKey, JSON.stringify({
+                    token: this.token,
+                    chats: Array.from(this.chats.values()),
+                }));
+            } catch (error) {
+                // Storage full or disabled: the cache only lives in memory
+            }
+        },
+    });
+
     // WhatsApp QR Code Client Action
     const WhatsAppQRCode = Widget.extend({
         template: 'whatsapp_integration.QRCodeScreen',
@@ -37,7 +110,6 @@ odoo.define('whatsapp_integration.chat', [
             this.sessionId = options.params.session_id;
             this.state = 'connecting';
             this.qrCodeData = null;
-            this.checkInterval = null;
         },
 
         willStart: function () {
@@ -49,25 +121,23 @@ odoo.define('whatsapp_integration.chat', [
 
         start: function () {
             const result = this._super.apply(this, arguments);
-            this.checkInterval = setInterval(() => this._checkConnection(), 3000);
+            // Connection changes are pushed on the session's bus channel,
+            // which the server subscribes us to; no polling needed.
+            this.call('bus_service', 'onNotification', this, this._onNotification);
+            this.call('bus_service', 'startPolling');
+            // Catch a transition that happened before we subscribed
+            this._checkConnection();
             return result;
         },
 
-        destroy: function () {
-            if (this.checkInterval) {
-                clearInterval(this.checkInterval);
-            }
-            this._super.apply(this, arguments);
-        },
-
         _fetchQRCode: function () {
             return this._rpc({
                 model: 'whatsapp.session',
                 method: 'get_qr_code',
                 args: [this.sessionId],
             }).then(result => {
-                if (result && result.qr_code) {
-                    this.qrCodeData = 'data:image/png;base64,' + result.qr_code;
+                if (result && result.qr_code_hash) {
+                    this.qrCodeData = result.qr_code_url;
                 }
             });
         },
@@ -75,29 +145,49 @@ odoo.define('whatsapp_integration.chat', [
         _checkConnection: function () {
             return this._rpc({
                 model: 'whatsapp.session',
-                method: 'check_connection',
-                args: [this.sessionId],
+                method: 'read',
+                args: [[this.sessionId], ['state']],
             }).then(result => {
-                if (result && result.state) {
-                    this.state = result.state;
-                    if (this.state === 'connected') {
-                        this._onConnectionSuccess();
-                    } else if (this.state === 'disconnected') {
-                        this._onConnectionFailure();
-                    }
+                if (result && result.length) {
+                    this._applyState(result[0].state);
                 }
             });
         },
 
+        _applyState: function (state) {
+            if (this.isDestroyed() || state === this.state) {
+                return;
+            }
+            this.state = state;
+            if (state === 'connected') {
+                this._onConnectionSuccess();
+            } else if (state === 'disconnected') {
+                this._onConnectionFailure();
+            }
+        },
+
+        _onNotification: function (notifications) {
+            for (const [channel, message] of notifications) {
+                if (channel[1] !== 'whatsapp.session' || channel[2] !== this.sessionId) {
+                    continue;
+                }
+                if (message.type === 'connection_update') {
+                    this._applyState(message.state);
+                } else if (message.type === 'qr_update') {
+                    // Versioned URL: the browser fetches each QR image once
+                    this.qrCodeData = `/whatsapp/qr_code/${this.sessionId}?v=${message.qr_code_hash}`;
+                    this.$('.o_whatsapp_qr_code img').attr('src', this.qrCodeData);
+                }
+            }
+        },
+
         _onConnectionSuccess: function () {
-            clearInterval(this.checkInterval);
             this.do_notify(_t('WhatsApp Connected'), _t('Successfully connected to WhatsApp!'));
             this.destroy_action();
             core.bus.trigger('whatsapp_connected', { session_id: this.sessionId });
         },
 
         _onConnectionFailure: function () {
-            clearInterval(this.checkInterval);
             this.do_warn(_t('Connection Failed'), _t('Failed to connect to WhatsApp. Please try again.'));
             this.destroy_action();
         },
@@ -108,8 +198,68 @@ odoo.define('whatsapp_integration.chat', [
     });
 
     core.action_registry.add('whatsapp_qr_code', WhatsAppQRCode);
+
+    // WhatsApp Chat List Client Action: shows the cached list at once, then
+    // catches up with sync_chats and follows the session's chat_update
+    // notifications, so reopening it never reloads the whole list.
+    const WhatsAppChatList = Widget.extend({
+        template: 'whatsapp_integration.ChatList',
+
+        init: function (parent, options) {
+            this._super.apply(this, arguments);
+            this.sessionId = options.params.session_id;
+            this.cache = new ChatListCache(this._rpc.bind(this), this.sessionId);
+            this.chats = this.cache.list();
+        },
+
+        start: function () {
+            const result = this._super.apply(this, arguments);
+            this.call('bus_service', 'onNotification', this, this._onNotification);
+            this.call('bus_service', 'startPolling');
+            this._sync();
+            return result;
+        },
+
+        _sync: function () {
+            return this.cache.sync().then(chats => this._render(chats));
+        },
+
+        _render: function (chats) {
+            if (this.isDestroyed()) {
+                return;
+            }
+            this.chats = chats;
+            this.renderElement();
+        },
+
+        _onNotification: function (notifications) {
+            for (const [channel, message] of notifications) {
+                if (channel[1] !== 'whatsapp.session' || channel[2] !== this.sessionId ||
+                        message.type !== 'chat_update') {
+                    continue;
+                }
+                const unknown = message.chats.some(chat => !this.cache.chats.has(chat.id));
+                this.cache.applyNotification(message);
+                this._render(this.cache.list());
+                if (unknown) {
+                    // New chats come without a name: fetch it with a delta
+                    clearTimeout(this._syncTimer);
+                    this._syncTimer = setTimeout(() => this._sync(), 1000);
+                }
+            }
+        },
+
+        destroy: function () {
+            clearTimeout(this._syncTimer);
+            this._super.apply(this, arguments);
+        },
+    });
+
+    core.action_registry.add('whatsapp_chat_list', WhatsAppChatList);
     
     return {
+        ChatListCache: ChatListCache,
+        WhatsAppChatList: WhatsAppChatList,
         WhatsAppQRCode: WhatsAppQRCode,
     };
 });
@@ -0,0 +1,294 @@
+from odoo import api, fields, models, tools, _
+from psycopg2.extras import execute_values
+from datetime import datetime
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def _preview(message):
+    """Chat list line for a message: its text, or its media type"""
+    if message.content:
+        return message.content[:255]
+    return f"[{message.message_type}]" if message.message_type not in (False, "text") else ""
+
+
+class WhatsAppChat(models.Model):
+    """Per-chat summary maintained incrementally from whatsapp.message.
+
+    Rows are upserted when messages are created and their unread counter is
+    adjusted when messages are marked read, so the chat list and the Discuss
+    badge are single indexed reads instead of scans over the message table.
+    """
+
+    _name = "whatsapp.chat"
+    _description = "WhatsApp Chat"
+    _order = "last_message_date desc, id desc"
+
+    session_id = fields.Many2one(
+        "whatsapp.session", string="Session", required=True, ondelete="cascade"
+    )
+    chat_id = fields.Char(string="Chat ID", required=True)
+    name = fields.Char(string="Contact Name", compute="_compute_name")
+    last_message = fields.Char(string="Last Message")
+    last_message_date = fields.Datetime(string="Last Message Date")
+    unread_count = fields.Integer(string="Unread Messages", default=0)
+    # Unix timestamp up to which history was pulled from the bridge
+    sync_timestamp = fields.Integer(string="Synced Until", default=0)
+    # First incoming message not answered yet, see whatsapp.analytics
+    awaiting_since = fields.Datetime(string="Awaiting Response Since")
+    # Marked read in Odoo, the phone not told yet (see whatsapp.session.mark_chats_read)
+    read_pending = fields.Boolean(string="Read Receipt Pending", default=False, readonly=True)
+
+    _sql_constraints = [
+        ("session_chat_uniq", "unique(session_id, chat_id)",
+         "A chat can only be listed once per session."),
+    ]
+
+    def _compute_name(self):
+        Contact = self.env["whatsapp.contact"]
+        for session in self.session_id:
+            chats = self.filtered(lambda chat: chat.session_id == session)
+            names = Contact._resolve_names(session.id, chats.mapped("chat_id"))
+            for chat in chats:
+                chat.name = names.get(chat.chat_id)
+
+    def write(self, vals):
+        result = super().write(vals)
+        self._touch([(chat.session_id.id, chat.chat_id) for chat in self])
+        return result
+
+    def unlink(self):
+        self.flush()
+        self.env.cr.execute(
+            """
+            INSERT INTO whatsapp_chat_tombstone AS tombstone (session_id, chat_id, sync_txid)
+            SELECT session_id, chat_id, txid_current() FROM whatsapp_chat WHERE id IN %s
+            ON CONFLICT (session_id, chat_id) DO UPDATE SET sync_txid = EXCLUDED.sync_txid
+            """,
+            (tuple(self.ids) or (None,),),
+        )
+        return super().unlink()
+
+    @api.model
+    def _touch(self, keys):
+        """Report the ``(session_id, chat_id)`` chats as changed to delta
+        syncs, e.g. when their contact name changed
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        self.flush()
+        execute_values(
+            self.env.cr._obj,
+            """
+            UPDATE whatsapp_chat AS chat
+               SET sync_txid = txid_current()
+              FROM (VALUES %s) AS v(session_id, chat_id)
+             WHERE chat.session_id = v.session_id AND chat.chat_id = v.chat_id
+            """,
+            keys,
+        )
+        self.env["whatsapp.session"]._queue_chat_notification(keys)
+
+    def init(self):
+        tools.create_index(
+            self._cr, "whatsapp_chat_session_date_index",
+            self._table, ["session_id", "last_message_date DESC", "id DESC"],
+        )
+        # Transaction that last changed the chat, for delta syncs (see
+        # whatsapp.session.sync_chats). A bigint the ORM has no field for,
+        # kept up to date by every statement touching a summary.
+        self._cr.execute("""
+            ALTER TABLE whatsapp_chat
+                ADD COLUMN IF NOT EXISTS sync_txid bigint NOT NULL DEFAULT txid_current()
+        """)
+        tools.create_index(
+            self._cr, "whatsapp_chat_session_sync_index",
+            self._table, ["session_id", "sync_txid", "id"],
+        )
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_chat_read_pending_index
+                ON whatsapp_chat (id) WHERE read_pending
+        """)
+        # First install on an existing history: build the summaries once
+        if tools.table_exists(self._cr, "whatsapp_message"):
+            self._cr.execute("SELECT 1 FROM whatsapp_chat LIMIT 1")
+            if not self._cr.fetchone():
+                self._rebuild()
+
+    @api.model
+    def _rebuild(self):
+        """Recompute every chat summary from the message table"""
+        self._cr.execute("""
+            INSERT INTO whatsapp_chat (session_id, chat_id, last_message,
+                        last_message_date, unread_count,
+                        create_uid, create_date, write_uid, write_date)
+            SELECT DISTINCT ON (m.session_id, m.chat_id)
+                   m.session_id, m.chat_id,
+                   coalesce(nullif(left(m.content, 255), ''),
+                            CASE WHEN m.message_type != 'text' THEN '[' || m.message_type || ']' END),
+                   m.date,
+                   count(*) FILTER (WHERE m.direction = 'incoming'
+                                      AND (m.state != 'read' OR m.state IS NULL))
+                       OVER (PARTITION BY m.session_id, m.chat_id),
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM whatsapp_message m
+             WHERE m.chat_id IS NOT NULL
+          ORDER BY m.session_id, m.chat_id, m.date DESC, m.id DESC
+            ON CONFLICT (session_id, chat_id) DO UPDATE SET
+                last_message = EXCLUDED.last_message,
+                last_message_date = EXCLUDED.last_message_date,
+                unread_count = EXCLUDED.unread_count,
+                sync_txid = txid_current()
+        """, {"uid": self.env.uid})
+        self.invalidate_cache()
+
+    @api.model
+    def _apply_new_messages(self, messages):
+        """Fold newly created messages into their chat summaries"""
+        summaries = {}
+        for message in messages:
+            if not message.chat_id:
+                continue
+            key = (message.session_id.id, message.chat_id)
+            summary = summaries.setdefault(key, {"latest": message, "unread": 0})
+            if (message.date, message.id) > (summary["latest"].date, summary["latest"].id):
+                summary["latest"] = message
+            if message.direction == "incoming" and message.state != "read":
+                summary["unread"] += 1
+        if not summaries:
+            return
+
+        self.flush()
+        rows = [
+            (
+                session_id,
+                chat_id,
+                _preview(summary["latest"]),
+                summary["latest"].date,
+                summary["unread"],
+                self.env.uid,
+            )
+            for (session_id, chat_id), summary in summaries.items()
+        ]
+        execute_values(
+            self.env.cr._obj,
+            """
+            INSERT INTO whatsapp_chat AS chat (session_id, chat_id, last_message,
+                        last_message_date, unread_count,
+                        create_uid, create_date, write_uid, write_date)
+            SELECT v.session_id, v.chat_id, v.last_message, v.last_message_date,
+                   v.unread_count, v.uid, now() at time zone 'UTC', v.uid,
+                   now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(session_id, chat_id, last_message,
+                                    last_message_date, unread_count, uid)
+            ON CONFLICT (session_id, chat_id) DO UPDATE SET
+                last_message = CASE
+                    WHEN chat.last_message_date IS NULL
+                      OR EXCLUDED.last_message_date >= chat.last_message_date
+                    THEN EXCLUDED.last_message ELSE chat.last_message END,
+                last_message_date = GREATEST(chat.last_message_date,
+                                             EXCLUDED.last_message_date),
+                unread_count = chat.unread_count + EXCLUDED.unread_count,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date,
+                sync_txid = txid_current()
+            """,
+            rows,
+            template="(%s, %s, %s, %s::timestamp, %s, %s)",
+        )
+        self.invalidate_cache()
+        self.env["whatsapp.analytics"]._record_messages(messages)
+        self.env["whatsapp.session"]._queue_chat_notification(summaries)
+
+    @api.model
+    def _add_listed_chats(self, session_id, chats):
+        """Create the summaries of chats the bridge lists but no stored
+        message refers to yet; existing summaries are left alone
+        """
+        rows = [
+            (
+                session_id,
+                chat["id"],
+                (chat.get("last_message") or "")[:255],
+                datetime.utcfromtimestamp(chat["timestamp"]) if chat.get("timestamp") else None,
+                self.env.uid,
+            )
+            for chat in chats
+            if chat.get("id")
+        ]
+        if not rows:
+            return
+        self.flush()
+        added = execute_values(
+            self.env.cr._obj,
+            """
+            INSERT INTO whatsapp_chat (session_id, chat_id, last_message,
+                        last_message_date, unread_count,
+                        create_uid, create_date, write_uid, write_date)
+            SELECT v.session_id, v.chat_id, v.last_message, v.last_message_date, 0,
+                   v.uid, now() at time zone 'UTC', v.uid, now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(session_id, chat_id, last_message, last_message_date, uid)
+            ON CONFLICT (session_id, chat_id) DO NOTHING
+         RETURNING session_id, chat_id
+            """,
+            rows,
+            template="(%s, %s, %s, %s::timestamp, %s)",
+            fetch=True,
+        )
+        if added:
+            self.invalidate_cache()
+            self.env["whatsapp.session"]._queue_chat_notification([tuple(key) for key in added])
+
+    @api.model
+    def _adjust_unread(self, deltas):
+        """Apply ``{(session_id, chat_id): delta}`` to the unread counters"""
+        rows = [(session_id, chat_id, delta) for (session_id, chat_id), delta in deltas.items() if delta]
+        if not rows:
+            return
+        self.flush()
+        execute_values(
+            self.env.cr._obj,
+            """
+            UPDATE whatsapp_chat AS chat
+               SET unread_count = GREATEST(chat.unread_count + v.delta, 0),
+                   sync_txid = txid_current()
+              FROM (VALUES %s) AS v(session_id, chat_id, delta)
+             WHERE chat.session_id = v.session_id AND chat.chat_id = v.chat_id
+            """,
+            rows,
+        )
+        self.invalidate_cache(["unread_count"])
+        self.env["whatsapp.session"]._queue_chat_notification(deltas)
+
+
+class WhatsAppChatTombstone(models.Model):
+    """Chats deleted from a session, so delta syncs can tell clients to
+    drop them. A chat that comes back supersedes its tombstone.
+    """
+
+    _name = "whatsapp.chat.tombstone"
+    _description = "Deleted WhatsApp Chat"
+    _log_access = False
+
+    session_id = fields.Many2one(
+        "whatsapp.session", string="Session", required=True, ondelete="cascade"
+    )
+    chat_id = fields.Char(string="Chat ID", required=True)
+
+    _sql_constraints = [
+        ("session_chat_uniq", "unique(session_id, chat_id)",
+         "A chat can only be deleted once per session."),
+    ]
+
+    def init(self):
+        # Same role as whatsapp_chat.sync_txid
+        self._cr.execute("""
+            ALTER TABLE whatsapp_chat_tombstone
+                ADD COLUMN IF NOT EXISTS sync_txid bigint NOT NULL DEFAULT txid_current()
+        """)
+        tools.create_index(
+            self._cr, "whatsapp_chat_tombstone_session_sync_index",
+            self._table, ["session_id", "sync_txid"],
+        )
@@ -0,0 +1,184 @@
+from odoo import api, fields, models, tools, _
+from odoo.tools import lru
+from psycopg2.extras import execute_values
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 50000
+# How often a process looks for names the others changed
+CACHE_CHECK_INTERVAL = 1.0
+# Contacts written this long before the last check are looked at again:
+# write_date is the time a transaction started, not when it committed
+CACHE_CHECK_OVERLAP = 50
+
+# Cache lookup result for "not cached", as None is a cached value
+_MISSING = object()
+
+# Per database: LRU of contact names by (session id, chat id), None meaning
+# "no known contact", and the database time of the last invalidation check
+_name_caches = {}
+_cache_checks = {}
+_cache_lock = threading.Lock()
+
+
+def _evict(cache, key):
+    # odoo.tools.lru.LRU.pop() has no default
+    try:
+        del cache[key]
+    except KeyError:
+        pass
+
+
+class WhatsAppContact(models.Model):
+    """Contact names reported by the bridge, per session and chat.
+
+    Names are upserted in bulk from webhook batches and bridge chat lists.
+    Reads go through :meth:`_resolve_names`, which answers from a bounded
+    per-process LRU cache and fetches all misses in one query. At most once
+    a second, before trusting its cache, every process evicts the contacts
+    written since its last check.
+    """
+
+    _name = "whatsapp.contact"
+    _description = "WhatsApp Contact"
+    _order = "name, id"
+
+    session_id = fields.Many2one(
+        "whatsapp.session", string="Session", required=True, ondelete="cascade"
+    )
+    chat_id = fields.Char(string="Chat ID", required=True)
+    name = fields.Char(string="Name")
+
+    _sql_constraints = [
+        ("session_chat_uniq", "unique(session_id, chat_id)",
+         "A contact can only be listed once per session."),
+    ]
+
+    def init(self):
+        # Cache checks of the other processes
+        tools.create_index(
+            self._cr, "whatsapp_contact_write_date_index", self._table, ["write_date"]
+        )
+        # Names used to be stored on the chats: carry them over once
+        if tools.column_exists(self._cr, "whatsapp_chat", "name"):
+            self._cr.execute("SELECT 1 FROM whatsapp_contact LIMIT 1")
+            if not self._cr.fetchone():
+                self._cr.execute("""
+                    INSERT INTO whatsapp_contact (session_id, chat_id, name,
+                                create_uid, create_date, write_uid, write_date)
+                    SELECT session_id, chat_id, name,
+                           1, now() at time zone 'UTC', 1, now() at time zone 'UTC'
+                      FROM whatsapp_chat
+                     WHERE name IS NOT NULL
+                """)
+
+    @api.model
+    def _upsert_names(self, names):
+        """Record the names ``{(session_id, chat_id): name}`` the bridge
+        reported, touching only the contacts whose name changed
+        """
+        rows = [
+            (session_id, chat_id, name, self.env.uid)
+            for (session_id, chat_id), name in names.items()
+            if name
+        ]
+        if not rows:
+            return
+        self.flush()
+        changed = execute_values(
+            self.env.cr._obj,
+            """
+            INSERT INTO whatsapp_contact AS contact (session_id, chat_id, name,
+                        create_uid, create_date, write_uid, write_date)
+            SELECT v.session_id, v.chat_id, v.name,
+                   v.uid, now() at time zone 'UTC', v.uid, now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(session_id, chat_id, name, uid)
+            ON CONFLICT (session_id, chat_id) DO UPDATE SET
+                name = EXCLUDED.name,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+             WHERE contact.name IS DISTINCT FROM EXCLUDED.name
+         RETURNING session_id, chat_id
+            """,
+            rows,
+            fetch=True,
+        )
+        self.invalidate_cache(["name"])
+        if changed:
+            keys = [tuple(key) for key in changed]
+            self._invalidate_names(keys)
+            self.env["whatsapp.chat"]._touch(keys)
+
+    def _invalidate_names(self, keys):
+        """Drop ``(session_id, chat_id)`` keys from the name cache of this
+        process now; the other processes find them by their write_date
+        """
+        cache = self._name_cache(check=False)
+
+        def drop():
+            for key in keys:
+                _evict(cache, key)
+
+        drop()
+        # Whatever was cached from this transaction is void if it rolls back
+        self.env.cr.postrollback.add(drop)
+
+    @api.model
+    def _name_cache(self, check=True):
+        """This database's name cache, after evicting the contacts written
+        since the last check (at most once a second)
+        """
+        dbname = self.env.cr.dbname
+        with _cache_lock:
+            cache = _name_caches.get(dbname)
+            if cache is None:
+                cache = _name_caches[dbname] = lru.LRU(CACHE_SIZE)
+            last_check = _cache_checks.get(dbname)
+        if not check or (last_check and time.monotonic() - last_check[1] < CACHE_CHECK_INTERVAL):
+            return cache
+
+        self.env.cr.execute("SELECT now() at time zone 'UTC'")
+        now = self.env.cr.fetchone()[0]
+        if not last_check:
+            cache.clear()
+        else:
+            self.flush(["name"])
+            self.env.cr.execute(
+                """
+                SELECT session_id, chat_id FROM whatsapp_contact
+                 WHERE write_date >= %s - interval '%s seconds'
+                """,
+                (last_check[0], CACHE_CHECK_OVERLAP),
+            )
+            for key in self.env.cr.fetchall():
+                _evict(cache, key)
+        with _cache_lock:
+            _cache_checks[dbname] = (now, time.monotonic())
+        return cache
+
+    @api.model
+    def _resolve_names(self, session_id, chat_ids):
+        """``{chat_id: name or None}`` for the chats of a session, querying
+        only the chats missing from the cache, all at once
+        """
+        cache = self._name_cache()
+        names, missing = {}, []
+        for chat_id in chat_ids:
+            name = cache.get((session_id, chat_id), _MISSING)
+            if name is _MISSING:
+                missing.append(chat_id)
+            else:
+                names[chat_id] = name
+        if missing:
+            self.flush(["name"])
+            self.env.cr.execute(
+                "SELECT chat_id, name FROM whatsapp_contact WHERE session_id = %s AND chat_id = ANY(%s)",
+                (session_id, missing),
+            )
+            found = dict(self.env.cr.fetchall())
+            for chat_id in missing:
+                names[chat_id] = cache[(session_id, chat_id)] = found.get(chat_id)
+        return names
@@ -0,0 +1,344 @@
+"""Stand-in for the Node.js WhatsApp bridge, for benchmarks and local runs.
+
+It speaks the same HTTP API as ``whatsapp_bridge.js`` without a browser or
+a phone: every started session pairs after ``pair_delay`` seconds, sends
+succeed instantly, and an emitter thread posts signed webhook batches of
+incoming messages, acks and QR rotations to Odoo at a configurable rate.
+Only the standard library is used so it can run next to any Odoo.
+
+Run it on its own::
+
+    python whatsapp_fake_bridge.py --port 3000 --odoo-url http://localhost:8069 --rate 200
+
+or embed it with :class:`FakeBridge` (``start()`` / ``stop()``).
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_logger = logging.getLogger(__name__)
+
+# 1x1 transparent PNG; the byte after the header is varied to rotate it
+QR_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+
+class FakeSession:
+    def __init__(self, key, secret):
+        self.key = key
+        self.secret = secret
+        self.started_at = time.time()
+        self.connected_at = None
+        self.qr_version = 0
+        self.sent = []  # message ids waiting for an ack
+        self.history = {}  # chat_id -> [message dicts], oldest first
+
+    @property
+    def qr_png(self):
+        return QR_PNG + self.qr_version.to_bytes(4, "big")
+
+
+class FakeBridge:
+    """In-process fake bridge.
+
+    :param odoo_url: where to post webhook batches; ``None`` disables the emitter
+    :param rate: incoming messages per second across all sessions
+    :param chats: number of distinct chats per session messages are spread over
+    :param batch_size: events per webhook request
+    :param pair_delay: seconds after ``/start`` before a session is connected
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, odoo_url=None, rate=0.0,
+                 chats=50, batch_size=100, pair_delay=0.0):
+        self.odoo_url = odoo_url
+        self.rate = rate
+        self.chats = chats
+        self.batch_size = batch_size
+        self.pair_delay = pair_delay
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+        self.stats = {"sent": 0, "emitted": 0, "webhook_errors": 0}
+        self._stop = threading.Event()
+        self._threads = []
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._spawn(self.server.serve_forever)
+        if self.odoo_url and self.rate > 0:
+            self._spawn(self._emit_loop)
+        _logger.info("Fake WhatsApp bridge listening on %s", self.url)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def _spawn(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    # Session lifecycle
+
+    def add_session(self, key, secret):
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = FakeSession(key, secret)
+            session.secret = secret
+            return session
+
+    def _state(self, session):
+        if session.connected_at is None and time.time() - session.started_at >= self.pair_delay:
+            session.connected_at = time.time()
+        return "connected" if session.connected_at else "connecting"
+
+    # Webhook emitter
+
+    def _emit_loop(self):
+        interval = self.batch_size / self.rate
+        while not self._stop.wait(interval):
+            with self.lock:
+                sessions = list(self.sessions.values())
+                connected = sum(self._state(s) == "connected" for s in sessions)
+            for session in sessions:
+                self._post(session, self._make_events(session, max(1, self.batch_size // max(connected, 1))))
+
+    def _make_events(self, session, count):
+        """Events of one webhook batch: a rotated QR code while the session
+        is pairing, then the pending acks and ``count`` incoming messages
+        """
+        now = int(time.time())
+        events = []
+        with self.lock:
+            if self._state(session) != "connected":
+                session.qr_version += 1
+                return [{
+                    "type": "connection_update",
+                    "status": "connecting",
+                    "qr_code": base64.b64encode(session.qr_png).decode(),
+                }]
+            acks, session.sent = session.sent, []
+            for message_id in acks:
+                events.append({"type": "status_update", "status": {"message_id": message_id, "status": "delivered"}})
+            for _i in range(count):
+                chat_id = f"{random.randrange(self.chats):012d}@c.us"
+                message = {
+                    "id": f"fake{next(self.counter)}",
+                    "chat_id": chat_id,
+                    "contact_name": f"Contact {chat_id[:12]}",
+                    "content": f"Fake message {random.random():.6f}",
+                    "timestamp": now,
+                }
+                session.history.setdefault(chat_id, []).append(dict(message, direction="incoming", state="delivered"))
+                events.append({"type": "message", "message": message})
+        return events
+
+    def _post(self, session, events):
+        body = json.dumps({"jsonrpc": "2.0", "params": {"session_id": session.key, "events": events}}).encode()
+        signature = "sha256=" + hmac.new(session.secret.encode(), body, hashlib.sha256).hexdigest()
+        request = urllib.request.Request(
+            f"{self.odoo_url}/whatsapp/hook",
+            data=body,
+            headers={"Content-Type": "application/json", "X-WhatsApp-Signature": signature},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                result = json.loads(response.read()).get("result") or {}
+            if result.get("error"):
+                raise ValueError(result["error"])
+            self.stats["emitted"] += len(events)
+        except Exception as e:
+            self.stats["webhook_errors"] += 1
+            _logger.warning("Fake bridge webhook failed: %s", e)
+
+    # HTTP API, mirroring whatsapp_bridge.js
+
+    def _handler_class(self):
+        bridge = self
+
+        class Handler(BaseHTTPRequestHandler):
+            routes = [
+                ("POST", re.compile(r"^/start$"), "start"),
+                ("GET", re.compile(r"^/qr_code/(?P<key>[^/]+)$"), "qr_code"),
+                ("GET", re.compile(r"^/status/(?P<key>[^/]+)$"), "status"),
+                ("POST", re.compile(r"^/statuses$"), "statuses"),
+                ("POST", re.compile(r"^/send$"), "send"),
+                ("GET", re.compile(r"^/chats/(?P<key>[^/]+)$"), "chats"),
+                ("GET", re.compile(r"^/messages/(?P<key>[^/]+)/(?P<chat>[^/]+)$"), "messages"),
+                ("POST", re.compile(r"^/read/(?P<key>[^/]+)$"), "read"),
+                ("POST", re.compile(r"^/stop/(?P<key>[^/]+)$"), "stop"),
+                ("POST", re.compile(r"^/logout/(?P<key>[^/]+)$"), "logout"),
+            ]
+
+            def log_message(self, format, *args):
+                _logger.debug("Fake bridge: " + format, *args)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def _dispatch(self, method):
+                url = urlparse(self.path)
+                for route_method, pattern, name in self.routes:
+                    match = pattern.match(url.path)
+                    if route_method == method and match:
+                        length = int(self.headers.get("Content-Length") or 0)
+                        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                        return getattr(self, "_" + name)(body, query, **match.groupdict())
+                self._json(404, {"error": "Not found"})
+
+            def _json(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _session(self, key, connected=False):
+                session = bridge.sessions.get(key)
+                if session is None:
+                    self._json(404, {"error": "Session not found"})
+                elif connected and bridge._state(session) != "connected":
+                    self._json(400, {"error": "WhatsApp not connected"})
+                    return None
+                return session
+
+            def _start(self, body, query):
+                if not body.get("session_id") or not body.get("webhook_secret"):
+                    return self._json(400, {"error": "Missing session ID or webhook secret"})
+                bridge.add_session(body["session_id"], body["webhook_secret"])
+                self._json(200, {"success": True})
+
+            def _qr_code(self, body, query, key):
+                session = self._session(key)
+                if session:
+                    png = session.qr_png
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/png")
+                    self.send_header("Content-Length", str(len(png)))
+                    self.end_headers()
+                    self.wfile.write(png)
+
+            def _status(self, body, query, key):
+                session = self._session(key)
+                if session:
+                    self._json(200, {"state": bridge._state(session), "connected_at": session.connected_at})
+
+            def _statuses(self, body, query):
+                statuses = {}
+                for key in body.get("session_ids") or []:
+                    session = bridge.sessions.get(key)
+                    statuses[key] = session and {
+                        "state": bridge._state(session), "connected_at": session.connected_at,
+                    }
+                self._json(200, {"statuses": statuses})
+
+            def _send(self, body, query):
+                session = self._session(body.get("session_id"), connected=True)
+                if session:
+                    message_id = f"fakeout{next(bridge.counter)}"
+                    with bridge.lock:
+                        session.sent.append(message_id)
+                        bridge.stats["sent"] += 1
+                    self._json(200, {"success": True, "message_id": message_id})
+
+            def _chats(self, body, query, key):
+                session = self._session(key, connected=True)
+                if session:
+                    with bridge.lock:
+                        chats = [
+                            {
+                                "id": chat_id,
+                                "name": f"Contact {chat_id[:12]}",
+                                "unread": 0,
+                                "timestamp": messages[-1]["timestamp"],
+                                "last_message": messages[-1]["content"],
+                            }
+                            for chat_id, messages in session.history.items()
+                        ]
+                    self._json(200, chats)
+
+            def _messages(self, body, query, key, chat):
+                session = self._session(key, connected=True)
+                if session:
+                    limit = int(query.get("limit") or 50)
+                    after = int(query.get("after") or 0)
+                    with bridge.lock:
+                        missed = [m for m in session.history.get(chat, []) if m["timestamp"] >= after]
+                    ids = [m["id"] for m in missed]
+                    start = ids.index(query["after_id"]) + 1 if query.get("after_id") in ids else 0
+                    self._json(200, {
+                        "messages": missed[start:start + limit],
+                        "has_more": len(missed) > start + limit,
+                        "truncated": False,
+                    })
+
+            def _read(self, body, query, key):
+                if not body.get("chat_ids") and not body.get("chat_id"):
+                    return self._json(400, {"error": "Missing chat ID"})
+                if self._session(key, connected=True):
+                    self._json(200, {"success": True, "failed": []})
+
+            def _stop(self, body, query, key):
+                return self._logout(body, query, key)
+
+            def _logout(self, body, query, key):
+                if self._session(key):
+                    with bridge.lock:
+                        bridge.sessions.pop(key, None)
+                    self._json(200, {"success": True})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--odoo-url", help="post webhook batches to this Odoo")
+    parser.add_argument("--rate", type=float, default=0.0, help="incoming messages per second")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--pair-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    bridge = FakeBridge(args.host, args.port, args.odoo_url, args.rate,
+                        args.chats, args.batch_size, args.pair_delay).start()
+    try:
+        while True:
+            time.sleep(10)
+            _logger.info("Fake bridge stats: %s", bridge.stats)
+    except KeyboardInterrupt:
+        bridge.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+from odoo import api, fields, models, _
+from datetime import timedelta
+import logging
+import json
+import threading
+
+from .whatsapp_metrics import instrumented
+
+_logger = logging.getLogger(__name__)
+
+
+class WhatsAppInbox(models.Model):
+    """Raw bridge events waiting to be applied.
+
+    The webhook only appends rows here; ``_cron_process_inbox`` drains them
+    in id order and applies them in bulk, so a slow transaction never blocks
+    the bridge and a retried batch never creates duplicate messages.
+    """
+
+    _name = "whatsapp.inbox"
+    _description = "WhatsApp Inbound Event"
+    _order = "id"
+
+    session_id = fields.Many2one(
+        "whatsapp.session", string="Session", required=True, ondelete="cascade"
+    )
+    event_type = fields.Char(string="Event Type", required=True)
+    payload = fields.Text(string="Payload", required=True)
+    state = fields.Selection(
+        [
+            ("pending", "Pending"),
+            ("done", "Done"),
+            ("error", "Error"),
+        ],
+        string="Status",
+        default="pending",
+        required=True,
+        index=True,
+    )
+    error = fields.Char(string="Error")
+
+    @api.model
+    def _enqueue_events(self, session, events):
+        """Store the events of a webhook batch and return one result per event"""
+        results = [None] * len(events)
+        vals_list, indexes = [], []
+        for index, event in enumerate(events):
+            if not isinstance(event, dict) or not event.get("type"):
+                results[index] = {"error": "Missing parameters"}
+                continue
+            vals_list.append(
+                {
+                    "session_id": session.id,
+                    "event_type": event["type"],
+                    "payload": json.dumps(event),
+                }
+            )
+            indexes.append(index)
+
+        if vals_list:
+            entries = self.create(vals_list)
+            for index, entry in zip(indexes, entries):
+                results[index] = {"success": True, "queued": entry.id}
+            self.env.ref("whatsapp_integration.ir_cron_whatsapp_inbox")._trigger()
+        return results
+
+    @instrumented("cron")
+    @api.model
+    def _cron_process_inbox(self, batch_size=1000, max_batches=50):
+        """Drain pending events in ordered chunks, committing after each one"""
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        for _batch in range(max_batches):
+            self.env.cr.execute(
+                """
+                SELECT id FROM whatsapp_inbox
+                 WHERE state = 'pending'
+              ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+                """,
+                (batch_size,),
+            )
+            entries = self.browse([row[0] for row in self.env.cr.fetchall()])
+            if not entries:
+                break
+            entries._process()
+            if auto_commit:
+                self.env.cr.commit()
+
+    def _process(self):
+        """Apply the events of these entries in one bulk pass.
+
+        When the bulk pass fails, entries are retried one by one so a single
+        malformed event cannot hold back the rest of the inbox.
+        """
+        try:
+            with self.env.cr.savepoint():
+                results = self._apply()
+        except Exception:
+            if len(self) == 1:
+                _logger.exception("Failed to apply WhatsApp inbox entry %s", self.id)
+                self.write({"state": "error", "error": _("Unexpected error")})
+                return
+            for entry in self:
+                entry._process()
+            return
+
+        by_state = {}
+        for entry, result in zip(self, results):
+            if result and result.get("error"):
+                by_state.setdefault(("error", result["error"]), []).append(entry.id)
+            else:
+                by_state.setdefault(("done", False), []).append(entry.id)
+        for (state, error), ids in by_state.items():
+            self.browse(ids).write({"state": state, "error": error})
+
+    def _apply(self):
+        return self.env["whatsapp.session"]._apply_webhook_events(
+            [(entry.session_id, json.loads(entry.payload)) for entry in self]
+        )
+
+    @api.autovacuum
+    def _gc_processed_entries(self, days=7):
+        """Drop applied events once they are old enough not to be useful"""
+        self.env.cr.execute(
+            "DELETE FROM whatsapp_inbox WHERE state = 'done' AND create_date < %s",
+            (fields.Datetime.now() - timedelta(days=days),),
+        )
@@ -1,10 +1,37 @@
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
 import logging
+import psycopg2
+
+from .whatsapp_metrics import instrumented
 
 _logger = logging.getLogger(__name__)
 
+# Outbox retry delay in seconds, doubled after every failed attempt
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_MAX_RETRY_DELAY = 3600
+
+
+def _dispatch_chat(client, rows):
+    """Send the messages of one chat in order, stopping at the first failure
+    so that later messages never overtake an earlier one.
+
+    Runs in a worker thread: it only gets plain values and never touches the
+    ORM.
+    """
+    results = []
+    for row in rows:
+        try:
+            message_id = client.send(row['session_key'], row['chat_id'], row['content'])
+            results.append((row, True, message_id))
+        except Exception as e:
+            results.append((row, False, str(e)))
+            break
+    return results
+
 class WhatsAppMessage(models.Model):
     _name = 'whatsapp.message'
     _description = 'WhatsApp Message'
@@ -16,6 +43,16 @@ class WhatsAppMessage(models.Model):
     chat_id = fields.Char(string='Chat ID')
     content = fields.Text(string='Content')
     date = fields.Datetime(string='Date', default=fields.Datetime.now)
+    message_type = fields.Selection([
+        ('text', 'Text'),
+        ('image', 'Image'),
+        ('audio', 'Audio'),
+        ('video', 'Video'),
+        ('document', 'Document'),
+        ('sticker', 'Sticker'),
+    ], string='Type', default='text')
+    # Media is shared by every message carrying the same content
+    attachment_id = fields.Many2one('ir.attachment', string='Media', ondelete='set null')
     direction = fields.Selection([
         ('incoming', 'Incoming'),
         ('outgoing', 'Outgoing')
@@ -27,7 +64,229 @@ class WhatsAppMessage(models.Model):
         ('read', 'Read'),
         ('failed', 'Failed')
     ], string='Status', default='pending')
-    
+    attempt_count = fields.Integer(string='Send Attempts', default=0)
+    next_attempt_date = fields.Datetime(string='Next Attempt')
+    error_message = fields.Char(string='Error')
+    # Queued by a whatsapp.broadcast: dispatched in a lane of its own, so
+    # interactive sends to the same chat never wait for a campaign's slots
+    broadcast = fields.Boolean(string='Broadcast', default=False, readonly=True)
+
+    _sql_constraints = [
+        ('session_message_uniq', 'unique(session_id, message_id)',
+         'A WhatsApp message can only be stored once per session.'),
+    ]
+
+    def init(self):
+        # Chat history, newest first: (session_id, chat_id) then (date, id)
+        tools.create_index(
+            self._cr, 'whatsapp_message_session_chat_date_index',
+            self._table, ['session_id', 'chat_id', 'date DESC', 'id DESC'],
+        )
+        # Retention scans: everything of a session older than a cutoff
+        tools.create_index(
+            self._cr, 'whatsapp_message_session_date_index',
+            self._table, ['session_id', 'date'],
+        )
+        # Unread counters and outbox scans
+        tools.create_index(
+            self._cr, 'whatsapp_message_session_direction_state_index',
+            self._table, ['session_id', 'direction', 'state'],
+        )
+        # Outbox depth across sessions, read on every metrics scrape
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_message_outbox_index
+                ON whatsapp_message (create_date)
+             WHERE direction = 'outgoing' AND state = 'pending'
+        """)
+        # Pending messages of an outbox lane, in dispatch order
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_message_outbox_lane_index
+                ON whatsapp_message (session_id, chat_id, broadcast, id)
+             WHERE direction = 'outgoing' AND state = 'pending'
+        """)
+        # Only unread incoming rows, which stay a tiny fraction of the table.
+        # The predicate matches what the ORM emits for ('state', '!=', 'read').
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_message_unread_index
+                ON whatsapp_message (session_id, chat_id)
+             WHERE direction = 'incoming'
+               AND (state != 'read' OR state IS NULL)
+        """)
+        # Full-text search; the expression must match SEARCH_TSVECTOR
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS whatsapp_message_content_fts_index
+                ON whatsapp_message
+             USING gin (to_tsvector('simple', coalesce(content, '')))
+        """)
+        # Substring search, when the pg_trgm extension can be enabled
+        try:
+            with self._cr.savepoint():
+                self._cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                self._cr.execute("""
+                    CREATE INDEX IF NOT EXISTS whatsapp_message_content_trgm_index
+                        ON whatsapp_message USING gin (content gin_trgm_ops)
+                """)
+        except psycopg2.Error:
+            _logger.warning("pg_trgm is not available, substring search on WhatsApp "
+                            "messages will not be indexed")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        messages = super().create(vals_list)
+        self.env['whatsapp.chat']._apply_new_messages(messages)
+        return messages
+
+    def write(self, vals):
+        if 'state' not in vals:
+            return super().write(vals)
+        unread_before = self._filter_unread()
+        res = super().write(vals)
+        unread_after = self._filter_unread()
+        deltas = {}
+        for message in unread_before - unread_after:
+            key = (message.session_id.id, message.chat_id)
+            deltas[key] = deltas.get(key, 0) - 1
+        for message in unread_after - unread_before:
+            key = (message.session_id.id, message.chat_id)
+            deltas[key] = deltas.get(key, 0) + 1
+        self.env['whatsapp.chat']._adjust_unread(deltas)
+        return res
+
+    def unlink(self):
+        deltas = {}
+        for message in self._filter_unread():
+            key = (message.session_id.id, message.chat_id)
+            deltas[key] = deltas.get(key, 0) - 1
+        res = super().unlink()
+        self.env['whatsapp.chat']._adjust_unread(deltas)
+        return res
+
+    @api.model
+    def _trigger_outbox(self, at=None):
+        self.env.ref('whatsapp_integration.ir_cron_whatsapp_outbox').sudo()._trigger(at)
+
+    @instrumented('cron')
+    @api.model
+    def _cron_dispatch_outbox(self, chat_limit=100, chat_batch=50, max_workers=8, max_attempts=5):
+        """Push pending outgoing messages to the bridge.
+
+        Each chat has two lanes, interactive and broadcast messages, so
+        campaign messages waiting for their rate-limited slot never hold back
+        a reply. The first pending message of each lane is claimed with SKIP
+        LOCKED, so concurrent dispatchers split the work by lane and a lane
+        is only ever handled by one of them. Lanes are sent concurrently,
+        messages within a lane sequentially, in id order and up to the first
+        one not due yet.
+        """
+        # Don't burn retry attempts on bridges known to be down
+        Node = self.env['whatsapp.bridge.node'].sudo()
+        clients = {node.id: node._client() for node in Node.search([('state', '!=', 'down')])}
+        clients[None] = Node._get_client()
+        available = {node_id: client for node_id, client in clients.items() if not client.circuit.is_open}
+        if len(available) < len(clients):
+            reset_timeout = max(client.circuit.reset_timeout for client in clients.values())
+            self._trigger_outbox(fields.Datetime.now() + timedelta(seconds=reset_timeout))
+        if not available:
+            return
+
+        self.flush()
+        self.env.cr.execute("""
+            SELECT m.session_id, m.chat_id, m.broadcast
+              FROM whatsapp_message m
+              JOIN whatsapp_session s ON s.id = m.session_id AND s.state = 'connected'
+               AND (s.bridge_node_id = ANY(%s) OR (s.bridge_node_id IS NULL AND %s))
+             WHERE m.direction = 'outgoing' AND m.state = 'pending'
+               AND (m.next_attempt_date IS NULL OR m.next_attempt_date <= now() at time zone 'UTC')
+               AND NOT EXISTS (
+                    SELECT 1 FROM whatsapp_message p
+                     WHERE p.session_id = m.session_id AND p.chat_id = m.chat_id
+                       AND p.broadcast = m.broadcast
+                       AND p.direction = 'outgoing' AND p.state = 'pending'
+                       AND p.id < m.id)
+          ORDER BY m.id
+             LIMIT %s
+               FOR UPDATE OF m SKIP LOCKED
+        """, ([node_id for node_id in available if node_id], None in available, chat_limit))
+        chats = self.env.cr.fetchall()
+        if not chats:
+            return
+
+        self.env.cr.execute("""
+            SELECT id, session_id, session_key, node_id, chat_id, broadcast, content, attempt_count FROM (
+                SELECT m.id, m.session_id, s.session_id AS session_key, s.bridge_node_id AS node_id,
+                       m.chat_id, m.broadcast, m.content, m.attempt_count,
+                       row_number() OVER lane AS rank,
+                       bool_or(m.next_attempt_date > now() at time zone 'UTC') OVER lane AS blocked
+                  FROM whatsapp_message m
+                  JOIN whatsapp_session s ON s.id = m.session_id
+                 WHERE m.direction = 'outgoing' AND m.state = 'pending'
+                   AND (m.session_id, m.chat_id, m.broadcast) IN %s
+                WINDOW lane AS (PARTITION BY m.session_id, m.chat_id, m.broadcast ORDER BY m.id)
+            ) pending
+             WHERE rank <= %s AND NOT coalesce(blocked, false)
+          ORDER BY id
+        """, (tuple(chats), chat_batch))
+        by_chat = {}
+        for row in self.env.cr.dictfetchall():
+            by_chat.setdefault((row['session_id'], row['chat_id'], row['broadcast']), []).append(row)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(by_chat))) as executor:
+            results = [
+                result
+                for chat_results in executor.map(
+                    lambda rows: _dispatch_chat(available[rows[0]['node_id']], rows), by_chat.values())
+                for result in chat_results
+            ]
+        self._apply_dispatch_results(results, max_attempts)
+        if len(chats) == chat_limit or any(len(rows) == chat_batch for rows in by_chat.values()):
+            # More work is waiting: run again right after this transaction
+            self._trigger_outbox()
+
+    @api.model
+    def _apply_dispatch_results(self, results, max_attempts):
+        now = fields.Datetime.now()
+        sent, failed, retry_at = [], [], None
+        for row, success, value in results:
+            if success:
+                sent.append((row['id'], value))
+                continue
+            attempts = row['attempt_count'] + 1
+            delay = min(OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_DELAY)
+            next_attempt = now + timedelta(seconds=delay)
+            state = 'failed' if attempts >= max_attempts else 'pending'
+            if state == 'pending':
+                retry_at = min(retry_at or next_attempt, next_attempt)
+            failed.append((row['id'], state, attempts, next_attempt, value[:255]))
+
+        if sent:
+            execute_values(self.env.cr._obj, """
+                UPDATE whatsapp_message m
+                   SET state = 'sent', message_id = v.message_id, error_message = NULL,
+                       next_attempt_date = NULL, write_date = now() at time zone 'UTC'
+                  FROM (VALUES %s) AS v(id, message_id)
+                 WHERE m.id = v.id
+            """, sent)
+            self.invalidate_cache()
+            # Outgoing messages only count in the analytics once they are out
+            self.env['whatsapp.analytics']._record_messages(self.browse([row[0] for row in sent]))
+        if failed:
+            _logger.warning("Failed to dispatch %s WhatsApp message(s)", len(failed))
+            execute_values(self.env.cr._obj, """
+                UPDATE whatsapp_message m
+                   SET state = v.state, attempt_count = v.attempts,
+                       next_attempt_date = v.next_attempt, error_message = v.error,
+                       write_date = now() at time zone 'UTC'
+                  FROM (VALUES %s) AS v(id, state, attempts, next_attempt, error)
+                 WHERE m.id = v.id
+            """, failed, template="(%s, %s, %s, %s::timestamp, %s)")
+        self.invalidate_cache()
+        if retry_at:
+            self._trigger_outbox(retry_at)
+
+    def _filter_unread(self):
+        """Incoming messages that count towards their chat's unread counter"""
+        return self.filtered(lambda m: m.direction == 'incoming' and m.state != 'read')
+
     @api.depends('chat_id', 'date')
     def _compute_name(self):
         for record in self:
@@ -0,0 +1,197 @@
+from odoo import api, fields, models, tools, _
+from datetime import timedelta
+from psycopg2.extras import execute_values
+import logging
+import threading
+import zlib
+
+from .whatsapp_metrics import instrumented
+
+_logger = logging.getLogger(__name__)
+
+
+class WhatsAppMessageArchive(models.Model):
+    """Cold storage for messages past their session's retention window.
+
+    Rows keep the id they had in whatsapp.message (``message_ref``) so chat
+    history cursors stay valid across the hot and archived ranges. Content
+    is stored zlib-compressed in the ``content_zlib`` bytea column, which is
+    only accessed through SQL.
+    """
+
+    _name = "whatsapp.message.archive"
+    _description = "Archived WhatsApp Message"
+    _order = "date desc, message_ref desc"
+
+    session_id = fields.Many2one(
+        "whatsapp.session", string="Session", required=True, ondelete="cascade"
+    )
+    message_ref = fields.Integer(string="Original Message", required=True)
+    message_id = fields.Char(string="Message ID")
+    chat_id = fields.Char(string="Chat ID")
+    date = fields.Datetime(string="Date")
+    direction = fields.Selection(
+        [("incoming", "Incoming"), ("outgoing", "Outgoing")], string="Direction"
+    )
+    state = fields.Selection(
+        [
+            ("pending", "Pending"),
+            ("sent", "Sent"),
+            ("delivered", "Delivered"),
+            ("read", "Read"),
+            ("failed", "Failed"),
+        ],
+        string="Status",
+    )
+    message_type = fields.Selection(
+        [
+            ("text", "Text"),
+            ("image", "Image"),
+            ("audio", "Audio"),
+            ("video", "Video"),
+            ("document", "Document"),
+            ("sticker", "Sticker"),
+        ],
+        string="Type",
+    )
+    attachment_id = fields.Many2one("ir.attachment", string="Media", ondelete="set null")
+    broadcast = fields.Boolean(string="Broadcast", default=False, readonly=True)
+    content = fields.Text(string="Content", compute="_compute_content")
+
+    def init(self):
+        tools.create_column(self._cr, self._table, "content_zlib", "bytea")
+        tools.create_index(
+            self._cr, "whatsapp_message_archive_session_chat_date_index",
+            self._table, ["session_id", "chat_id", "date DESC", "message_ref DESC"],
+        )
+        # Dedup of redelivered bridge events
+        tools.create_index(
+            self._cr, "whatsapp_message_archive_session_message_index",
+            self._table, ["session_id", "message_id"],
+        )
+
+    def _compute_content(self):
+        contents = self._read_contents(self.ids)
+        for record in self:
+            record.content = contents.get(record.id)
+
+    def _read_contents(self, ids):
+        if not ids:
+            return {}
+        self._cr.execute(
+            "SELECT id, content_zlib FROM whatsapp_message_archive WHERE id IN %s",
+            (tuple(ids),),
+        )
+        return {row[0]: _decompress(row[1]) for row in self._cr.fetchall()}
+
+    @api.model
+    def _fetch_history(self, session, chat_id, position, limit, direction):
+        """Archived counterpart of ``whatsapp.session._fetch_history``"""
+        query = """
+            SELECT message_ref AS id, message_id, content_zlib, date, direction, state,
+                   message_type, attachment_id
+              FROM whatsapp_message_archive
+             WHERE session_id = %s AND chat_id = %s
+        """
+        params = [session.id, chat_id]
+        if position:
+            query += " AND (date, message_ref) {} (%s, %s)".format(
+                ">" if direction == "newer" else "<"
+            )
+            params += list(position)
+        query += " ORDER BY date {0}, message_ref {0} LIMIT %s".format(
+            "ASC" if direction == "newer" else "DESC"
+        )
+        params.append(limit)
+        self._cr.execute(query, params)
+        rows = self._cr.dictfetchall()
+        for row in rows:
+            row["content"] = _decompress(row.pop("content_zlib"))
+            row["archived"] = True
+        return rows
+
+    @instrumented("cron")
+    @api.model
+    def _cron_archive_messages(self, chunk_size=5000, max_chunks=100):
+        """Move messages older than their session's retention into the
+        archive, one short transaction per chunk.
+
+        Unread incoming and unsent outgoing messages stay in the hot table:
+        they still feed unread counters and the outbox.
+        """
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        sessions = self.env["whatsapp.session"].search([("retention_days", ">", 0)])
+        chunks = 0
+        for session in sessions:
+            cutoff = fields.Datetime.now() - timedelta(days=session.retention_days)
+            while chunks < max_chunks:
+                moved = self._archive_chunk(session, cutoff, chunk_size)
+                if auto_commit:
+                    self.env.cr.commit()
+                chunks += 1
+                if moved < chunk_size:
+                    break
+
+    def _archive_chunk(self, session, cutoff, chunk_size):
+        self.env["whatsapp.message"].flush()
+        self._cr.execute(
+            """
+            SELECT id, session_id, message_id, chat_id, content, date, direction, state,
+                   message_type, attachment_id, broadcast
+              FROM whatsapp_message
+             WHERE session_id = %s AND date < %s
+               AND NOT (direction = 'outgoing' AND state = 'pending')
+               AND NOT (direction = 'incoming' AND (state != 'read' OR state IS NULL))
+          ORDER BY date, id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+            """,
+            (session.id, cutoff, chunk_size),
+        )
+        rows = self._cr.fetchall()
+        if not rows:
+            return 0
+
+        execute_values(
+            self._cr._obj,
+            """
+            INSERT INTO whatsapp_message_archive
+                   (message_ref, session_id, message_id, chat_id, content_zlib,
+                    date, direction, state, message_type, attachment_id, broadcast,
+                    create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            """,
+            [
+                (id_, session_id, message_id, chat_id, _compress(content), date,
+                 direction, state, message_type, attachment_id, broadcast or False,
+                 self.env.uid, self.env.uid)
+                for id_, session_id, message_id, chat_id, content, date, direction, state,
+                    message_type, attachment_id, broadcast in rows
+            ],
+            template="(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, now() at time zone 'UTC', "
+                     "%s, now() at time zone 'UTC')",
+        )
+        self._cr.execute(
+            "DELETE FROM whatsapp_message WHERE id IN %s", (tuple(row[0] for row in rows),)
+        )
+        newest = max(row[5] for row in rows)
+        self._cr.execute(
+            """
+            UPDATE whatsapp_session
+               SET archived_until = GREATEST(archived_until, %s)
+             WHERE id = %s
+            """,
+            (newest, session.id),
+        )
+        self.env["whatsapp.message"].invalidate_cache()
+        session.invalidate_cache(["archived_until"])
+        _logger.info("Archived %s WhatsApp messages of session %s", len(rows), session.id)
+        return len(rows)
+
+
+def _compress(content):
+    return zlib.compress(content.encode(), 6) if content else None
+
+
+def _decompress(data):
+    return zlib.decompress(bytes(data)).decode() if data else False
@@ -0,0 +1,375 @@
+"""Low-overhead metrics for the WhatsApp integration.
+
+Routes, RPC methods and crons decorated with :func:`instrumented`, bridge
+calls and bus notifications are aggregated in-process into plain counters
+and fixed-bucket histograms. A background thread of each worker process
+dumps its totals to a file of a shared directory every ``FLUSH_INTERVAL``
+seconds (and at exit), and ``/whatsapp/metrics`` merges the files of all
+workers, so a scrape reports the whole server whichever worker answers it.
+Files of workers that are gone are folded into one aggregate file.
+
+Server configuration options:
+
+* ``whatsapp_metrics_dir``: where workers dump their totals (defaults to a
+  directory in the system temp dir)
+* ``whatsapp_slow_call_ms``: log instrumented calls slower than this
+* ``whatsapp_slow_call_sample``: fraction (0-1) of the slow calls to log
+"""
+import atexit
+import bisect
+import functools
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+from odoo.http import request
+from odoo.tools import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: files of dead workers are left as they are
+    fcntl = None
+
+_logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+FLUSH_INTERVAL = 5.0
+DEAD_FILE = "dead.json"
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "whatsapp_call_seconds": (
+        "histogram", "Latency of instrumented routes, RPC methods and crons", LATENCY_BUCKETS),
+    "whatsapp_call_queries": (
+        "histogram", "SQL queries per instrumented call", COUNT_BUCKETS),
+    "whatsapp_call_sql_seconds_total": (
+        "counter", "Time instrumented calls spent in SQL (HTTP requests only)", None),
+    "whatsapp_call_errors_total": (
+        "counter", "Instrumented calls that raised", None),
+    "whatsapp_webhook_batch_size": (
+        "histogram", "Events per webhook request", COUNT_BUCKETS),
+    "whatsapp_bridge_call_seconds": (
+        "histogram", "Latency of calls to the bridge", LATENCY_BUCKETS),
+    "whatsapp_bridge_call_errors_total": (
+        "counter", "Failed calls to the bridge", None),
+    "whatsapp_bus_notifications_total": (
+        "counter", "Bus notifications sent", None),
+}
+
+
+class Registry:
+    """Counters and histograms of this process, keyed by name and labels.
+
+    A counter series is ``[value]``; a histogram series is the per-bucket
+    (non-cumulative) counts followed by the sum and the count.
+    """
+
+    def __init__(self):
+        self._start()
+
+    def _start(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._dirty = False
+        self._flusher = None
+        self._pid = os.getpid()
+        # A reused PID must not take over the file of the process it had
+        self._filename = f"{self._pid}-{uuid.uuid4().hex[:12]}.json"
+
+    def _check_process(self):
+        # A forked worker starts with its own series, file and flusher
+        if self._pid != os.getpid():
+            self._start()
+
+    def inc(self, name, value=1, **labels):
+        self._check_process()
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0]
+            series[0] += value
+            self._dirty = True
+        self._ensure_flusher()
+
+    def observe(self, name, value, **labels):
+        self._check_process()
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(buckets) + 2)
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+            self._dirty = True
+        self._ensure_flusher()
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, list(labels), list(series)] for (name, labels), series in self._series.items()]
+
+    def _ensure_flusher(self):
+        # Recording stays in memory: files are only written by this thread
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(
+                        target=self._flush_loop, name="whatsapp-metrics", daemon=True
+                    )
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+
+    def flush(self):
+        """Dump this process's totals where :func:`collect` finds them"""
+        self._check_process()
+        if not self._series:
+            return
+        self._dirty = False
+        directory = metrics_dir()
+        path = os.path.join(directory, self._filename)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write_rows(temp_path, self.snapshot())
+            os.replace(temp_path, path)
+        except OSError as e:
+            _logger.warning("Could not write WhatsApp metrics to %s: %s", path, e)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def metrics_dir():
+    return config.get("whatsapp_metrics_dir") or os.path.join(
+        tempfile.gettempdir(), "odoo_whatsapp_metrics"
+    )
+
+
+def instrumented(kind, name=None):
+    """Record latency, SQL queries and errors of the decorated controller
+    route or model method under ``kind`` (``"route"``, ``"rpc"``, ``"cron"``)
+    and ``name`` (the function name by default).
+    """
+
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cr = _cursor(args)
+            queries, sql_time = _query_counters(cr)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                end_queries, end_sql_time = _query_counters(cr)
+                _record_call(
+                    kind, label, elapsed, end_queries - queries,
+                    None if sql_time is None else end_sql_time - sql_time, failed,
+                )
+
+        return wrapper
+
+    return decorate
+
+
+def _cursor(args):
+    env = getattr(args[0], "env", None) if args else None
+    if env is None and request:
+        env = request.env
+    return env.cr if env is not None else None
+
+
+def _query_counters(cr):
+    """SQL queries and time so far; Odoo only tracks the time per thread
+    while serving HTTP requests, elsewhere the cursor's count is used.
+    """
+    thread = threading.current_thread()
+    if hasattr(thread, "query_time"):
+        return thread.query_count, thread.query_time
+    return (cr.sql_log_count if cr is not None else 0), None
+
+
+def _record_call(kind, name, elapsed, queries, sql_time, failed):
+    registry.observe("whatsapp_call_seconds", elapsed, kind=kind, name=name)
+    registry.observe("whatsapp_call_queries", queries, kind=kind, name=name)
+    if sql_time is not None:
+        registry.inc("whatsapp_call_sql_seconds_total", sql_time, kind=kind, name=name)
+    if failed:
+        registry.inc("whatsapp_call_errors_total", kind=kind, name=name)
+
+    threshold = config.get("whatsapp_slow_call_ms")
+    if (
+        threshold
+        and elapsed * 1000 >= float(threshold)
+        and random.random() < float(config.get("whatsapp_slow_call_sample") or 1)
+    ):
+        _logger.warning(
+            "Slow WhatsApp %s %s: %.0f ms, %s queries%s%s",
+            kind, name, elapsed * 1000, queries,
+            "" if sql_time is None else f", {sql_time * 1000:.0f} ms in SQL",
+            ", failed" if failed else "",
+        )
+
+
+def collect():
+    """Totals of every worker process, this one included"""
+    registry.flush()
+    directory = metrics_dir()
+    _fold_dead(directory)
+    merged = {}
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        filenames = []
+    for filename in filenames:
+        if filename.endswith(".json"):
+            _merge(merged, _read_rows(os.path.join(directory, filename)) or ())
+    return merged
+
+
+def _fold_dead(directory):
+    """Add the files of workers that are gone to the ``DEAD_FILE`` totals
+    and remove them, so their counts are kept without one file per worker
+    ever started piling up
+    """
+    if fcntl is None:
+        return
+    try:
+        dead = [
+            filename for filename in os.listdir(directory)
+            if filename.endswith(".json") and not _alive(_file_pid(filename))
+        ]
+    except OSError:
+        return
+    if not dead:
+        return
+    dead_path = os.path.join(directory, DEAD_FILE)
+    try:
+        with open(os.path.join(directory, ".fold.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            totals = {}
+            _merge(totals, _read_rows(dead_path) or ())
+            folded = []
+            for filename in dead:
+                path = os.path.join(directory, filename)
+                rows = _read_rows(path)
+                if rows is None:
+                    # Folded by another worker in the meantime
+                    continue
+                _merge(totals, rows)
+                folded.append(path)
+            if not folded:
+                return
+            rows = [[name, list(labels), series] for (name, labels), series in totals.items()]
+            _write_rows(f"{dead_path}.tmp", rows)
+            os.replace(f"{dead_path}.tmp", dead_path)
+            for path in folded:
+                os.unlink(path)
+    except OSError as e:
+        _logger.warning("Could not fold WhatsApp metrics of dead workers in %s: %s", directory, e)
+
+
+def _file_pid(filename):
+    """PID of the worker that wrote ``filename``, None for the aggregate"""
+    pid = filename[:-len(".json")].split("-")[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def _alive(pid):
+    if pid is None:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_rows(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_rows(path, rows):
+    with open(path, "w") as f:
+        json.dump(rows, f)
+
+
+def _merge(merged, rows):
+    for name, labels, series in rows:
+        key = (name, tuple(tuple(label) for label in labels))
+        total = merged.get(key)
+        merged[key] = series if total is None else [a + b for a, b in zip(total, series)]
+
+
+def render(series, gauges=()):
+    """Prometheus text exposition of merged ``series`` and of ``gauges``,
+    given as ``(name, help, [(labels, value)])`` with ``labels`` a dict.
+    """
+    by_name = {}
+    for (name, labels), values in sorted(series.items()):
+        if name in METRICS:
+            by_name.setdefault(name, []).append((labels, values))
+
+    lines = []
+    for name, rows in by_name.items():
+        kind, help_, buckets = METRICS[name]
+        lines += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+        for labels, values in rows:
+            if kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {_number(values[0])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(values[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {values[-1]}")
+
+    for name, help_, samples in gauges:
+        lines += [f"# HELP {name} {help_}", f"# TYPE {name} gauge"]
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
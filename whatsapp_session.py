@@ -1,17 +1,141 @@
 from io import BytesIO
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import logging
 import json
+import re
 import base64
-import requests
+import hashlib
+import html
 import tempfile
 import os
+import psycopg2
+from psycopg2.extras import execute_values
+import secrets
+import threading
 import qrcode
 
+from .whatsapp_bridge_client import BridgeError
+from .whatsapp_metrics import instrumented, registry as metrics
+
 _logger = logging.getLogger(__name__)
 
+# Columns returned for each message of a chat history page
+HISTORY_FIELDS = [
+    "id", "message_id", "content", "date", "direction", "state", "message_type", "attachment_id",
+]
+
+# whatsapp-web.js message types -> whatsapp.message message_type
+MEDIA_TYPES = {
+    "chat": "text",
+    "image": "image",
+    "video": "video",
+    "audio": "audio",
+    "ptt": "audio",
+    "document": "document",
+    "sticker": "sticker",
+}
+
+# Backoff of the supervisor's automatic restarts: doubles from the base
+# delay for every consecutive failed restart, up to the cap (seconds)
+RESTART_BACKOFF = 30
+RESTART_BACKOFF_MAX = 3600
+
+# Must match the expression of whatsapp_message_content_fts_index
+SEARCH_TSVECTOR = "to_tsvector('simple', coalesce(m.content, ''))"
+
+
+def _pack_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _unpack_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise UserError(_("Invalid cursor."))
+
+
+def _encode_cursor(message):
+    """Opaque, URL-safe cursor for the (date, id) position of a message"""
+    return _pack_cursor([fields.Datetime.to_string(message["date"]), message["id"]])
+
+
+def _decode_cursor(cursor):
+    try:
+        date, record_id = _unpack_cursor(cursor)
+        return fields.Datetime.to_datetime(date), int(record_id)
+    except (ValueError, TypeError):
+        raise UserError(_("Invalid chat history cursor."))
+
+
+def _add_media_urls(messages):
+    """Replace the attachment of history rows by the URL serving it"""
+    for message in messages:
+        attachment = message.pop("attachment_id", None)
+        message["media_url"] = attachment and f"/whatsapp/media/{message['id']}" or False
+    return messages
+
+
+def _substring_snippet(content, needle, width=60):
+    """HTML-escaped excerpt of ``content`` around ``needle``, highlighted"""
+    content = content or ""
+    start = content.lower().find(needle.lower())
+    if start < 0:
+        return html.escape(content[: 2 * width])
+    end = start + len(needle)
+    return "%s%s<mark>%s</mark>%s%s" % (
+        "…" if start > width else "",
+        html.escape(content[max(start - width, 0):start]),
+        html.escape(content[start:end]),
+        html.escape(content[end:end + width]),
+        "…" if end + width < len(content) else "",
+    )
+
+
+def _fetch_missed(client, session_key, chat_id, after, page_size, max_pages):
+    """Pull the messages of one chat from ``after`` on, paging forward from
+    the id of the last message received.
+
+    Runs in a worker thread: it only talks to the bridge and never touches
+    the ORM. Returns the messages, the new high-water mark and whether the
+    bridge could not reach back to ``after``, in which case the mark stays
+    where it was so the gap is not skipped over.
+    """
+    messages, cursor, truncated = [], None, False
+    for _page in range(max_pages):
+        page = client.messages(session_key, chat_id, after=after, limit=page_size, after_id=cursor)
+        batch = page.get("messages") or []
+        truncated = truncated or bool(page.get("truncated"))
+        messages += batch
+        if not batch or not page.get("has_more"):
+            break
+        cursor = batch[-1]["id"]
+    if truncated:
+        return chat_id, messages, after, True
+    # Out of pages: the next sync resumes from the last message received
+    return chat_id, messages, max([after] + [m["timestamp"] for m in messages]), False
+
+
+def _send_reads(client, session_key, chat_ids):
+    """Mark the chats of one session seen on the phone. Returns the chats to
+    retry: all of them when the call failed as a whole, none otherwise, as
+    a chat the phone cannot mark is not expected to work later either.
+
+    Runs in a worker thread: it only talks to the bridge and never touches
+    the ORM.
+    """
+    try:
+        failed = (client.read(session_key, chat_ids) or {}).get("failed")
+    except BridgeError as e:
+        _logger.warning("Could not send WhatsApp read receipts for %s: %s", session_key, e)
+        return chat_ids
+    if failed:
+        _logger.warning("WhatsApp could not mark %s chat(s) of %s read", len(failed), session_key)
+    return []
+
 
 class WhatsAppSession(models.Model):
     _name = "whatsapp.session"
@@ -24,6 +148,7 @@ class WhatsAppSession(models.Model):
     session_id = fields.Char(string="Session ID")
     qr_code = fields.Binary(string="QR Code")
     qr_code_data = fields.Char(string="QR Code Data")
+    qr_code_hash = fields.Char(string="QR Code Version", copy=False)
     state = fields.Selection(
         [
             ("disconnected", "Disconnected"),
@@ -53,115 +178,627 @@ class WhatsAppSession(models.Model):
     chat_list = fields.Text(string="Chat List")
     # New field to store the list of chats (JSON format)
     chat_list_json = fields.Text(string="Chat List JSON")
+    retention_days = fields.Integer(
+        string="Keep Messages (Days)",
+        default=0,
+        help="Messages older than this are moved to the archive. 0 keeps them forever.",
+    )
+    archived_until = fields.Datetime(string="Archived Until", readonly=True, copy=False)
+    broadcast_rate_limit = fields.Integer(
+        string="Broadcast Rate (per minute)",
+        default=30,
+        help="Maximum number of broadcast messages sent per minute. 0 means no limit.",
+    )
+    # End of the dispatch schedule already handed out to broadcast messages
+    broadcast_horizon = fields.Datetime(string="Broadcast Horizon", readonly=True, copy=False)
+    bridge_node_id = fields.Many2one(
+        "whatsapp.bridge.node",
+        string="Bridge Node",
+        readonly=True,
+        copy=False,
+        index=True,
+        ondelete="set null",
+    )
+    # Consecutive automatic restarts by the supervisor, and when it may try again
+    restart_count = fields.Integer(string="Restarts", readonly=True, copy=False, default=0)
+    next_restart_date = fields.Datetime(string="Next Restart", readonly=True, copy=False)
+    uptime_ids = fields.One2many("whatsapp.session.uptime", "session_id", string="Uptime History")
+    # Shared secret the bridge uses to sign webhook batches for this session
+    webhook_secret = fields.Char(
+        string="Webhook Secret",
+        copy=False,
+        groups="base.group_system",
+        default=lambda self: secrets.token_hex(32),
+    )
 
-    def generate_qr_code(self, *args, **kwargs):
+    def init(self):
+        # Adding the column filled every existing session with one shared
+        # default: give each of them a secret of its own. Bridges get the
+        # new secret on the next start; until then they retry the batches
+        # Odoo rejects.
+        self._cr.execute("""
+            SELECT id FROM whatsapp_session
+             WHERE webhook_secret IS NULL
+                OR webhook_secret IN (SELECT webhook_secret FROM whatsapp_session
+                                   GROUP BY webhook_secret HAVING count(*) > 1)
+        """)
+        ids = [row[0] for row in self._cr.fetchall()]
+        if ids:
+            execute_values(
+                self._cr._obj,
+                """
+                UPDATE whatsapp_session AS session SET webhook_secret = v.secret
+                  FROM (VALUES %s) AS v(id, secret) WHERE session.id = v.id
+                """,
+                [(session_id, secrets.token_hex(32)) for session_id in ids],
+            )
+            _logger.info("Regenerated the webhook secrets of %s WhatsApp sessions", len(ids))
+
+    def write(self, vals):
+        if "state" not in vals:
+            return super().write(vals)
+        changed = self.filtered(lambda session: session.state != vals["state"])
+        result = super().write(vals)
+        self.env["whatsapp.session.uptime"]._record_transitions(
+            {session.id: vals["state"] for session in changed}
+        )
+        return result
+
+    def _bridge(self):
+        """Shared, pooled client of the bridge node running this session's
+        WhatsApp client; the default bridge for an empty recordset or a
+        session not placed on a node.
+        """
+        Node = self.env["whatsapp.bridge.node"]
+        if not self:
+            return Node._get_client()
+        self.ensure_one()
+        node = self.sudo().bridge_node_id
+        return node._client() if node else Node._get_client()
+
+    def _ensure_session_key(self):
+        """Bridge-side identifier of this session, created on first use"""
+        self.ensure_one()
+        if not self.session_id:
+            self.session_id = (
+                f"session_{self.user_id.id}_{int(datetime.now().timestamp())}"
+            )
+        return self.session_id
+
+    def _start_bridge_client(self):
+        """Make sure the bridge runs a WhatsApp client for this session,
+        placing it on a bridge node first if its node no longer takes sessions
+        """
+        self.ensure_one()
+        key = self._ensure_session_key()
+        node = self.sudo().bridge_node_id
+        if not node or node.state != "active":
+            owner = self.env["whatsapp.bridge.node"]._owner(key)
+            if owner != node:
+                if node:
+                    self._stop_bridge_client()
+                self.sudo().bridge_node_id = owner
+        self._bridge().start(key, self.sudo().webhook_secret)
+
+    def _stop_bridge_client(self):
+        """Stop this session's client on its node without logging out"""
+        self.ensure_one()
+        node = self.sudo().bridge_node_id
+        if not self.session_id or node.state == "down":
+            return
         try:
-            response = requests.get(
-                "http://localhost:3000/get_qr_code"
-            )  # Fetch QR Code from Node.js API
+            self._bridge().stop(self.session_id)
+        except BridgeError as e:
+            if e.status != 404:
+                _logger.warning(
+                    "Could not stop WhatsApp session %s on bridge node %s: %s",
+                    self.id, node.name, e,
+                )
 
-            if response.status_code == 200:
-                qr_data = response.json().get("qr_data")  # Extract Base64 QR data
+    def _move_to_node(self, node):
+        """Run this session's WhatsApp client on ``node`` from now on.
 
-                if qr_data:
-                    # Remove 'data:image/png;base64,' prefix before decoding
-                    qr_base64 = qr_data.split(",")[1]
+        The old client is stopped without logging out: when the nodes share
+        their session storage the client resumes on the new node without
+        pairing again, otherwise the owner gets a new QR code to scan.
+        """
+        self.ensure_one()
+        running = self.state != "disconnected"
+        if running:
+            self._stop_bridge_client()
+        self.sudo().bridge_node_id = node
+        if running:
+            self._bridge().start(self.session_id, self.sudo().webhook_secret)
+            self._set_connection_state("connecting")
 
-                    # Convert Base64 to Binary and store in Odoo field
-                    self.qr_code_image = qr_base64
+    def generate_qr_code(self, *args, **kwargs):
+        try:
+            self._start_bridge_client()
+            qr_png = self._bridge().qr_code(self.session_id)
 
-                    return {"type": "ir.actions.client", "tag": "reload"}
+            # Convert PNG to Base64 and store in Odoo field
+            self.qr_code_image = base64.b64encode(qr_png)
 
-            raise UserError("Failed to get QR code from the server. Please try again.")
-        except Exception as e:
+            return {"type": "ir.actions.client", "tag": "reload"}
+        except BridgeError as e:
             raise UserError(f"Error generating WhatsApp QR code: {str(e)}")
 
     # Get Chat List
+    @instrumented("rpc")
     def get_chat_list(self, *args, **kwargs):
         try:
-            response = requests.get("http://localhost:3000/get-chats")
+            chats = self._bridge().chats(self._ensure_session_key())
 
-            if response.status_code == 200:
-                chats = response.json().get("chats")
+            if chats:
+                self._record_chat_names(chats)
+                self.env["whatsapp.chat"]._add_listed_chats(self.id, chats)
+                chat_names = [chat.get('name') for chat in chats if chat.get('name')]
+                chat_list, chat_list_json = ", ".join(chat_names), json.dumps(chats)
+                # Clients pick the chats up through sync_chats: no reload, and
+                # no write at all when nothing changed
+                if (chat_list, chat_list_json) != (self.chat_list, self.chat_list_json):
+                    self.write({"chat_list": chat_list, "chat_list_json": chat_list_json})
 
-                if chats:
-                    chat_names = [chat.get('name') for chat in chats if 'name' in chat]
-                    self.chat_list = ", ".join(chat_names)
-
-                    # Convert the list of chats to a string and store in Odoo field
-
-                    # Store the entire chat list as a JSON string in the database
-                    self.chat_list_json = json.dumps(chats)
-
-                    return {"type": "ir.actions.client", "tag": "reload"}
+                return {
+                    "type": "ir.actions.client",
+                    "tag": "display_notification",
+                    "params": {
+                        "message": _("%s chats loaded.") % len(chats),
+                        "type": "success",
+                    },
+                }
 
             raise UserError("Failed to get chats from the server. Please try again.")
 
-        except Exception as e:
+        except BridgeError as e:
             raise UserError(f"Error getting chat list: {str(e)}")
 
     def action_connect(self):
         """Initialize WhatsApp connection and generate QR code"""
         self.ensure_one()
+        try:
+            self._start_bridge_client()
+        except BridgeError as e:
+            raise UserError(_("Could not reach the WhatsApp bridge: %s") % e)
         self.state = "connecting"
-        # In a real implementation, this would call a server-side service
-        # that uses wwebjs to generate a QR code
         return {
             "type": "ir.actions.client",
             "tag": "whatsapp_qr_code",
             "params": {"session_id": self.id},
         }
 
+    def action_open_chat_list(self):
+        """Open the live chat list of this session"""
+        self.ensure_one()
+        return {
+            "type": "ir.actions.client",
+            "tag": "whatsapp_chat_list",
+            "name": _("WhatsApp Chats"),
+            "params": {"session_id": self.id},
+        }
+
     def action_disconnect(self):
         """Disconnect from WhatsApp"""
         self.ensure_one()
+        if self.session_id:
+            try:
+                self._bridge().logout(self.session_id)
+            except BridgeError as e:
+                # The session is dropped on our side either way
+                _logger.warning("WhatsApp bridge logout failed for %s: %s", self.session_id, e)
         self.state = "disconnected"
         self.session_id = False
+        self.sudo().bridge_node_id = False
         return True
 
+    @instrumented("rpc")
     def get_qr_code(self):
         """Generate and get QR code for WhatsApp Web connection"""
         self.ensure_one()
 
-        if not self.session_id:
-            # Create a new session ID
-            self.session_id = (
-                f"session_{self.user_id.id}_{int(datetime.now().timestamp())}"
-            )
+        self._ensure_session_key()
 
         try:
             # In a real implementation, this would call a Node.js service that uses whatsapp-web.js
             # For demonstration, we'll use the controller's API
             qr_code_url = f"/whatsapp/qr_code/{self.id}"
-            return {"qr_code": self.qr_code, "qr_code_url": qr_code_url}
+            if self.qr_code_hash:
+                qr_code_url += f"?v={self.qr_code_hash}"
+            return {"qr_code_url": qr_code_url, "qr_code_hash": self.qr_code_hash}
         except Exception as e:
             _logger.error("Error generating WhatsApp QR code: %s", e)
             raise UserError(_("Failed to generate WhatsApp QR code. Please try again."))
 
     def check_connection(self):
-        """Check WhatsApp connection status"""
+        """Check WhatsApp connection status with the bridge"""
         self.ensure_one()
+        self._supervise(max_restarts=0)
+        return {"state": self.state, "session_id": self.session_id}
 
-        try:
-            # In a real implementation, this would call a Node.js service that uses whatsapp-web.js
-            # For demonstration, we'll use the controller's API
-            status_url = f"/whatsapp/status/{self.id}"
+    @instrumented("cron")
+    @api.model
+    def _cron_supervise_sessions(self, max_restarts=20):
+        """Reconcile every started session with the bridge running it"""
+        self.search([("session_id", "!=", False)])._supervise(max_restarts=max_restarts)
 
-            # Simulate status check for demonstration
-            if self.state == "connecting":
-                # Simulate connection after 10 seconds
-                last_write = self.write_date
-                now = datetime.now()
+    def _supervise(self, max_restarts=20):
+        """Reconcile the connection state of these sessions with their bridges.
 
-                if (now - last_write).total_seconds() > 10:
-                    self.state = "connected"
-                    self.last_connected = now
+        Each bridge node is asked about all its sessions in one call; the
+        sessions whose state changed are updated with a single statement,
+        their transitions recorded in the uptime history and pushed to
+        their owners. Sessions the bridge dropped that were paired before
+        are restarted, at most ``max_restarts`` per run, with an
+        exponential backoff between consecutive attempts.
+        """
+        Node = self.env["whatsapp.bridge.node"]
+        by_node = {}
+        for session in self.filtered("session_id"):
+            node = session.sudo().bridge_node_id
+            if node.state != "down":
+                by_node.setdefault(node.id, []).append(session)
 
-            return {"state": self.state, "session_id": self.session_id}
-        except Exception as e:
-            _logger.error("Error checking WhatsApp connection: %s", e)
-            return {"state": "disconnected", "error": str(e)}
+        reported = {}
+        for node_id, sessions in by_node.items():
+            node = Node.browse(node_id)
+            client = node._client() if node else Node._get_client()
+            try:
+                statuses = client.statuses([session.session_id for session in sessions])
+            except BridgeError as e:
+                # Unknown is not disconnected: leave these sessions alone
+                _logger.warning("WhatsApp supervisor could not reach %s: %s", node.url or client.base_url, e)
+                continue
+            for session in sessions:
+                reported[session] = statuses.get(session.session_id)
 
+        now = fields.Datetime.now()
+        restartable = sorted(
+            (
+                session for session, status in reported.items()
+                if not status and session.last_connected
+                and (not session.next_restart_date or session.next_restart_date <= now)
+            ),
+            key=lambda session: session.next_restart_date or session.last_connected,
+        )
+        restarted = {}
+        for session in restartable[:max_restarts]:
+            try:
+                with self.env.cr.savepoint():
+                    session._start_bridge_client()
+                restarted[session] = True
+            except BridgeError as e:
+                _logger.warning("Could not restart WhatsApp session %s: %s", session.id, e)
+                restarted[session] = False
+
+        rows = []
+        for session, status in reported.items():
+            state = (status or {}).get("state")
+            if state not in ("connecting", "connected"):
+                state = "disconnected"
+            last_connected = session.last_connected
+            if state == "connected" and status.get("connected_at"):
+                last_connected = datetime.utcfromtimestamp(status["connected_at"]).replace(microsecond=0)
+            restart_count, next_restart = session.restart_count, session.next_restart_date
+            if session in restarted:
+                state = "connecting" if restarted[session] else state
+                next_restart = now + timedelta(
+                    seconds=min(RESTART_BACKOFF * 2 ** restart_count, RESTART_BACKOFF_MAX)
+                )
+                restart_count += 1
+            elif state == "connected":
+                restart_count, next_restart = 0, None
+            if (state, last_connected, restart_count, next_restart) != (
+                session.state, session.last_connected, session.restart_count, session.next_restart_date
+            ):
+                rows.append((session.id, state, last_connected, restart_count, next_restart))
+        if not rows:
+            return
+
+        transitions = {
+            row[0]: row[1] for row in rows if row[1] != self.browse(row[0]).state
+        }
+        self.flush()
+        execute_values(
+            self.env.cr._obj,
+            """
+            UPDATE whatsapp_session AS session
+               SET state = v.state, last_connected = v.last_connected,
+                   restart_count = v.restart_count, next_restart_date = v.next_restart,
+                   write_uid = v.uid, write_date = now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(id, state, last_connected, restart_count, next_restart, uid)
+             WHERE session.id = v.id
+            """,
+            [row + (self.env.uid,) for row in rows],
+            template="(%s, %s, %s::timestamp, %s, %s::timestamp, %s)",
+        )
+        self.invalidate_cache(["state", "last_connected", "restart_count", "next_restart_date"])
+        if not transitions:
+            return
+
+        self.env["whatsapp.session.uptime"]._record_transitions(transitions, at=now)
+        self.env["bus.bus"].sendmany(
+            [
+                (
+                    session._bus_channel(),
+                    {"type": "connection_update", "session_id": session.id, "state": state},
+                )
+                for session, state in zip(self.browse(list(transitions)), transitions.values())
+            ]
+        )
+        metrics.inc("whatsapp_bus_notifications_total", len(transitions), type="connection_update")
+        if "connected" in transitions.values():
+            # Catch up on whatever was missed while disconnected
+            self.env.ref("whatsapp_integration.ir_cron_whatsapp_sync").sudo()._trigger()
+
+    def _bus_channel(self):
+        """Bus channel the owner of this session listens to"""
+        self.ensure_one()
+        return (self._cr.dbname, "whatsapp.session", self.id)
+
+    @api.model
+    def _queue_chat_notification(self, keys, messages=None):
+        """Queue a notification of the owners of the ``(session_id, chat_id)``
+        chats in ``keys`` with their new summaries, and of the new
+        ``messages`` if given.
+
+        Everything queued in a transaction is coalesced into a single
+        notification per session, sent on the session's channel right
+        before commit.
+        """
+        precommit = self.env.cr.precommit
+        pending = precommit.data.get("whatsapp.chat_update")
+        if pending is None:
+            pending = precommit.data["whatsapp.chat_update"] = {}
+            precommit.add(self._send_chat_notifications)
+        for session_id, chat_id in keys:
+            pending.setdefault(session_id, [set(), []])[0].add(chat_id)
+        for message in messages or ():
+            pending.setdefault(message.session_id.id, [set(), []])[1].append(message.id)
+
+    def _send_chat_notifications(self):
+        pending = self.env.cr.precommit.data.get("whatsapp.chat_update")
+        if not pending:
+            return
+        # Savepoints may have rolled some of the queued rows back
+        sessions = self.sudo().browse(list(pending)).exists()
+        messages = self.env["whatsapp.message"].sudo().browse(
+            [message_id for _chat_ids, message_ids in pending.values() for message_id in message_ids]
+        ).exists()
+        chat_ids = {chat_id for chat_ids, _message_ids in pending.values() for chat_id in chat_ids}
+        chats = self.env["whatsapp.chat"].sudo().search_read(
+            [("session_id", "in", sessions.ids), ("chat_id", "in", list(chat_ids))],
+            ["session_id", "chat_id", "last_message", "last_message_date", "unread_count"],
+        )
+
+        notifications = []
+        for session in sessions:
+            wanted = pending[session.id][0]
+            notifications.append(
+                (
+                    session._bus_channel(),
+                    {
+                        "type": "chat_update",
+                        "session_id": session.id,
+                        "chats": [
+                            {
+                                "id": chat["chat_id"],
+                                "last_message": chat["last_message"] or "",
+                                "timestamp": chat["last_message_date"]
+                                and fields.Datetime.to_string(chat["last_message_date"]),
+                                "unread": chat["unread_count"],
+                            }
+                            for chat in chats
+                            if chat["session_id"][0] == session.id and chat["chat_id"] in wanted
+                        ],
+                        "messages": [
+                            {
+                                "id": message.id,
+                                "chat_id": message.chat_id,
+                                "content": message.content,
+                                "message_type": message.message_type,
+                                "media_url": message.attachment_id and f"/whatsapp/media/{message.id}" or False,
+                                "date": fields.Datetime.to_string(message.date),
+                            }
+                            for message in messages
+                            if message.session_id == session
+                        ],
+                    },
+                )
+            )
+        self.env["bus.bus"].sendmany(notifications)
+        metrics.inc("whatsapp_bus_notifications_total", len(notifications), type="chat_update")
+
+    def _set_connection_state(self, state, connected_at=None):
+        """Record a connection state reported by the bridge.
+
+        Only real transitions are written and pushed on the session's bus
+        channel, so repeated reports of the same state cost nothing.
+        """
+        self.ensure_one()
+        if state == self.state:
+            return False
+        vals = {"state": state}
+        if state == "connected":
+            vals["last_connected"] = connected_at or fields.Datetime.now()
+        self.write(vals)
+        self.env["bus.bus"].sendone(
+            self._bus_channel(),
+            {"type": "connection_update", "session_id": self.id, "state": state},
+        )
+        metrics.inc("whatsapp_bus_notifications_total", type="connection_update")
+        if state == "connected":
+            # Catch up on whatever was missed while disconnected
+            self.env.ref("whatsapp_integration.ir_cron_whatsapp_sync").sudo()._trigger()
+        return True
+
+    def _set_qr_code(self, qr_base64):
+        """Store a pairing QR code (base64 PNG) if it differs from the
+        current one, and tell the owner's QR screen to pick it up.
+        """
+        self.ensure_one()
+        version = hashlib.sha256(qr_base64.encode()).hexdigest()[:32]
+        if version == self.qr_code_hash:
+            return False
+        self.write(
+            {
+                "qr_code": qr_base64,
+                "qr_code_data": f"data:image/png;base64,{qr_base64}",
+                "qr_code_hash": version,
+            }
+        )
+        self.env["bus.bus"].sendone(
+            self._bus_channel(),
+            {"type": "qr_update", "session_id": self.id, "qr_code_hash": version},
+        )
+        metrics.inc("whatsapp_bus_notifications_total", type="qr_update")
+        return True
+
+    def action_sync_history(self):
+        """Pull the messages missed while Odoo was not receiving webhooks"""
+        for session in self:
+            session._sync_history()
+        return True
+
+    @instrumented("cron")
+    @api.model
+    def _cron_sync_history(self):
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        for session in self.search([("state", "=", "connected"), ("session_id", "!=", False)]):
+            try:
+                with self.env.cr.savepoint():
+                    session._sync_history()
+            except BridgeError as e:
+                _logger.warning("WhatsApp history sync failed for session %s: %s", session.id, e)
+            if auto_commit:
+                self.env.cr.commit()
+
+    def _sync_history(self, max_workers=4, page_size=200, max_pages=50):
+        """Backfill every chat whose last activity on the phone is past its
+        high-water mark. Chats are fetched concurrently from a bounded pool,
+        and their messages are deduplicated and bulk-inserted here.
+        """
+        self.ensure_one()
+        client = self._bridge()
+        chats = client.chats(self.session_id)
+        self._record_chat_names(chats)
+        marks = {
+            chat.chat_id: chat.sync_timestamp
+            for chat in self.env["whatsapp.chat"].search([("session_id", "=", self.id)])
+        }
+        todo = [
+            (chat["id"], marks.get(chat["id"], 0))
+            for chat in chats
+            if (chat.get("timestamp") or 0) > marks.get(chat["id"], 0)
+        ]
+        if not todo:
+            return 0
+
+        def fetch(item):
+            try:
+                return _fetch_missed(client, self.session_id, item[0], item[1], page_size, max_pages)
+            except BridgeError as e:
+                # One chat failing must not cost the others their backfill
+                _logger.warning("WhatsApp history sync of chat %s failed: %s", item[0], e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(todo))) as executor:
+            fetched = [result for result in executor.map(fetch, todo) if result]
+
+        stored = 0
+        for chat_id, messages, high_water, truncated in fetched:
+            if truncated:
+                _logger.warning(
+                    "WhatsApp history of chat %s has a gap the bridge cannot reach, "
+                    "it stays synced until %s", chat_id, high_water,
+                )
+            try:
+                with self.env.cr.savepoint():
+                    stored += self._store_synced_messages(chat_id, messages)
+                    self._set_sync_timestamp(chat_id, high_water)
+            except psycopg2.IntegrityError:
+                # Raced with the webhook on a message; the next sync picks it up
+                _logger.info("WhatsApp history sync of chat %s deferred", chat_id)
+        _logger.info("WhatsApp history sync stored %s messages for session %s", stored, self.id)
+        return stored
+
+    def _store_synced_messages(self, chat_id, messages):
+        """Create the messages of a chat not stored yet, hot or archived"""
+        Message = self.env["whatsapp.message"]
+        Archive = self.env["whatsapp.message.archive"].sudo()
+        ids = list({message["id"] for message in messages})
+        known = set()
+        for start in range(0, len(ids), 1000):
+            known.update(Message.search([
+                ("session_id", "=", self.id),
+                ("message_id", "in", ids[start:start + 1000]),
+            ]).mapped("message_id"))
+            if self.archived_until:
+                known.update(Archive.search([
+                    ("session_id", "=", self.id),
+                    ("chat_id", "=", chat_id),
+                    ("message_id", "in", ids[start:start + 1000]),
+                ]).mapped("message_id"))
+
+        vals_list = []
+        for message in messages:
+            if message["id"] in known:
+                continue
+            known.add(message["id"])
+            vals_list.append(
+                {
+                    "session_id": self.id,
+                    "chat_id": chat_id,
+                    "message_id": message["id"],
+                    "content": message.get("content"),
+                    "date": datetime.utcfromtimestamp(message["timestamp"]),
+                    "direction": message.get("direction", "incoming"),
+                    "state": message.get("state", "delivered"),
+                }
+            )
+        for start in range(0, len(vals_list), 1000):
+            Message.create(vals_list[start:start + 1000])
+        return len(vals_list)
+
+    def _set_sync_timestamp(self, chat_id, high_water):
+        # No summary yet when nothing was stored for the chat: create it, or
+        # the mark is lost and the chat is fetched from scratch every sync
+        self.env["whatsapp.chat"].flush(["sync_timestamp"])
+        self.env.cr.execute(
+            """
+            INSERT INTO whatsapp_chat AS chat (session_id, chat_id, unread_count, sync_timestamp,
+                        create_uid, create_date, write_uid, write_date)
+            VALUES (%(session)s, %(chat)s, 0, %(mark)s,
+                    %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC')
+            ON CONFLICT (session_id, chat_id) DO UPDATE
+               SET sync_timestamp = GREATEST(chat.sync_timestamp, EXCLUDED.sync_timestamp)
+            """,
+            {"session": self.id, "chat": chat_id, "mark": high_water, "uid": self.env.uid},
+        )
+        self.env["whatsapp.chat"].invalidate_cache(["sync_timestamp"])
+
+    def _pull_qr_code(self):
+        """Fetch the current QR code from the bridge, for when none was pushed"""
+        self.ensure_one()
+        try:
+            qr_png = self._bridge().qr_code(self._ensure_session_key())
+        except BridgeError as e:
+            _logger.info("No WhatsApp QR code available for session %s: %s", self.id, e)
+            return False
+        return self._set_qr_code(base64.b64encode(qr_png).decode())
+
+    def _pull_status(self):
+        """Connection status as reported by the bridge"""
+        self.ensure_one()
+        if not self.session_id:
+            return {"state": "disconnected"}
+        try:
+            return self._bridge().status(self.session_id)
+        except BridgeError as e:
+            if e.status == 404:
+                return {"state": "disconnected"}
+            return {"error": str(e)}
+
+    @instrumented("rpc")
     def check_active_session(self):
         """Check if user has an active WhatsApp session"""
         self.ensure_one()
@@ -179,6 +816,7 @@ class WhatsAppSession(models.Model):
 
         return {"active": False}
 
+    @instrumented("rpc")
     def get_channel(self):
         """Get or create WhatsApp channel for Discuss integration"""
 
@@ -193,17 +831,15 @@ class WhatsAppSession(models.Model):
         # Create virtual channel ID for WhatsApp
         channel_id = f"whatsapp_{active_session.id}"
 
-        # Get unread message count
-        unread_count = self.env["whatsapp.message"].search_count(
-            [
-                ("session_id", "=", active_session.id),
-                ("direction", "=", "incoming"),
-                ("state", "not in", ["read"]),
-            ]
+        # Unread count is maintained on the chat summaries
+        totals = self.env["whatsapp.chat"].read_group(
+            [("session_id", "=", active_session.id)], ["unread_count:sum"], []
         )
+        unread_count = (totals[0]["unread_count"] or 0) if totals else 0
 
         return {"channel_id": channel_id, "counter": unread_count}
 
+    @instrumented("rpc")
     def get_chats(self):
         """Get WhatsApp chats"""
         self.ensure_one()
@@ -211,29 +847,122 @@ class WhatsAppSession(models.Model):
         if self.state != "connected":
             return []
 
-        try:
-            # In a real implementation, this would call a Node.js service that uses whatsapp-web.js
-            # For demonstration, we'll return sample data
-            return [
-                {
-                    "id": "123456789@c.us",
-                    "name": "John Doe",
-                    "last_message": "Hello, how are you?",
-                    "timestamp": fields.Datetime.now(),
-                    "unread": 2,
-                },
+        chats = self.env["whatsapp.chat"].search_read(
+            [("session_id", "=", self.id)],
+            ["chat_id", "last_message", "last_message_date", "unread_count"],
+        )
+        names = self.env["whatsapp.contact"]._resolve_names(self.id, [chat["chat_id"] for chat in chats])
+        return [
+            {
+                "id": chat["chat_id"],
+                "name": names.get(chat["chat_id"]) or chat["chat_id"],
+                "last_message": chat["last_message"] or "",
+                "timestamp": chat["last_message_date"],
+                "unread": chat["unread_count"],
+            }
+            for chat in chats
+        ]
+
+    @instrumented("rpc")
+    def resolve_names(self, chat_ids):
+        """Contact names of ``chat_ids`` as ``{chat_id: name}``, False for
+        chats without a known contact
+        """
+        self.ensure_one()
+        names = self.env["whatsapp.contact"]._resolve_names(self.id, chat_ids)
+        return {chat_id: name or False for chat_id, name in names.items()}
+
+    def _record_chat_names(self, chats):
+        """Upsert the contact names of a bridge chat list"""
+        self.env["whatsapp.contact"]._upsert_names(
+            {(self.id, chat["id"]): chat.get("name") for chat in chats if chat.get("id")}
+        )
+
+    @instrumented("rpc")
+    def sync_chats(self, since_token=None, limit=500):
+        """Chats changed since ``since_token``, for clients keeping the chat
+        list in a local cache.
+
+        Changes are tracked by the transaction that last touched each chat:
+        a token holds the oldest transaction still running when it was
+        issued, so no commit slips between two syncs (a few chats may be
+        sent twice). Returns::
+
+            {"chats": [...], "removed": [chat_id, ...], "token": str,
+             "has_more": bool, "reset": bool}
+
+        With ``has_more``, call again with the returned token for the next
+        page. ``reset`` means the token could not be used: the client must
+        drop its cache, and the pages list every chat.
+        """
+        self.ensure_one()
+
+        since, upcoming, after, reset = 0, None, (0, 0), True
+        if since_token:
+            try:
+                values = _unpack_cursor(since_token)
+                if values[0] == self.id:
+                    since, upcoming, after, reset = values[1], values[2], (values[3], values[4]), False
+            except (UserError, TypeError, IndexError):
+                pass
+        if upcoming is None:
+            # First page of a pass: the next pass starts where this one sees
+            self.env.cr.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+            upcoming = self.env.cr.fetchone()[0]
+
+        self.env["whatsapp.chat"].flush()
+        self.env.cr.execute(
+            """
+            SELECT id, sync_txid, chat_id, last_message, last_message_date, unread_count
+              FROM whatsapp_chat
+             WHERE session_id = %s AND sync_txid >= %s AND (sync_txid, id) > (%s, %s)
+          ORDER BY sync_txid, id
+             LIMIT %s
+            """,
+            (self.id, since, after[0], after[1], limit + 1),
+        )
+        rows = self.env.cr.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        removed = []
+        if since and after == (0, 0):
+            self.env.cr.execute(
+                """
+                SELECT tombstone.chat_id
+                  FROM whatsapp_chat_tombstone tombstone
+                 WHERE tombstone.session_id = %s AND tombstone.sync_txid >= %s
+                   AND NOT EXISTS (SELECT 1 FROM whatsapp_chat chat
+                                    WHERE chat.session_id = tombstone.session_id
+                                      AND chat.chat_id = tombstone.chat_id)
+                """,
+                (self.id, since),
+            )
+            removed = [row[0] for row in self.env.cr.fetchall()]
+
+        names = self.env["whatsapp.contact"]._resolve_names(self.id, [row[2] for row in rows])
+        if has_more:
+            token = [self.id, since, upcoming, rows[-1][1], rows[-1][0]]
+        else:
+            token = [self.id, upcoming, None, 0, 0]
+        return {
+            "chats": [
                 {
-                    "id": "987654321@c.us",
-                    "name": "Jane Smith",
-                    "last_message": "Can you send me the document?",
-                    "timestamp": fields.Datetime.now(),
-                    "unread": 0,
-                },
-            ]
-        except Exception as e:
-            _logger.error("Error getting WhatsApp chats: %s", e)
-            return []
+                    "id": chat_id,
+                    "name": names.get(chat_id) or chat_id,
+                    "last_message": last_message or "",
+                    "timestamp": last_message_date and fields.Datetime.to_string(last_message_date),
+                    "unread": unread_count,
+                }
+                for _id, _txid, chat_id, last_message, last_message_date, unread_count in rows
+            ],
+            "removed": removed,
+            "token": _pack_cursor(token),
+            "has_more": has_more,
+            "reset": reset,
+        }
 
+    @instrumented("rpc")
     def get_chat_messages(self, chat_id, limit=50, before=None):
         """Get messages for a specific chat"""
         self.ensure_one()
@@ -246,24 +975,257 @@ class WhatsAppSession(models.Model):
         if before:
             domain.append(("date", "<", before))
 
-        messages = self.env["whatsapp.message"].search(
-            domain, order="date desc", limit=limit
+        messages = self.env["whatsapp.message"].search_read(
+            domain, HISTORY_FIELDS, order="date desc, id desc", limit=limit
         )
+        if len(messages) < limit and self.archived_until:
+            # Past the hot window: continue in the archive
+            last = messages[-1] if messages else before and {"date": fields.Datetime.to_datetime(before), "id": 0}
+            position = last and (last["date"], last["id"])
+            messages += self.env["whatsapp.message.archive"]._fetch_history(
+                self, chat_id, position, limit - len(messages), "older"
+            )
+        return _add_media_urls(messages)
 
-        return [
-            {
-                "id": msg.id,
-                "message_id": msg.message_id,
-                "content": msg.content,
-                "date": msg.date,
-                "direction": msg.direction,
-                "state": msg.state,
-            }
-            for msg in messages
-        ]
+    @instrumented("rpc")
+    def get_chat_history(self, chat_id, cursor=None, limit=50, direction="older"):
+        """Page through a chat with an opaque cursor stable on (date, id).
+
+        ``direction="older"`` walks back from the cursor (or from the newest
+        message), ``direction="newer"`` walks forward from it. Messages are
+        always returned newest first; ``next_cursor`` continues towards older
+        messages and ``prev_cursor`` towards newer ones.
+        """
+        self.ensure_one()
+
+        if self.state != "connected":
+            return {"messages": [], "next_cursor": False, "prev_cursor": False}
+
+        position = _decode_cursor(cursor) if cursor else None
+        messages = self._fetch_history(chat_id, position, limit + 1, direction)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if direction == "newer":
+            messages.reverse()
 
+        newest = messages and _encode_cursor(messages[0])
+        oldest = messages and _encode_cursor(messages[-1])
+        if direction == "newer":
+            next_cursor = oldest if position else False
+            prev_cursor = newest if has_more else False
+        else:
+            next_cursor = oldest if has_more else False
+            prev_cursor = newest if position else False
+        return {
+            "messages": _add_media_urls(messages),
+            "next_cursor": next_cursor or False,
+            "prev_cursor": prev_cursor or False,
+        }
+
+    @instrumented("rpc")
+    def get_unread_cursor(self, chat_id):
+        """Cursor from which ``get_chat_history(direction="newer")`` starts
+        at the oldest unread incoming message, or False if all are read.
+        """
+        self.ensure_one()
+        self.env["whatsapp.message"].flush(["session_id", "chat_id", "direction", "state"])
+        self.env.cr.execute(
+            """
+            SELECT date, id FROM whatsapp_message
+             WHERE session_id = %s AND chat_id = %s
+               AND direction = 'incoming'
+               AND (state != 'read' OR state IS NULL)
+          ORDER BY date, id
+             LIMIT 1
+            """,
+            (self.id, chat_id),
+        )
+        row = self.env.cr.fetchone()
+        if not row:
+            return False
+        # Sort just before the first unread message so it is included
+        return _encode_cursor({"date": row[0], "id": row[1] - 1})
+
+    def _fetch_history(self, chat_id, position, limit, direction):
+        """Read one page of history, reading through to the archive only
+        when the page reaches back past the newest archived message.
+        """
+        messages = self._fetch_hot_history(chat_id, position, limit, direction)
+        if not self.archived_until:
+            return messages
+
+        if direction == "newer":
+            needs_archive = not position or position[0] <= self.archived_until
+        else:
+            needs_archive = len(messages) < limit or messages[-1]["date"] <= self.archived_until
+        if not needs_archive:
+            return messages
+
+        archived = self.env["whatsapp.message.archive"]._fetch_history(
+            self, chat_id, position, limit, direction
+        )
+        messages = sorted(
+            messages + archived,
+            key=lambda message: (message["date"], message["id"]),
+            reverse=direction != "newer",
+        )
+        return messages[:limit]
+
+    def _fetch_hot_history(self, chat_id, position, limit, direction):
+        """Read one page of history columns in a single index range scan"""
+        self.env["whatsapp.message"].flush(HISTORY_FIELDS + ["session_id", "chat_id"])
+        query = "SELECT {} FROM whatsapp_message WHERE session_id = %s AND chat_id = %s".format(
+            ", ".join(HISTORY_FIELDS)
+        )
+        params = [self.id, chat_id]
+        if position:
+            query += " AND (date, id) {} (%s, %s)".format(
+                ">" if direction == "newer" else "<"
+            )
+            params += list(position)
+        query += " ORDER BY date {0}, id {0} LIMIT %s".format(
+            "ASC" if direction == "newer" else "DESC"
+        )
+        params.append(limit)
+        self.env.cr.execute(query, params)
+        return self.env.cr.dictfetchall()
+
+    @instrumented("rpc")
+    def search_messages(self, query, chat_id=None, date_from=None, date_to=None,
+                        mode="fulltext", limit=20, cursor=None):
+        """Search message content of this session.
+
+        ``mode="fulltext"`` ranks word matches with the GIN tsvector index,
+        ``mode="substring"`` finds any substring through the trigram index,
+        newest first. Results carry an HTML-escaped snippet with the matches
+        wrapped in ``<mark>`` and pages are chained with ``next_cursor``.
+        """
+        self.ensure_one()
+        query = (query or "").strip()
+        if not query:
+            return {"results": [], "next_cursor": False}
+
+        self.env["whatsapp.message"].flush(["session_id", "chat_id", "content", "date"])
+        where = ["m.session_id = %(session)s"]
+        params = {"session": self.id, "query": query, "limit": limit + 1}
+        if chat_id:
+            where.append("m.chat_id = %(chat)s")
+            params["chat"] = chat_id
+        if date_from:
+            where.append("m.date >= %(date_from)s")
+            params["date_from"] = date_from
+        if date_to:
+            where.append("m.date < %(date_to)s")
+            params["date_to"] = date_to
+
+        if mode == "substring":
+            rows = self._search_substring(where, params, cursor)
+            key = lambda row: [fields.Datetime.to_string(row["date"]), row["id"]]
+        elif mode == "fulltext":
+            rows = self._search_fulltext(where, params, cursor)
+            key = lambda row: [row["rank"], row["id"]]
+        else:
+            raise UserError(_("Unknown search mode: %s") % mode)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "results": [
+                {
+                    "id": row["id"],
+                    "chat_id": row["chat_id"],
+                    "date": row["date"],
+                    "direction": row["direction"],
+                    "snippet": row["snippet"],
+                }
+                for row in rows
+            ],
+            "next_cursor": _pack_cursor(key(rows[-1])) if has_more else False,
+        }
+
+    def _search_fulltext(self, where, params, cursor):
+        # Rank and page inside, then build headlines for the page rows only
+        if cursor:
+            params["rank"], params["after"] = _unpack_cursor(cursor)
+            where = where + ["(ts_rank({}, q)::float8, m.id) < (%(rank)s, %(after)s)".format(SEARCH_TSVECTOR)]
+        self.env.cr.execute(
+            """
+            SELECT page.id, page.chat_id, page.date, page.direction, page.rank,
+                   ts_headline('simple', page.escaped, plainto_tsquery('simple', %(query)s),
+                               'StartSel=<mark>, StopSel=</mark>, MaxFragments=2') AS snippet
+              FROM (
+                SELECT m.id, m.chat_id, m.date, m.direction,
+                       replace(replace(replace(coalesce(m.content, ''),
+                               '&', '&amp;'), '<', '&lt;'), '>', '&gt;') AS escaped,
+                       ts_rank({tsvector}, q)::float8 AS rank
+                  FROM whatsapp_message m, plainto_tsquery('simple', %(query)s) q
+                 WHERE {tsvector} @@ q AND {where}
+              ORDER BY rank DESC, m.id DESC
+                 LIMIT %(limit)s
+              ) page
+          ORDER BY page.rank DESC, page.id DESC
+            """.format(tsvector=SEARCH_TSVECTOR, where=" AND ".join(where)),
+            params,
+        )
+        return self.env.cr.dictfetchall()
+
+    def _search_substring(self, where, params, cursor):
+        if cursor:
+            date, params["after"] = _unpack_cursor(cursor)
+            params["before"] = fields.Datetime.to_datetime(date)
+            where = where + ["(m.date, m.id) < (%(before)s, %(after)s)"]
+        params["pattern"] = "%%%s%%" % re.sub(r"([\\%_])", r"\\\1", params["query"])
+        self.env.cr.execute(
+            """
+            SELECT m.id, m.chat_id, m.date, m.direction, m.content
+              FROM whatsapp_message m
+             WHERE m.content ILIKE %(pattern)s AND {where}
+          ORDER BY m.date DESC, m.id DESC
+             LIMIT %(limit)s
+            """.format(where=" AND ".join(where)),
+            params,
+        )
+        rows = self.env.cr.dictfetchall()
+        for row in rows:
+            row["snippet"] = _substring_snippet(row.pop("content"), params["query"])
+        return rows
+
+    def _reserve_broadcast_slots(self, count):
+        """Dispatch times for ``count`` more broadcast messages, spaced to
+        respect the broadcast rate limit (all False when there is none).
+
+        The schedule horizon is read under a row lock, so concurrent
+        broadcasts of the same session share one schedule.
+        """
+        self.ensure_one()
+        if not self.broadcast_rate_limit or not count:
+            return [False] * count
+        self.flush(["broadcast_horizon"])
+        self.env.cr.execute(
+            "SELECT broadcast_horizon FROM whatsapp_session WHERE id = %s FOR UPDATE", (self.id,)
+        )
+        horizon = self.env.cr.fetchone()[0]
+        now = fields.Datetime.now()
+        start = max(horizon, now) if horizon else now
+        interval = timedelta(minutes=1) / self.broadcast_rate_limit
+        self.env.cr.execute(
+            "UPDATE whatsapp_session SET broadcast_horizon = %s WHERE id = %s",
+            (start + interval * count, self.id),
+        )
+        self.invalidate_cache(["broadcast_horizon"])
+        return [start + interval * index for index in range(count)]
+
+    def _notify_broadcast_progress(self, broadcast):
+        self.ensure_one()
+        self.env["bus.bus"].sendone(
+            self._bus_channel(),
+            {"type": "broadcast_progress", "session_id": self.id, **broadcast.get_progress(failure_limit=0)},
+        )
+        metrics.inc("whatsapp_bus_notifications_total", type="broadcast_progress")
+
+    @instrumented("rpc")
     def send_message(self, chat_id, message):
-        """Send WhatsApp message"""
+        """Queue a WhatsApp message for the outbox dispatcher"""
         self.ensure_one()
 
         if self.state != "connected":
@@ -281,16 +1243,8 @@ class WhatsAppSession(models.Model):
                 }
             )
 
-            # In a real implementation, this would call a Node.js service that uses whatsapp-web.js
-            # For demonstration, we'll simulate message sending
-
-            # Simulate successful message send
-            msg.write(
-                {
-                    "state": "sent",
-                    "message_id": f"msg_{int(datetime.now().timestamp())}",
-                }
-            )
+            # The outbox cron delivers it to the bridge after this transaction
+            msg._trigger_outbox()
 
             return {
                 "success": True,
@@ -302,6 +1256,7 @@ class WhatsAppSession(models.Model):
             _logger.error("Error sending WhatsApp message: %s", e)
             raise UserError(_("Failed to send WhatsApp message: %s") % str(e))
 
+    @instrumented("rpc")
     def mark_messages_read(self, chat_id):
         """Mark all messages in a chat as read"""
         self.ensure_one()
@@ -309,21 +1264,370 @@ class WhatsAppSession(models.Model):
         if self.state != "connected":
             return False
 
-        try:
-            # Find all unread incoming messages for this chat
-            messages = self.env["whatsapp.message"].search(
-                [
-                    ("session_id", "=", self.id),
-                    ("chat_id", "=", chat_id),
-                    ("direction", "=", "incoming"),
-                    ("state", "!=", "read"),
-                ]
+        self.mark_chats_read([chat_id])
+        return True
+
+    @instrumented("rpc")
+    def mark_chats_read(self, chat_ids, up_to=None):
+        """Mark the unread incoming messages of ``chat_ids`` read with a
+        single UPDATE, however large the backlog.
+
+        ``up_to`` optionally maps chat ids to the id of one of their
+        messages: in those chats only messages up to it (included) are
+        marked. Unread counters are adjusted in the same transaction; the
+        chats are then queued for the read receipts cron, which tells the
+        bridge.
+
+        :return: ``{chat_id: number of messages marked read}``
+        """
+        self.ensure_one()
+
+        if self.state != "connected" or not chat_ids:
+            return {}
+
+        self.env["whatsapp.message"].flush(["session_id", "chat_id", "direction", "state", "date"])
+        self.env.cr.execute(
+            """
+            WITH target AS (
+                SELECT v.chat_id, ref.date, ref.id
+                  FROM unnest(%(chat_ids)s::varchar[]) AS v(chat_id)
+             LEFT JOIN whatsapp_message ref
+                    ON ref.id = (%(up_to)s::jsonb ->> v.chat_id)::integer
+                   AND ref.session_id = %(session)s AND ref.chat_id = v.chat_id
+                 WHERE %(up_to)s::jsonb ->> v.chat_id IS NULL OR ref.id IS NOT NULL
+            ), updated AS (
+                UPDATE whatsapp_message AS message
+                   SET state = 'read', write_uid = %(uid)s, write_date = now() at time zone 'UTC'
+                  FROM target
+                 WHERE message.session_id = %(session)s
+                   AND message.chat_id = target.chat_id
+                   AND message.direction = 'incoming'
+                   AND (message.state != 'read' OR message.state IS NULL)
+                   AND (target.id IS NULL OR (message.date, message.id) <= (target.date, target.id))
+             RETURNING message.chat_id
             )
+            SELECT chat_id, count(*) FROM updated GROUP BY chat_id
+            """,
+            {
+                "chat_ids": list(set(chat_ids)),
+                "up_to": json.dumps(up_to or {}),
+                "session": self.id,
+                "uid": self.env.uid,
+            },
+        )
+        counts = dict(self.env.cr.fetchall())
+        if not counts:
+            return {}
 
-            if messages:
-                messages.write({"state": "read"})
+        self.env["whatsapp.message"].invalidate_cache(["state", "write_uid", "write_date"])
+        self.env["whatsapp.chat"]._adjust_unread(
+            {(self.id, chat_id): -count for chat_id, count in counts.items()}
+        )
+        self._queue_read_receipts(list(counts))
+        return counts
 
-            return True
-        except Exception as e:
-            _logger.error("Error marking WhatsApp messages as read: %s", e)
-            return False
+    def _queue_read_receipts(self, chat_ids):
+        """Flag ``chat_ids`` for ``_cron_send_read_receipts``, so the bridge
+        call happens off the request, once per session for all the chats
+        marked read in the meantime
+        """
+        self.ensure_one()
+        if not self.session_id:
+            return
+        self.env["whatsapp.chat"].flush(["read_pending"])
+        self.env.cr.execute(
+            """
+            UPDATE whatsapp_chat SET read_pending = true
+             WHERE session_id = %s AND chat_id = ANY(%s) AND NOT read_pending
+            """,
+            (self.id, list(chat_ids)),
+        )
+        self.env["whatsapp.chat"].invalidate_cache(["read_pending"])
+        self.env.ref("whatsapp_integration.ir_cron_whatsapp_read").sudo()._trigger()
+
+    @instrumented("cron")
+    @api.model
+    def _cron_send_read_receipts(self, limit=5000, max_workers=8):
+        """Send the read receipts queued by ``mark_chats_read``.
+
+        Flags are claimed and cleared in a first transaction, so the chat
+        summaries are not kept locked while the bridges are called; the
+        chats of a call that failed are flagged again and retried a minute
+        later.
+        Only connected sessions on reachable bridges are picked.
+        """
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        self.env["whatsapp.chat"].flush(["read_pending"])
+        self.env.cr.execute(
+            """
+            UPDATE whatsapp_chat SET read_pending = false
+             WHERE id IN (SELECT chat.id
+                            FROM whatsapp_chat chat
+                            JOIN whatsapp_session s ON s.id = chat.session_id
+                           WHERE chat.read_pending AND s.state = 'connected'
+                             AND s.session_id IS NOT NULL
+                           LIMIT %s
+                             FOR UPDATE OF chat SKIP LOCKED)
+         RETURNING session_id, chat_id
+            """,
+            (limit,),
+        )
+        claimed = {}
+        for session_id, chat_id in self.env.cr.fetchall():
+            claimed.setdefault(session_id, []).append(chat_id)
+        self.env["whatsapp.chat"].invalidate_cache(["read_pending"])
+        if not claimed:
+            return
+        if auto_commit:
+            self.env.cr.commit()
+
+        sessions = self.browse(list(claimed))
+        calls = [(session._bridge(), session.session_id, sorted(claimed[session.id])) for session in sessions]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as executor:
+            failed = list(executor.map(lambda call: _send_reads(*call), calls))
+
+        retry = [
+            (session.id, chat_id)
+            for session, chat_ids in zip(sessions, failed)
+            for chat_id in chat_ids
+        ]
+        if retry:
+            execute_values(
+                self.env.cr._obj,
+                """
+                UPDATE whatsapp_chat AS chat SET read_pending = true
+                  FROM (VALUES %s) AS v(session_id, chat_id)
+                 WHERE chat.session_id = v.session_id AND chat.chat_id = v.chat_id
+                """,
+                retry,
+            )
+            self.env["whatsapp.chat"].invalidate_cache(["read_pending"])
+            self.env.ref("whatsapp_integration.ir_cron_whatsapp_read").sudo()._trigger(
+                fields.Datetime.now() + timedelta(minutes=1)
+            )
+        elif sum(len(chat_ids) for chat_ids in claimed.values()) == limit:
+            self.env.ref("whatsapp_integration.ir_cron_whatsapp_read").sudo()._trigger()
+
+    @api.model
+    def _find_media(self, pairs):
+        """Attachments of already stored media, ``{(session_id, checksum): attachment_id}``
+        for the given ``(session, checksum)`` pairs, in a single search
+        """
+        pairs = [(session, checksum) for session, checksum in pairs if session and checksum]
+        if not pairs:
+            return {}
+        attachments = self.env["ir.attachment"].sudo().search(
+            [
+                ("res_model", "=", self._name),
+                ("res_id", "in", list({session.id for session, _checksum in pairs})),
+                ("checksum", "in", list({checksum for _session, checksum in pairs})),
+            ]
+        )
+        return {(attachment.res_id, attachment.checksum): attachment.id for attachment in attachments}
+
+    @api.model
+    def _media_spool(self):
+        """Temporary file to stream an upload into. With file storage it is
+        created inside the filestore, so storing it is a rename.
+        """
+        Attachment = self.env["ir.attachment"]
+        directory = None
+        if Attachment._storage() != "db":
+            directory = Attachment._filestore()
+            os.makedirs(directory, exist_ok=True)
+        return tempfile.NamedTemporaryFile(prefix="whatsapp-upload-", dir=directory, delete=False)
+
+    def _store_media(self, path, checksum, mimetype=None, filename=None):
+        """Attach the uploaded file at ``path``, whose SHA-1 is ``checksum``,
+        to this session, storing every content only once.
+
+        With file storage the file is moved into the content-addressed
+        filestore as is, so it is never loaded in memory.
+        """
+        self.ensure_one()
+        existing = self._find_media([(self, checksum)]).get((self.id, checksum))
+        if existing:
+            return self.env["ir.attachment"].sudo().browse(existing)
+
+        Attachment = self.env["ir.attachment"].sudo()
+        vals = {
+            "name": filename or checksum,
+            "mimetype": mimetype or "application/octet-stream",
+            "res_model": self._name,
+            "res_id": self.id,
+            "type": "binary",
+        }
+        if Attachment._storage() == "db":
+            with open(path, "rb") as f:
+                vals["raw"] = f.read()
+        else:
+            store_fname = f"{checksum[:2]}/{checksum}"
+            full_path = Attachment._full_path(store_fname)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # Same name, same content: another upload may already have put it there
+            os.replace(path, full_path)
+            vals.update(
+                store_fname=store_fname,
+                file_size=os.path.getsize(full_path),
+                checksum=checksum,
+            )
+        return Attachment.create(vals)
+
+    @api.model
+    def _apply_webhook_events(self, session_events):
+        """Apply ``(session, event)`` pairs in bulk.
+
+        Incoming messages are created with a single ``create`` call, skipping
+        any ``message_id`` already stored for the session so retried events
+        are stored exactly once, and status updates are grouped by target
+        state, so the cost of a batch does not grow with its round trips.
+        """
+        results = [None] * len(session_events)
+        Message = self.env["whatsapp.message"]
+        message_states = dict(Message._fields["state"].selection)
+
+        message_events, status_events, connection_events = [], [], []
+        for index, (session, event) in enumerate(session_events):
+            event_type = event.get("type")
+            if not event_type:
+                results[index] = {"error": "Missing parameters"}
+            elif not session:
+                results[index] = {"error": "Session not found"}
+            elif event_type == "message":
+                message_data = event.get("message") or {}
+                if "chat_id" not in message_data or "content" not in message_data:
+                    results[index] = {"error": "Invalid message data"}
+                    continue
+                message_events.append((index, session, message_data))
+            elif event_type == "status_update":
+                status_data = event.get("status") or {}
+                if (
+                    not status_data.get("message_id")
+                    or status_data.get("status") not in message_states
+                ):
+                    results[index] = {"error": "Invalid status data"}
+                    continue
+                status_events.append((index, session, status_data))
+            elif event_type == "connection_update":
+                if event.get("status") not in dict(self._fields["state"].selection):
+                    results[index] = {"error": "Invalid connection status"}
+                    continue
+                connection_events.append((index, session, event))
+            else:
+                results[index] = {"error": "Unknown event type"}
+
+        if message_events:
+            self._create_incoming_messages(message_events, results)
+
+        if status_events:
+            self._apply_status_updates(status_events, results)
+
+        for index, session, event in connection_events:
+            if event.get("qr_code"):
+                session._set_qr_code(event["qr_code"])
+            session._set_connection_state(event["status"])
+            results[index] = {"success": True}
+
+        return results
+
+    def _create_incoming_messages(self, message_events, results):
+        """Bulk-create incoming messages, deduplicated on (session, message_id)"""
+        Message = self.env["whatsapp.message"]
+        session_ids = list({session.id for _index, session, _data in message_events})
+        message_ids = list(
+            {data["id"] for _index, _session, data in message_events if data.get("id")}
+        )
+        known = {}
+        if message_ids:
+            # Retried batches may redeliver messages archived since
+            Message.flush(["session_id", "message_id"])
+            self.env["whatsapp.message.archive"].flush(["session_id", "message_id"])
+            self.env.cr.execute(
+                """
+                SELECT session_id, message_id, id FROM whatsapp_message
+                 WHERE session_id IN %(sessions)s AND message_id IN %(ids)s
+             UNION ALL
+                SELECT session_id, message_id, message_ref FROM whatsapp_message_archive
+                 WHERE session_id IN %(sessions)s AND message_id IN %(ids)s
+                """,
+                {"sessions": tuple(session_ids), "ids": tuple(message_ids)},
+            )
+            known = {(session_id, message_id): ref for session_id, message_id, ref in self.env.cr.fetchall()}
+
+        attachments = self._find_media(
+            [
+                (session, data["media"].get("checksum"))
+                for _index, session, data in message_events
+                if isinstance(data.get("media"), dict)
+            ]
+        )
+
+        vals_list, pending, names = [], {}, {}
+        for index, session, data in message_events:
+            if data.get("contact_name"):
+                names[(session.id, data["chat_id"])] = data["contact_name"]
+            key = (session.id, data.get("id"))
+            if data.get("id") and key in known:
+                results[index] = {"success": True, "id": known[key], "duplicate": True}
+                continue
+            if data.get("id") and key in pending:
+                # Same message twice in one batch: store it once
+                pending[key].append(index)
+                continue
+            pending[key if data.get("id") else ("new", index)] = [index]
+            vals = {
+                "session_id": session.id,
+                "chat_id": data["chat_id"],
+                "message_id": data.get("id"),
+                "content": data["content"],
+                "direction": "incoming",
+                "state": "delivered",
+                "message_type": MEDIA_TYPES.get(data.get("type"), "document" if data.get("media") else "text"),
+                "attachment_id": attachments.get(
+                    (session.id, (data.get("media") or {}).get("checksum"))
+                ),
+            }
+            if data.get("timestamp"):
+                # When the phone received it, not when the batch reached us
+                vals["date"] = datetime.utcfromtimestamp(data["timestamp"])
+            vals_list.append(vals)
+
+        messages = Message.create(vals_list)
+        self.env["whatsapp.contact"]._upsert_names(names)
+        for indexes, message in zip(pending.values(), messages):
+            for position, index in enumerate(indexes):
+                results[index] = {"success": True, "id": message.id}
+                if position:
+                    results[index]["duplicate"] = True
+
+        self._queue_chat_notification(
+            [(message.session_id.id, message.chat_id) for message in messages], messages
+        )
+
+    def _apply_status_updates(self, status_events, results):
+        """Write acks with one search and one write per target state"""
+        Message = self.env["whatsapp.message"]
+        session_ids = list({session.id for _index, session, _data in status_events})
+        message_ids = list({data["message_id"] for _index, _session, data in status_events})
+        existing = {
+            (message.session_id.id, message.message_id): message
+            for message in Message.search(
+                [("session_id", "in", session_ids), ("message_id", "in", message_ids)]
+            )
+        }
+
+        # Later events win when the same message is acked several times
+        latest = {}
+        for index, session, data in status_events:
+            message = existing.get((session.id, data["message_id"]))
+            if not message:
+                results[index] = {"error": "Message not found"}
+                continue
+            latest[message.id] = data["status"]
+            results[index] = {"success": True, "id": message.id}
+
+        by_state = {}
+        for message_id, state in latest.items():
+            by_state.setdefault(state, []).append(message_id)
+        for state, ids in by_state.items():
+            Message.browse(ids).write({"state": state})
@@ -0,0 +1,103 @@
+from odoo import api, fields, models, tools, _
+from psycopg2.extras import execute_values
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class WhatsAppSessionUptime(models.Model):
+    """Connection history of WhatsApp sessions: one row per period a session
+    spent in a state, the current one being open (no end date).
+    """
+
+    _name = "whatsapp.session.uptime"
+    _description = "WhatsApp Session Uptime"
+    _order = "date_start desc, id desc"
+    _log_access = False
+
+    session_id = fields.Many2one(
+        "whatsapp.session", string="Session", required=True, readonly=True, ondelete="cascade"
+    )
+    state = fields.Selection(
+        [
+            ("disconnected", "Disconnected"),
+            ("connecting", "Connecting"),
+            ("connected", "Connected"),
+        ],
+        string="Status",
+        required=True,
+        readonly=True,
+    )
+    date_start = fields.Datetime(string="From", required=True, readonly=True)
+    date_end = fields.Datetime(string="Until", readonly=True)
+    duration = fields.Float(string="Duration (Hours)", compute="_compute_duration")
+
+    def init(self):
+        tools.create_index(
+            self._cr, "whatsapp_session_uptime_session_date_index",
+            self._table, ["session_id", "date_start"],
+        )
+        # The open period of each session, closed on every transition
+        self._cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS whatsapp_session_uptime_open_index
+                ON whatsapp_session_uptime (session_id)
+             WHERE date_end IS NULL
+        """)
+
+    @api.depends("date_start", "date_end")
+    def _compute_duration(self):
+        now = fields.Datetime.now()
+        for period in self:
+            period.duration = ((period.date_end or now) - period.date_start).total_seconds() / 3600
+
+    @api.model
+    def _record_transitions(self, states, at=None):
+        """Close the open period of the sessions of ``states``
+        (``{session_id: new state}``) and open one in their new state
+        """
+        if not states:
+            return
+        at = at or fields.Datetime.now()
+        self.flush()
+        self.env.cr.execute(
+            """
+            UPDATE whatsapp_session_uptime
+               SET date_end = GREATEST(%s, date_start)
+             WHERE session_id IN %s AND date_end IS NULL
+            """,
+            (at, tuple(states)),
+        )
+        execute_values(
+            self.env.cr._obj,
+            "INSERT INTO whatsapp_session_uptime (session_id, state, date_start) VALUES %s",
+            [(session_id, state, at) for session_id, state in states.items()],
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def get_uptime(self, session_ids, date_from, date_to):
+        """Share of ``[date_from, date_to)`` each session spent connected,
+        ``{session_id: ratio}``
+        """
+        sessions = self.env["whatsapp.session"].browse(session_ids).exists()
+        date_from = fields.Datetime.to_datetime(date_from)
+        date_to = fields.Datetime.to_datetime(date_to)
+        if not sessions or date_to <= date_from:
+            return {}
+        sessions.check_access_rule("read")
+        self.flush()
+        self.env.cr.execute(
+            """
+            SELECT session_id,
+                   sum(extract(epoch FROM LEAST(coalesce(date_end, now() at time zone 'UTC'), %(to)s)
+                                          - GREATEST(date_start, %(from)s)))
+              FROM whatsapp_session_uptime
+             WHERE session_id IN %(sessions)s AND state = 'connected'
+               AND date_start < %(to)s AND (date_end IS NULL OR date_end > %(from)s)
+          GROUP BY session_id
+            """,
+            {"sessions": tuple(sessions.ids), "from": date_from, "to": date_to},
+        )
+        connected = dict(self.env.cr.fetchall())
+        total = (date_to - date_from).total_seconds()
+        return {session_id: max(connected.get(session_id) or 0, 0) / total for session_id in sessions.ids}